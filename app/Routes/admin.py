@@ -0,0 +1,106 @@
+from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from ..wrappers import admin_required
+from ..extensions import logger
+from ..analytics import (category_demand, category_prices, farmer_activity, refresh_status, refreshed_at,
+                         top_products)
+
+admin = Blueprint('admin', __name__)
+
+MAX_LIMIT = 100
+MAX_MONTHS = 36
+
+def analytics_response(view_name, rows):
+    return jsonify({
+        "refreshed_at": refreshed_at(view_name),
+        "data": rows
+    }), 200
+
+def analytics_error(name, error):
+    if isinstance(error, ProgrammingError):
+        # the views don't exist yet on a database created before them
+        logger.error(f"analytics views missing in {name}: {str(error)}")
+        return jsonify({"error": "analytics are not available yet, run flask analytics refresh"}), 503
+    if isinstance(error, OperationalError):
+        logger.error(f"analytics query timed out in {name}: {str(error)}")
+        return jsonify({"error": "analytics query timed out"}), 503
+    logger.error(f"Error in {name}: {str(error)}", exc_info=True)
+    return jsonify({"error": "internal server error"}), 500
+
+@admin.route('/api/admin/analytics/top-products', methods=['GET'])
+@admin_required
+def get_top_products():
+    """
+    best selling products, by revenue (default) or units_sold, optionally in one category
+    """
+    try:
+        limit = request.args.get('limit', 20, type=int)
+        if limit < 1 or limit > MAX_LIMIT:
+            return jsonify({"error": f"limit must be between 1 and {MAX_LIMIT}"}), 400
+        
+        order_by = request.args.get('order_by', 'revenue')
+        if order_by not in ('revenue', 'units_sold'):
+            return jsonify({"error": "order_by must be revenue or units_sold"}), 400
+        
+        rows = top_products(limit, request.args.get('category'), order_by)
+        return analytics_response('analytics_product_sales', rows)
+        
+    except Exception as e:
+        return analytics_error('get_top_products', e)
+
+@admin.route('/api/admin/analytics/category-demand', methods=['GET'])
+@admin_required
+def get_category_demand():
+    """
+    units, revenue, orders and buyers per category and month
+    """
+    try:
+        months = request.args.get('months', 12, type=int)
+        if months < 1 or months > MAX_MONTHS:
+            return jsonify({"error": f"months must be between 1 and {MAX_MONTHS}"}), 400
+        
+        rows = category_demand(months, request.args.get('category'))
+        return analytics_response('analytics_category_demand', rows)
+        
+    except Exception as e:
+        return analytics_error('get_category_demand', e)
+
+@admin.route('/api/admin/analytics/category-prices', methods=['GET'])
+@admin_required
+def get_category_prices():
+    """
+    listing counts and listed and sold prices per category
+    """
+    try:
+        return analytics_response('analytics_category_prices', category_prices())
+        
+    except Exception as e:
+        return analytics_error('get_category_prices', e)
+
+@admin.route('/api/admin/analytics/active-farmers', methods=['GET'])
+@admin_required
+def get_active_farmers():
+    """
+    farmers with orders (and with deliveries) per month
+    """
+    try:
+        months = request.args.get('months', 12, type=int)
+        if months < 1 or months > MAX_MONTHS:
+            return jsonify({"error": f"months must be between 1 and {MAX_MONTHS}"}), 400
+        
+        return analytics_response('analytics_farmer_activity', farmer_activity(months))
+        
+    except Exception as e:
+        return analytics_error('get_active_farmers', e)
+
+@admin.route('/api/admin/analytics/status', methods=['GET'])
+@admin_required
+def get_analytics_status():
+    """
+    when each analytics view was last refreshed
+    """
+    try:
+        return jsonify({"views": refresh_status()}), 200
+        
+    except Exception as e:
+        return analytics_error('get_analytics_status', e)
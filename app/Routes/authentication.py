@@ -20,6 +20,7 @@ from itsdangerous import URLSafeTimedSerializer
 from flask_mail import Message
 from ..extensions import mail
 from ..wrappers import login_is_required
+from ..passwords import PasswordHasherBusy
 import re
 from sqlalchemy.exc import SQLAlchemyError
 import logging
@@ -72,6 +73,25 @@ def validate_password(password):
         return False
     return True
 
+def hashing_busy():
+    response = jsonify({"error": "too many logins in progress, try again shortly"})
+    response.headers['Retry-After'] = str(PasswordHasherBusy.retry_after)
+    return response, 503
+
+def upgrade_password_hash(user, password):
+    """
+    store the password with the current work factor if it was hashed with an older one
+    a busy hashing pool or a failed write keeps the old hash until the next login
+    """
+    try:
+        if user.rehash_password_if_outdated(password):
+            db.session.commit()
+    except PasswordHasherBusy:
+        pass
+    except SQLAlchemyError as e:
+        logger.error(f"failed to store rehashed password: {str(e)}")
+        db.session.rollback()
+
 def validate_phone_number(phone_number):
     if not re.search(r"\d{10}$", phone_number):
         return False
@@ -134,6 +154,9 @@ def signup_farmer():
             })
             return response, 201
         
+        except PasswordHasherBusy:
+            return hashing_busy()
+            
         except SQLAlchemyError as e:
             logger.error(f"database error: {str(e)}")
             db.session.rollback()
@@ -206,6 +229,9 @@ def signup_buyer():
             
             return response, 201
         
+        except PasswordHasherBusy:
+            return hashing_busy()
+            
         except SQLAlchemyError as e:
             logger.error(f"database error: {str(e)}")
             db.session.rollback()
@@ -238,6 +264,8 @@ def login_farmer():
             if not farmer or not farmer.check_password(password):
                 return jsonify({"error": "invalid login credentials"}),401
             
+            upgrade_password_hash(farmer, password)
+            
             identity = {
                 'id': farmer.id,
                 'role': 'farmer'
@@ -263,6 +291,9 @@ def login_farmer():
             
             return response, 200
         
+        except PasswordHasherBusy:
+            return hashing_busy()
+            
         except SQLAlchemyError as e:
             logger.error(f"database error: {str(e)}")
             return jsonify({
@@ -301,6 +332,8 @@ def login_buyer():
             if not buyer or not buyer.check_password(password):
                 return jsonify({"error": "invalid login credentials"}), 401
             
+            upgrade_password_hash(buyer, password)
+            
             identity = {
                 'id': buyer.id,
                 'role': 'farmer'
@@ -326,6 +359,9 @@ def login_buyer():
             
             return response, 200
         
+        except PasswordHasherBusy:
+            return hashing_busy()
+            
         except SQLAlchemyError as e:
             logger.error(f"database error: {str(e)}")
             return jsonify({
@@ -411,6 +447,9 @@ def change_password():
                 "error": str(e)
             }), 400
             
+    except PasswordHasherBusy:
+        return hashing_busy()
+        
     except Exception as e:
         logger.error(f"endpoint error: {str(e)}")
         return jsonify({
@@ -552,7 +591,7 @@ def reset_password(token):
                             "message": "failed to reset farmer password",
                             "error": str(e)
                         }), 400
-            except:
+            except SQLAlchemyError:
                 return jsonify({"error": "user does not exist"}), 404
         
         if buyer:
@@ -573,6 +612,9 @@ def reset_password(token):
                     "error": str(e)
                 })
                 
+    except PasswordHasherBusy:
+        return hashing_busy()
+        
     except Exception as e:
         logger.error(f"endpoint error: {str(e)}")
         return jsonify({
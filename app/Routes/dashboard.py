@@ -1,10 +1,11 @@
-from flask import Blueprint, jsonify
-from sqlalchemy import func
-from datetime import datetime
-from ..models import db, Order, Product, FarmerOrder, OrderItem
+from flask import Blueprint, jsonify, request
 import logging
 from..wrappers import farmer_required
 from ..extensions import get_current_user_id
+from ..farmer_stats import load_dashboard_stats
+from ..recent_orders import FEED_SIZE, recent_orders
+from ..sales_series import parse_series_args, sales_series
+from ..dashboard_bundle import available_products, get_dashboard_bundle, parse_sections, server_timing
 
 dashboard = Blueprint('dashboard', __name__)
 
@@ -17,41 +18,8 @@ def get_dashboard_stats():
     try:
         current_user_id = get_current_user_id()
         
-        # Calculate start of current month
-        today = datetime.utcnow()
-        start_of_month = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        # Get total products sold (sum of quantities from order items)
-        products_sold = db.session.query(func.sum(OrderItem.quantity)).join(Order).filter(
-            FarmerOrder.farmer_id == current_user_id,
-            FarmerOrder.status == 'delivered'
-        ).scalar() or 0
-        
-        # Get current month revenue
-        current_month_revenue = db.session.query(func.sum(Order.total_amount)).filter(
-            FarmerOrder.farmer_id == current_user_id,
-            FarmerOrder.status == 'delivered',
-            FarmerOrder.created_at >= start_of_month
-        ).scalar() or 0
-        
-        # Get pending orders count
-        pending_orders = FarmerOrder.query.filter_by(
-            farmer_id=current_user_id,
-            status='pending'
-        ).count()
-        
-        # Get active listings count
-        active_listings = Product.query.filter_by(
-            farmer_id=current_user_id,
-            status='available'
-        ).count()
-        
-        return jsonify({
-            "products_sold": float(products_sold),
-            "current_month_revenue": float(current_month_revenue or 0),
-            "pending_orders": pending_orders,
-            "active_listings": active_listings
-        }), 200
+        # one primary key read of the rollup kept by app.farmer_stats
+        return jsonify(load_dashboard_stats(current_user_id)), 200
         
     except Exception as e:
         logger.error(f"Error in get_dashboard_stats: {str(e)}", exc_info=True)
@@ -64,47 +32,66 @@ def get_recent_orders():
     try:
         current_user_id = get_current_user_id()
         
-        recent_orders = FarmerOrder.query.filter_by(farmer_id=current_user_id)\
-            .order_by(Order.created_at.desc())\
-            .limit(5)\
-            .all()
-        
-        orders_data = [{
-            'order_id': order.id,
-            'order_date': order.created_at.isoformat(),
-            'total_amount': float(order.total_amount),
-            'status': order.status,
-            'buyer_name': order.buyer.full_name if order.buyer else "Unknown"
-        } for order in recent_orders]
+        limit = request.args.get('limit', 5, type=int)
+        if limit < 1 or limit > FEED_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {FEED_SIZE}"}), 400
         
-        return jsonify(orders_data), 200
+        # served from the farmer's redis feed, rebuilt from farmer_orders when cold
+        return jsonify(recent_orders(current_user_id, limit)), 200
         
     except Exception as e:
         logger.error(f"Error in get_recent_orders: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
+@dashboard.route('/api/dashboard/sales', methods=['GET'])
+@farmer_required
+def get_sales_series():
+    try:
+        current_user_id = get_current_user_id()
+        
+        try:
+            interval, group, start_date, end_date, window = parse_series_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        return jsonify(sales_series(current_user_id, interval, group, start_date, end_date, window)), 200
+        
+    except Exception as e:
+        logger.error(f"Error in get_sales_series: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
 @dashboard.route('/api/dashboard/available-products', methods=['GET'])
 @farmer_required
 def get_available_products():
     try:
         current_user_id = get_current_user_id()
         
-        products = Product.query.filter_by(
-            farmer_id=current_user_id,
-            status='available'
-        ).all()
+        return jsonify(available_products(current_user_id)), 200
+        
+    except Exception as e:
+        logger.error(f"Error in get_available_products: {str(e)}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+@dashboard.route('/api/dashboard/bundle', methods=['GET'])
+@farmer_required
+def get_dashboard_bundle_sections():
+    try:
+        current_user_id = get_current_user_id()
+        
+        try:
+            sections = parse_sections(request.args.get('sections'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        products_data = [{
-            'id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'amount_available': float(product.amount_available),
-            'price_per_unit': float(product.price_per_unit),
-            'category': product.category
-        } for product in products]
+        limit = request.args.get('limit', 5, type=int)
+        if limit < 1 or limit > FEED_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {FEED_SIZE}"}), 400
         
-        return jsonify(products_data), 200
+        bundle = get_dashboard_bundle().load(current_user_id, sections, limit)
+        response = jsonify(bundle)
+        response.headers['Server-Timing'] = server_timing(bundle['timings'])
+        return response, 200
         
     except Exception as e:
-        logger.error(f"Error in get_available_products: {str(e)}", exc_info=True)
+        logger.error(f"Error in get_dashboard_bundle_sections: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
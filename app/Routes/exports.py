@@ -0,0 +1,205 @@
+"""
+order exports
+
+csv or ndjson downloads of a farmer's or a buyer's order lines, one row per
+order item. rows are read through a server-side cursor in fixed size batches
+and written straight into the response as they arrive, so an export of years
+of orders uses as much memory as one batch.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from sqlalchemy import literal, select
+
+from ..models import db, Buyer, Farmer, Order, FarmerOrder, OrderItem, Product, order_status_enum
+from ..wrappers import buyer_required, farmer_required
+from ..extensions import logger, get_current_user_id
+
+exports = Blueprint('exports', __name__)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+# rows fetched from the server-side cursor per round trip
+YIELD_PER = 1000
+
+
+def parse_export_args():
+    """
+    read the export format and filters from the query string
+    raises ValueError with a message for the client on bad input
+    """
+    export_format = request.args.get('format', 'csv', type=str).strip().lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    status = request.args.get('status', '', type=str).strip().lower()
+    if status and status not in order_status_enum.enums:
+        raise ValueError(f"invalid status: {status}")
+
+    try:
+        start_date = date.fromisoformat(request.args['start_date']) if request.args.get('start_date') else None
+        end_date = date.fromisoformat(request.args['end_date']) if request.args.get('end_date') else None
+    except ValueError:
+        raise ValueError("dates must be formatted as YYYY-MM-DD")
+
+    return export_format, status, start_date, end_date
+
+
+def apply_export_filters(statement, status: str, start_date: date, end_date: date):
+    """
+    narrow an order line statement to a farmer order status and an order date range
+    """
+    if status:
+        statement = statement.where(FarmerOrder.status == status)
+    if start_date:
+        # line items are never older than their order, so this skips older order_items partitions
+        statement = statement.where(Order.created_at >= start_date, OrderItem.created_at >= start_date)
+    if end_date:
+        # line items carry their order's created_at, so this skips newer partitions
+        end = end_date + timedelta(days=1)
+        statement = statement.where(Order.created_at < end, OrderItem.created_at < end)
+    return statement
+
+
+def _export_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_rows(statement, export_format: str):
+    """
+    generate the export body chunk by chunk, one chunk per cursor batch
+    """
+    try:
+        result = db.session.execute(statement.execution_options(yield_per=YIELD_PER))
+        columns = list(result.keys())
+
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for partition in result.partitions():
+                writer.writerows([[_export_value(value) for value in row] for row in partition])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for partition in result.partitions():
+                yield ''.join(
+                    json.dumps({column: _export_value(value) for column, value in zip(columns, row)}) + '\n'
+                    for row in partition
+                )
+
+    except Exception as e:
+        # the status line is already sent, so all we can do is log and cut the body short
+        logger.error(f"export failed mid-stream: {str(e)}")
+        raise
+
+
+def export_response(statement, export_format: str, name: str):
+    filename = f"{name}-{date.today().isoformat()}.{export_format}"
+    return Response(
+        stream_with_context(stream_rows(statement, export_format)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+@exports.route('/api/v1/farmer/orders/export', methods=['GET'])
+@farmer_required
+def export_farmer_orders():
+    """
+    stream the current farmer's order lines as csv (default) or ndjson
+
+    ``status`` filters on the farmer order status and ``start_date`` /
+    ``end_date`` (YYYY-MM-DD, inclusive) on the order date
+    """
+    try:
+        export_format, status, start_date, end_date = parse_export_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        statement = select(
+                Order.id.label('order_id'),
+                Order.created_at.label('order_date'),
+                Order.delivery_date,
+                (Buyer.first_name + literal(' ') + Buyer.last_name).label('buyer_name'),
+                FarmerOrder.status,
+                FarmerOrder.subtotal_amount.label('farmer_order_subtotal'),
+                OrderItem.product_id,
+                Product.name.label('product_name'),
+                OrderItem.quantity,
+                OrderItem.price_per_unit,
+                (OrderItem.quantity * OrderItem.price_per_unit).label('subtotal')
+            )\
+            .select_from(OrderItem)\
+            .join(FarmerOrder, FarmerOrder.id == OrderItem.farmer_order_id)\
+            .join(Order, Order.id == OrderItem.order_id)\
+            .join(Product, Product.id == OrderItem.product_id)\
+            .outerjoin(Buyer, Buyer.id == Order.buyer_id)\
+            .where(FarmerOrder.farmer_id == get_current_user_id())\
+            .order_by(Order.created_at, OrderItem.id)
+
+        statement = apply_export_filters(statement, status, start_date, end_date)
+        return export_response(statement, export_format, 'farmer-orders')
+
+    except Exception as e:
+        logger.error(f"error exporting farmer orders: {str(e)}")
+        return jsonify({"error": "internal server error"}), 500
+
+
+@exports.route('/api/v1/orders/export', methods=['GET'])
+@buyer_required
+def export_buyer_orders():
+    """
+    stream the current buyer's order lines as csv (default) or ndjson
+
+    ``status`` filters on the status of the farmer order each line belongs to
+    and ``start_date`` / ``end_date`` (YYYY-MM-DD, inclusive) on the order date
+    """
+    try:
+        export_format, status, start_date, end_date = parse_export_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        statement = select(
+                Order.id.label('order_id'),
+                Order.created_at.label('order_date'),
+                Order.delivery_date,
+                Order.status.label('order_status'),
+                Order.total_amount.label('order_total'),
+                FarmerOrder.status,
+                (Farmer.first_name + literal(' ') + Farmer.last_name).label('farmer_name'),
+                OrderItem.product_id,
+                Product.name.label('product_name'),
+                OrderItem.quantity,
+                OrderItem.price_per_unit,
+                (OrderItem.quantity * OrderItem.price_per_unit).label('subtotal')
+            )\
+            .select_from(OrderItem)\
+            .join(Order, Order.id == OrderItem.order_id)\
+            .join(FarmerOrder, FarmerOrder.id == OrderItem.farmer_order_id)\
+            .join(Product, Product.id == OrderItem.product_id)\
+            .outerjoin(Farmer, Farmer.id == FarmerOrder.farmer_id)\
+            .where(Order.buyer_id == get_current_user_id())\
+            .order_by(Order.created_at, OrderItem.id)
+
+        statement = apply_export_filters(statement, status, start_date, end_date)
+        return export_response(statement, export_format, 'orders')
+
+    except Exception as e:
+        logger.error(f"error exporting orders: {str(e)}")
+        return jsonify({"error": "internal server error"}), 500
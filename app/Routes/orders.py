@@ -1,25 +1,44 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, url_for
+from datetime import date, timedelta
 from ..models import (db,
                       Buyer,
                       Order,
                       Product,
                       FarmerOrder,
                       OrderItem,
-                      Farmer)
-from decimal import Decimal
+                      order_status_enum)
 from ..wrappers import buyer_required, farmer_required
 from ..extensions import logger, get_current_user_id
+from ..caching import invalidate_product_listings
+from ..loading import ORDER_DETAIL
+from ..checkout import parse_cart, place_order, CheckoutError
+from ..idempotency import idempotent
+from ..order_queue import enqueue_order, get_job
+from ..order_summaries import load_order_history, HISTORY_SORT
+from ..pagination import decode_cursor, keyset_page
+from ..transitions import TRANSITIONS, transition_farmer_orders
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.exc import SQLAlchemyError
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 orders = Blueprint('orders', __name__)
 
+MAX_PER_PAGE = 100
+MAX_TRANSITION_BATCH = 1000
+
 @orders.route('/api/v1/orders', methods=['GET'])
 @jwt_required()
 def get_orders():
     """
     fetch all orders for the current buyer
 
+    orders are served from their denormalized summaries, newest first, so a
+    page is one indexed query (plus the count) however many items the
+    orders hold.
+    passing ``cursor`` (empty for the first page) switches to keyset
+    pagination and the response carries ``next_cursor`` instead of page counts.
+
     Returns:
         Response: JSON response containing the list of orders and pagination details.
     """
@@ -30,36 +49,18 @@ def get_orders():
         # set up pagination
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 8, type=int)
+        cursor = request.args.get('cursor', type=str)
         
-        #fetch the orders and include pagination
-        orders_query = Order.query.filter_by(buyer_id=buyer_id)
-        pagination = orders_query.paginate(page=page, per_page=per_page)
-        orders = pagination.items
+        if page <= 0 or per_page <= 0:
+            return jsonify({"error": "page and per page must be greater than 0"}), 400
         
-        order_list = [{
-            "id": order.id,
-            "total_amount": float(order.total_amount),
-            "order_date": order.created_at.isoformat(),
-            "delivery_date": order.delivery_date.isoformat() if order.delivery_date else None,
-            "status": order.status,
-            "items": [{
-                "product_id": item.product.id,
-                "product_name": item.product.name,
-                "quantity": item.quantity,
-                "price_per_unit": float(item.price_per_unit),
-                "subtotal": float(item.quantity * item.price_per_unit),  # Calculate subtotal directly
-                "farmer_name": item.product.farmer.full_name if item.product.farmer else None
-            } for item in order.order_items]
-        } for order in orders]
-        
-        response = jsonify({
-            "orders": order_list,
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "total_pages": pagination.pages,
-            "total_items": pagination.total
-        })
+        if cursor:
+            try:
+                decode_cursor(cursor, HISTORY_SORT)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
         
+        response = jsonify(load_order_history(buyer_id, page, per_page, cursor=cursor))
         return response, 200
     
     except Exception as e:
@@ -70,13 +71,20 @@ def get_orders():
         }), 500
 
 @orders.route('/api/v1/orders/create', methods=['POST'])
-@jwt_required()    
+@jwt_required()
+@idempotent()
 def make_order():
     """
     Create a new order for the current buyer.
 
     The function expects a JSON payload with order items, validates the data, 
     and creates an order along with associated farmer orders and order items.
+    All products in the cart are loaded and locked in one query and the order
+    rows are inserted in bulk, so the number of round trips doesn't grow with
+    the size of the cart.
+    
+    Retries carrying the same Idempotency-Key header get the original response
+    back instead of placing the order again.
 
     Returns:
         Response: JSON response with success message or error details.
@@ -88,98 +96,104 @@ def make_order():
             return jsonify({"error": "invalid request"}), 400
         
         try:
-            new_order = Order(buyer_id=buyer_id.get('id'), total_amount=0, status='pending')
-            db.session.add(new_order)
-            db.session.flush()
-        except SQLAlchemyError as e:
-            logger.error(f"database error, trying to initialize order: {str(e)}")
-            db.session.rollback()
-            return jsonify({
-                "message": "failed to initialize order",
-                "error": str(e)
-            }), 400
-            
-        farmer_orders = {}
-        total_amount = Decimal('0')
-        
-        try:
-            for item in data['items']:
-                product_id = item.get('product_id')
-                quantity = item.get('quantity', 0)
-                
-                product = Product.query.get_or_404(product_id)
-                if quantity <= 0:
-                    return jsonify({"error": "quantity must be greater than zero"}), 400
-                
-                if quantity > product.amount_available:
-                    return jsonify({"message": f"only {product.amount_available} is available"}), 400
-                
-                farmer_order =farmer_orders.get(product.farmer_id)
-                if not farmer_order:
-                    try:
-                        farmer_order = FarmerOrder(
-                        order_id=new_order.id,
-                        farmer_id=product.farmer_id,
-                        subtotal_amount=0
-                        )
-                        db.session.add(farmer_order)
-                        db.session.flush()
-                    except SQLAlchemyError as e:
-                        logger.error(f"failed to create farmer order: {str(e)}")
-                        db.session.rollback()
-                        return jsonify({
-                            "message": "failed to create farmer order",
-                            "error": str(e)
-                        })
-                    
-                    farmer_orders[product.farmer_id] = farmer_order
-                    
-                try:
-                    order_item = OrderItem(
-                        order_id=new_order.id,
-                        farmer_order_id=farmer_order.id,
-                        product_id=product.id,
-                        quantity=quantity,
-                        price_per_unit=product.price_per_unit
-                    )
-                    db.session.add(order_item)
-                    
-                    product.amount_available -= quantity
-                    item_total = Decimal(quantity) * product.price_per_unit
-                    total_amount += item_total
-                    farmer_order.subtotal_amount += item_total
-                except SQLAlchemyError as e:
-                    logger.error(f"failed to additems to the order: {str(e)}")
-                    db.session.rollback()
-                    return jsonify({
-                        "message": "Failed to add order items",
-                        "error": str(e)
-                    }), 400
-                    
-            new_order.total_amount = total_amount
+            cart = parse_cart(data['items'])
+            new_order, categories = place_order(buyer_id.get('id'), cart)
             db.session.commit()
             
-            response = jsonify({
-                "success": True,
-                "message": "order created successfully"
-            })
-            return response, 201
-        
+        except CheckoutError as e:
+            db.session.rollback()
+            return jsonify(e.payload), e.status
+            
         except SQLAlchemyError as e:
+            # a 5xx, so the idempotency layer doesn't replay a transient failure
             logger.error(f"database error: {str(e)}")
             db.session.rollback()
             return jsonify({
                 "message": "failed to create order",
                 "error": str(e)
-            }), 400
+            }), 503
+        
+        # stock levels changed, so the catalog pages showing them are stale
+        invalidate_product_listings(categories)
+        
+        response = jsonify({
+            "success": True,
+            "message": "order created successfully",
+            "order_id": new_order.id
+        })
+        return response, 201
             
     except Exception as e:
         logger.error(f"endpoint error: {str(e)}")
+        db.session.rollback()
         return jsonify({
             "message": "internal server error",
             "error": str(e)
         }), 500
         
+@orders.route('/api/v1/orders/async', methods=['POST'])
+@jwt_required()
+@idempotent()
+def make_order_async():
+    """
+    Queue an order for the current buyer and return immediately.
+
+    Only the shape of the cart is validated here; stock checks and the order
+    writes happen in the order workers. Responds with 202 and a handle whose
+    status can be polled at /api/v1/orders/status/<handle>.
+    """
+    try:
+        buyer_id = get_jwt_identity()
+        data = request.get_json()
+        if not data or 'items' not in data:
+            return jsonify({"error": "invalid request"}), 400
+        
+        try:
+            cart = parse_cart(data['items'])
+        except CheckoutError as e:
+            return jsonify(e.payload), e.status
+        
+        handle = enqueue_order(buyer_id.get('id'), cart)
+        status_url = url_for('orders.get_order_status', handle=handle)
+        
+        response = jsonify({
+            "success": True,
+            "message": "order queued",
+            "handle": handle,
+            "status": "pending",
+            "status_url": status_url
+        })
+        response.headers['Location'] = status_url
+        return response, 202
+    
+    except Exception as e:
+        logger.error(f"endpoint error: {str(e)}")
+        return jsonify({
+            "message": "failed to queue order",
+            "error": str(e)
+        }), 500
+
+@orders.route('/api/v1/orders/status/<string:handle>', methods=['GET'])
+@jwt_required()
+def get_order_status(handle):
+    """
+    report whether a queued order is pending, placed, rejected or failed
+    (failed orders carry ``retryable`` and can be submitted again)
+
+    Args:
+        handle (string): handle returned when the order was queued
+    """
+    try:
+        buyer_id = get_current_user_id()
+        job = get_job(handle)
+        if not job or job.get('buyer_id') != buyer_id:
+            return jsonify({"error": "order handle not found"}), 404
+        
+        return jsonify(job), 200
+    
+    except Exception as e:
+        logger.error(f"endpoint error: {str(e)}")
+        return jsonify({"error": "internal server error"}), 500
 
 @orders.route('/api/v1/orders/<int:order_id>', methods=['GET'])
 @buyer_required
@@ -198,7 +212,7 @@ def get_order_details(order_id):
             logger.error(f"buyer not found: {user_id}")
             return jsonify({"error": "buyer not found"}), 404
         
-        order = Order.query.get(order_id)
+        order = Order.query.options(*ORDER_DETAIL).get(order_id)
         if not order:
             logger.error(f"order not found: {order_id}")
             return jsonify({"error": "order not found"}), 404
@@ -217,7 +231,7 @@ def get_order_details(order_id):
         }
         
         for item in order.order_items:
-            product = item.product,
+            product = item.product
             sub_total = float(item.quantity * item.price_per_unit)
             
             item_detail = {
@@ -236,51 +250,160 @@ def get_order_details(order_id):
         logger.error(f"Error fetching order details: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
     
+FARMER_INBOX_SORT = (FarmerOrder.created_at, FarmerOrder.id)
+
+def load_farmer_orders_page(farmer_id: int, per_page: int, cursor: str = None, status: str = None,
+                            start_date: date = None, end_date: date = None) -> dict:
+    """
+    one page of a farmer's orders, newest first, fetched with a single query
+
+    the parent order, buyer name and the farmer's line items (aggregated to
+    json in the database) come back as plain columns, so nothing is loaded
+    lazily and memory stays bounded by the page size
+    """
+    item = func.json_build_object(
+        'product_id', OrderItem.product_id,
+        'product_name', Product.name,
+        'quantity', OrderItem.quantity,
+        'price_per_unit', OrderItem.price_per_unit,
+        'subtotal', OrderItem.quantity * OrderItem.price_per_unit
+    )
+    items = select(func.coalesce(func.json_agg(aggregate_order_by(item, OrderItem.id)), func.json_build_array()))\
+        .select_from(OrderItem)\
+        .join(Product, Product.id == OrderItem.product_id)\
+        .where(OrderItem.farmer_order_id == FarmerOrder.id, OrderItem.created_at >= FarmerOrder.created_at)\
+        .scalar_subquery()
+    
+    query = db.session.query(
+            FarmerOrder.id,
+            FarmerOrder.created_at,
+            FarmerOrder.order_id,
+            FarmerOrder.status,
+            FarmerOrder.subtotal_amount,
+            Order.created_at.label('order_date'),
+            Order.delivery_date,
+            (Buyer.first_name + literal(' ') + Buyer.last_name).label('buyer_name'),
+            items.label('items')
+        )\
+        .join(Order, Order.id == FarmerOrder.order_id)\
+        .outerjoin(Buyer, Buyer.id == Order.buyer_id)\
+        .filter(FarmerOrder.farmer_id == farmer_id)
+    
+    if status:
+        query = query.filter(FarmerOrder.status == status)
+    if start_date:
+        query = query.filter(FarmerOrder.created_at >= start_date)
+    if end_date:
+        query = query.filter(FarmerOrder.created_at < end_date + timedelta(days=1))
+    
+    rows, next_cursor = keyset_page(query, FARMER_INBOX_SORT, per_page, cursor=cursor)
+    
+    return {
+        "orders": [{
+            "order_id": row.order_id,
+            "order_date": row.order_date.isoformat(),
+            "delivery_date": row.delivery_date.isoformat() if row.delivery_date else None,
+            "buyer_name": row.buyer_name,
+            "status": row.status,
+            "subtotal": float(row.subtotal_amount),
+            "items": row.items
+        } for row in rows],
+        "per_page": per_page,
+        "next_cursor": next_cursor
+    }
+
 @orders.route('/api/v1/farmer/orders', methods=['GET'])
 @farmer_required
 def get_farmer_orders():
     """
-    fetch all orders for the current farmer
+    fetch the current farmer's orders, newest first
+
+    pages are cursor based: pass the ``next_cursor`` of the previous response
+    as ``cursor``. ``status`` narrows the inbox to one order status and
+    ``start_date`` / ``end_date`` (YYYY-MM-DD, inclusive) to a date range.
     """
     try:
         user_id = get_current_user_id()
-        farmer = Farmer.query.get(user_id)
         
-        if not farmer:
-            logger.error(f"farmer not found: {user_id}")
-            return jsonify({"error": "farmer not found"}), 404
+        per_page = min(request.args.get('per_page', 20, type=int), MAX_PER_PAGE)
+        cursor = request.args.get('cursor', type=str)
+        status = request.args.get('status', '', type=str).strip().lower()
         
-        farmer_orders = FarmerOrder.query.filter_by(farmer_id=user_id).all()
-        if not farmer_orders:
-            return jsonify({"message": "No orders found"}), 200
+        if per_page <= 0:
+            return jsonify({"error": "per page must be greater than 0"}), 400
         
-        orders_list = []
-        for farmer_order in farmer_orders:
-            order = farmer_order.order
-            
-            items= []
-            for item in farmer_order.order_items:
-                items.append({
-                    "product_id": item.product_id,
-                    "product_name": item.product.name,
-                    "quantity": item.quantity,
-                    "price_per_unit": float(item.price_per_unit),
-                    "subtotal": float(item.quantity * item.price_per_unit)
-                })
-                
-            order_detail = {
-                "order_id": order.id,
-                "order_date": order.created_at.isoformat(),
-                "delivery_date": order.delivery_date.isoformat() if order.delivery_date else None,
-                "buyer_name": order.buyer.full_name,
-                "status": farmer_order.status,
-                "subtotal": float(farmer_order.subtotal_amount),
-                "items": items
-            }
-            orders_list.append(order_detail)
-            
-        return jsonify({"orders": orders_list}), 200
+        if status and status not in order_status_enum.enums:
+            return jsonify({"error": f"invalid status: {status}"}), 400
+        
+        try:
+            start_date = date.fromisoformat(request.args['start_date']) if request.args.get('start_date') else None
+            end_date = date.fromisoformat(request.args['end_date']) if request.args.get('end_date') else None
+        except ValueError:
+            return jsonify({"error": "dates must be formatted as YYYY-MM-DD"}), 400
+        
+        if cursor:
+            try:
+                decode_cursor(cursor, FARMER_INBOX_SORT)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        
+        response_data = load_farmer_orders_page(user_id, per_page, cursor, status, start_date, end_date)
+        if not response_data["orders"] and not cursor:
+            response_data["message"] = "No orders found"
+        return jsonify(response_data), 200
     
     except Exception as e:
         logger.error(f"error fetching farmer orders: {str(e)}")
         return jsonify({"error": "internal server error"}), 500
+
+@orders.route('/api/v1/farmer/orders/status', methods=['POST'])
+@farmer_required
+def transition_farmer_orders_status():
+    """
+    move many of the current farmer's orders to a new status at once
+
+    expects {"farmer_order_ids": [...], "status": "delivered", "notes"?, "location"?}.
+    farmer orders whose current status doesn't allow the move are reported
+    back and left unchanged; the rest move together in one transaction and
+    their parent orders' status is recomputed
+    """
+    try:
+        user_id = get_current_user_id()
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({"error": "invalid request"}), 400
+        
+        farmer_order_ids = data.get('farmer_order_ids')
+        status = data.get('status')
+        notes = data.get('notes')
+        location = data.get('location')
+        
+        if not isinstance(farmer_order_ids, list) or not farmer_order_ids or \
+                not all(isinstance(farmer_order_id, int) and not isinstance(farmer_order_id, bool) for farmer_order_id in farmer_order_ids):
+            return jsonify({"error": "farmer_order_ids must be a non-empty list of ids"}), 400
+        if len(farmer_order_ids) > MAX_TRANSITION_BATCH:
+            return jsonify({"error": f"at most {MAX_TRANSITION_BATCH} farmer orders per request"}), 413
+        if not isinstance(status, str) or status not in TRANSITIONS:
+            return jsonify({"error": f"status must be one of: {', '.join(TRANSITIONS)}"}), 400
+        if (notes is not None and not isinstance(notes, str)) or (location is not None and not isinstance(location, str)):
+            return jsonify({"error": "notes and location must be strings"}), 400
+        
+        try:
+            updated, rejected = transition_farmer_orders(user_id, farmer_order_ids, status, notes=notes, location=location)
+            db.session.commit()
+            
+        except SQLAlchemyError as e:
+            logger.error(f"database error: {str(e)}")
+            db.session.rollback()
+            return jsonify({"error": "failed to update farmer orders"}), 500
+        
+        return jsonify({
+            "status": status,
+            "updated": updated,
+            "rejected": rejected
+        }), 200 if updated else 409
+    
+    except Exception as e:
+        logger.error(f"error updating farmer orders: {str(e)}")
+        db.session.rollback()
+        return jsonify({"error": "internal server error"}), 500
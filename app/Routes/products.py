@@ -1,7 +1,21 @@
+import json
 from flask import Blueprint, jsonify, request
 from ..models import db, Product, Farmer
 from ..wrappers import farmer_required
-from ..extensions import validate_product_data, cache, logger
+from ..extensions import validate_product_data, logger
+from ..search import get_search_backend
+from ..pagination import keyset_page, decode_cursor
+from ..codec import encode_json, json_body_response
+from ..loading import CATALOG
+from ..caching import (
+    cache_stats,
+    category_scope,
+    get_or_compute,
+    invalidate_product_listings,
+    versioned_key,
+    PRODUCTS_NAMESPACE,
+    GLOBAL_SCOPE
+)
 from sqlalchemy.exc import SQLAlchemyError
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
@@ -39,6 +53,7 @@ def add_product():
             )
             db.session.add(new_product)
             db.session.commit()
+            invalidate_product_listings([new_product.category])
             
             response = jsonify({
                 "success": True,
@@ -62,59 +77,124 @@ def add_product():
             "error": str(e)
         }), 500
     
+def serialize_product(product: Product) -> dict:
+    return {
+        "id": product.id,
+        "name": product.name,
+        "description": product.description,
+        "price": float(product.price_per_unit),
+        "amount": product.amount_available,
+        "category": product.category,
+        "seller": product.farmer.full_name
+    }
+
+def count_products(search_query: str, category: str, scopes) -> int:
+    """
+    total number of products matching a search, cached so cursor clients
+    don't pay for a COUNT(*) on every page
+    """
+    def count():
+        query = Product.query
+        if category:
+            query = query.filter(Product.category == category)
+        if search_query:
+            query = get_search_backend().apply(query, search_query, ranked=False)
+        return query.count()
+    
+    count_key = versioned_key(PRODUCTS_NAMESPACE, f"count:category{category}:search{search_query}", scopes)
+    return get_or_compute(count_key, count, timeout=300, namespace=PRODUCTS_NAMESPACE)
+
+def load_products_page(page: int, per_page: int, search_query: str, category: str, cursor=None) -> dict:
+    """
+    run the catalog query for one page and build the response payload
+    """
+    query = Product.query.options(*CATALOG)
+    if category:
+        query = query.filter(Product.category == category)
+    
+    if cursor is not None:
+        if search_query:
+            query = get_search_backend().apply(query, search_query, ranked=False)
+        
+        products, next_cursor = keyset_page(
+            query, (Product.created_at, Product.id), per_page, cursor=cursor)
+        
+        return {
+            "products": [serialize_product(product) for product in products],
+            "per_page": per_page,
+            "next_cursor": next_cursor
+        }
+    
+    if search_query:
+        query = get_search_backend().apply(query, search_query)
+    
+    pagination = query.paginate(page=page, per_page=per_page)
+    
+    return {
+        "products": [serialize_product(product) for product in pagination.items],
+        "page": pagination.page,
+        "per_page": pagination.per_page,
+        "total_pages": pagination.pages,
+        "total_items": pagination.total
+    }
+
 @products.route('/api/v1/products', methods=['GET'])
 def view_products():
     """
     view a paginated list of produxts with caching and optional search filtering
+    
+    search terms are matched against the product name, description and category
+    with prefix and typo tolerance; results are ordered by relevance
+    
+    passing ``cursor`` (empty for the first page) switches to keyset pagination
+    over (created_at, id), newest first: the response carries ``next_cursor``
+    instead of page numbers and skips the count unless ``include_total`` is set,
+    in which case a cached total is returned
+    
+    ``category`` narrows the listing to one category; those pages are only
+    invalidated by writes to products in that category
+    
+    pages are rebuilt by a single worker when they expire (the rest keep
+    serving the previous copy) and hot pages are refreshed shortly before
+    they expire. they are cached as encoded json, so a hit is sent as is
     """
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 12, type=int)
         search_query = request.args.get('search', '', type=str)
+        cursor = request.args.get('cursor', type=str)
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
+        category = request.args.get('category', '', type=str).strip().lower()
         
         if page <= 0 or per_page <= 0:
             return jsonify({"error": "page and per page must be greater than 0"})
         
-        # generating a unique cache key based on the request parameters
-        cache_key = f"products:page:{page}:per_page{per_page}:search{search_query}"
-        #check if the data exists in the cache
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            logger.info(f"returning cached data for: {cache_key}")
-            return jsonify(cached_data), 200
-        
-        #if the data does not exist we go ahead with querying the database
-        query = Product.query
-        
-        if search_query:
-            search_query = search_query.replace('%', r'\%').replace('_', r'\_')
-            query = query.filter(Product.name.ilike(f'%{search_query}%'))
-        
-        pagination = query.paginate(page=page, per_page=per_page)
-        products = pagination.items
+        if cursor:
+            try:
+                decode_cursor(cursor, (Product.created_at, Product.id))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
         
-        product_list = [{
-            "id": product.id,
-            "name": product.name,
-            "description": product.description,
-            "price": float(product.price_per_unit),
-            "amount": product.amount_available,
-            "category": product.category,
-            "seller": product.farmer.full_name
-        } for product in products]
+        # generating a unique cache key based on the request parameters,
+        # stamped with the generation of the catalog (or category) it shows
+        scopes = (category_scope(category),) if category else (GLOBAL_SCOPE,)
+        if cursor is not None:
+            page_key = f"cursor:{cursor}:per_page{per_page}:category{category}:search{search_query}"
+        else:
+            page_key = f"page:{page}:per_page{per_page}:category{category}:search{search_query}"
+        cache_key = versioned_key(PRODUCTS_NAMESPACE, page_key, scopes)
         
-        response_data = {
-            "products": product_list,
-            "page": pagination.page,
-            "per_page": pagination.per_page,
-            "total_pages": pagination.pages,
-            "total_items": pagination.total
-        }
+        body = get_or_compute(
+            cache_key,
+            lambda: encode_json(load_products_page(page, per_page, search_query, category, cursor=cursor)),
+            timeout=300,
+            namespace=PRODUCTS_NAMESPACE
+        )
         
-        #storing the response in the cache
-        cache.set(cache_key, response_data, timeout=300)
-        logger.info(f"data cached for; {cache_key}")
-        return jsonify(response_data), 200
+        if cursor is not None and include_total:
+            response_data = dict(json.loads(body), total_items=count_products(search_query, category, scopes))
+            return jsonify(response_data), 200
+        return json_body_response(body, 200)
     
     except Exception as e:
         logger.error(f"error fetching products: {str(e)}")
@@ -146,8 +226,9 @@ def update_product(id: int):
                 product.name = data['name'].strip()
             if 'description' in data:
                 product.description = data['description'].strip()
+            previous_category = product.category
             if 'category' in data:
-                product.category = data['category'].strip()
+                product.category = data['category'].strip().lower()
             if 'price_per_unit' in data:
                 try:
                     new_price = float(data['price_per_unit'])
@@ -162,12 +243,15 @@ def update_product(id: int):
                     if amount < 0:
                         return jsonify({"error": "available amount cannot be less than zer0"}), 400
                     if amount == 0:
-                        product.status = 'out of stock'
+                        product.status = 'out_of_stock'
+                    elif product.status == 'out_of_stock':
+                        product.status = 'available'
                     product.amount_available = amount
                 except (ValueError, TypeError):
                     return jsonify({"error": "invalid amount available"}), 400
             
             db.session.commit()
+            invalidate_product_listings([previous_category, product.category])
             response = jsonify({
                 "success": True,
                 "message": "product updated successfully"
@@ -201,7 +285,7 @@ def view_by_category(category: str):
         JSON: list of all the products in that category
     """
     try:
-        products = Product.query.filter(Product.category.ilike(f"%{category}%")).all()
+        products = Product.query.options(*CATALOG).filter(Product.category.ilike(f"%{category}%")).all()
         if not products:
             return jsonify({"message": "no products for that category"}), 404
         
@@ -236,7 +320,7 @@ def view_by_id(id: int):
         JSON: product details 
     """
     try:
-        product = Product.query.get_or_404(id)
+        product = Product.query.options(*CATALOG).get_or_404(id)
         
         response = jsonify({
             "id": product.id,
@@ -274,8 +358,10 @@ def delete_product(id: int):
             return jsonify({"error": "unauthorized access"}), 401
         
         try:
+            category = product.category
             db.session.delete(product)
             db.session.commit()
+            invalidate_product_listings([category])
             
             response = jsonify({
                 
@@ -297,4 +383,12 @@ def delete_product(id: int):
         return jsonify({
             "message": "internal server error",
             "error": str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@products.route('/api/v1/products/cache/stats', methods=['GET'])
+@jwt_required()
+def view_cache_stats():
+    """
+    hit, miss and invalidation counters of this worker's caches, used to tune TTLs
+    """
+    return jsonify(cache_stats.snapshot()), 200
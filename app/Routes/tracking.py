@@ -0,0 +1,92 @@
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from ..models import db, Order, OrderTracking, OrderTrackingLatest
+from ..wrappers import buyer_required, courier_required
+from ..extensions import logger, get_current_user_id
+from ..tracking import validate_events, ingest_events
+
+tracking = Blueprint('tracking', __name__)
+
+def serialize_event(event):
+    return {
+        "status": event.status,
+        "location": event.location,
+        "notes": event.notes,
+        "timestamp": event.created_at.isoformat()
+    }
+
+@tracking.route('/api/v1/tracking/events', methods=['POST'])
+@courier_required
+def ingest_tracking_events():
+    """
+    record a batch of courier tracking events
+
+    expects {"events": [{"order_id", "status", "location"?, "notes"?, "timestamp"?}, ...]}.
+    valid events are written even if others in the batch are rejected; the
+    response lists the rejected ones by their index in the batch
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('events'), list) or not data['events']:
+            return jsonify({"error": "invalid request"}), 400
+
+        max_batch = current_app.config.get('TRACKING_MAX_BATCH', 1000)
+        if len(data['events']) > max_batch:
+            return jsonify({"error": f"at most {max_batch} events per request"}), 413
+
+        rows, rejected = validate_events(data['events'])
+        accepted = 0
+        if rows:
+            try:
+                accepted, missing = ingest_events(rows)
+                db.session.commit()
+                rejected = sorted(rejected + missing, key=lambda entry: entry['index'])
+
+            except SQLAlchemyError as e:
+                logger.error(f"database error: {str(e)}")
+                db.session.rollback()
+                return jsonify({"error": "failed to record tracking events"}), 500
+
+        return jsonify({
+            "accepted": accepted,
+            "rejected": rejected
+        }), 201 if accepted else 400
+
+    except Exception as e:
+        logger.error(f"endpoint error: {str(e)}")
+        db.session.rollback()
+        return jsonify({"error": "internal server error"}), 500
+
+@tracking.route('/api/v1/orders/<int:order_id>/tracking', methods=['GET'])
+@buyer_required
+def get_order_tracking(order_id):
+    """
+    latest tracking status of an order plus its most recent events
+
+    Args:
+        order_id (integer): unique identifier for order
+    """
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+
+        buyer_id = db.session.execute(select(Order.buyer_id).where(Order.id == order_id)).scalar()
+        if buyer_id is None or buyer_id != get_current_user_id():
+            return jsonify({"error": "order not found"}), 404
+
+        latest = db.session.get(OrderTrackingLatest, order_id)
+        events = OrderTracking.query\
+            .filter(OrderTracking.order_id == order_id)\
+            .order_by(OrderTracking.created_at.desc())\
+            .limit(limit)\
+            .all()
+
+        return jsonify({
+            "order_id": order_id,
+            "latest": serialize_event(latest) if latest else None,
+            "events": [serialize_event(event) for event in events]
+        }), 200
+
+    except Exception as e:
+        logger.error(f"error fetching order tracking: {str(e)}")
+        return jsonify({"error": "internal server error"}), 500
@@ -0,0 +1,298 @@
+"""
+marketplace analytics
+
+platform-wide figures for operations (top selling products, demand and
+prices per category, active farmers per month) are kept in materialized
+views, so the admin endpoints read a few precomputed rows instead of
+aggregating ``order_items`` on the primary for every request.
+
+the views are refreshed by ``flask analytics refresh`` (from cron, or with
+``--every`` as a long running process), one view per transaction with
+``REFRESH MATERIALIZED VIEW CONCURRENTLY``. a concurrent refresh only takes
+an EXCLUSIVE lock on the view itself and reads the base tables like any
+query, so checkouts writing to them are never blocked and the views stay
+readable while they are rebuilt. each refresh runs under a lock timeout and
+a statement timeout, so a refresh stuck behind DDL or running long gives up
+instead of holding its locks, and under an advisory lock, so two refreshers
+never rebuild the same view at once.
+
+views are created with the schema (and by the first refresh on an existing
+database). counted sales are line items of pending and delivered farmer
+orders; canceled and refunded ones are left out.
+"""
+import time
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import current_app
+from sqlalchemy import Date, cast, column, distinct, event, func, select, table, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import OperationalError
+
+from .models import db, AnalyticsRefresh, FarmerOrder, Order, OrderItem, Product
+from .extensions import logger
+from .partitions import add_months, month_start
+
+SOLD_STATUSES = ('pending', 'delivered')
+LOCK_TIMEOUT_MS = 5000
+REFRESH_TIMEOUT_MS = 10 * 60 * 1000
+QUERY_TIMEOUT_MS = 5000
+
+
+def _month(value):
+    return cast(func.date_trunc('month', value), Date)
+
+
+def _sold_items():
+    return select().select_from(OrderItem)\
+        .join(FarmerOrder, FarmerOrder.id == OrderItem.farmer_order_id)\
+        .join(Product, Product.id == OrderItem.product_id)\
+        .where(FarmerOrder.status.in_(SOLD_STATUSES))
+
+
+def _product_sales():
+    return _sold_items().add_columns(
+            OrderItem.product_id,
+            Product.farmer_id,
+            Product.name,
+            Product.category,
+            func.sum(OrderItem.quantity).label('units_sold'),
+            func.sum(OrderItem.quantity * OrderItem.price_per_unit).label('revenue'),
+            func.count(distinct(OrderItem.order_id)).label('orders'),
+            func.max(OrderItem.created_at).label('last_sold_at')
+        )\
+        .group_by(OrderItem.product_id, Product.id)
+
+
+def _category_demand():
+    month = _month(OrderItem.created_at).label('month')
+    return _sold_items().add_columns(
+            Product.category,
+            month,
+            func.sum(OrderItem.quantity).label('units_sold'),
+            func.sum(OrderItem.quantity * OrderItem.price_per_unit).label('revenue'),
+            func.count(distinct(OrderItem.order_id)).label('orders'),
+            func.count(distinct(Order.buyer_id)).label('buyers')
+        )\
+        .join(Order, Order.id == OrderItem.order_id)\
+        .group_by(Product.category, month)
+
+
+def _category_prices():
+    available = Product.status == 'available'
+    listings = select(
+            Product.category,
+            func.count().label('listings'),
+            func.count().filter(available).label('available_listings'),
+            func.count(distinct(Product.farmer_id)).filter(available).label('listing_farmers'),
+            func.round(func.avg(Product.price_per_unit).filter(available), 2).label('avg_listed_price'),
+            func.min(Product.price_per_unit).filter(available).label('min_listed_price'),
+            func.max(Product.price_per_unit).filter(available).label('max_listed_price')
+        )\
+        .where(Product.status != 'deleted')\
+        .group_by(Product.category)\
+        .subquery('listings')
+    sold = _sold_items().add_columns(
+            Product.category,
+            func.round(
+                func.sum(OrderItem.quantity * OrderItem.price_per_unit) / func.nullif(func.sum(OrderItem.quantity), 0), 2
+            ).label('avg_sold_price')
+        )\
+        .group_by(Product.category)\
+        .subquery('sold')
+    return select(listings, sold.c.avg_sold_price)\
+        .outerjoin(sold, sold.c.category == listings.c.category)
+
+
+def _farmer_activity():
+    month = _month(FarmerOrder.created_at).label('month')
+    return select(
+            month,
+            func.count(distinct(FarmerOrder.farmer_id)).label('active_farmers'),
+            func.count(distinct(FarmerOrder.farmer_id)).filter(FarmerOrder.status == 'delivered').label('delivering_farmers'),
+            func.count().label('farmer_orders')
+        )\
+        .where(FarmerOrder.status.in_(SOLD_STATUSES))\
+        .group_by(month)
+
+
+# view name -> (definition, unique key); REFRESH ... CONCURRENTLY needs a unique index
+VIEWS = {
+    'analytics_product_sales': (_product_sales, ('product_id',)),
+    'analytics_category_demand': (_category_demand, ('category', 'month')),
+    'analytics_category_prices': (_category_prices, ('category',)),
+    'analytics_farmer_activity': (_farmer_activity, ('month',)),
+}
+
+
+def _check_views(names: Optional[Iterable[str]]) -> List[str]:
+    names = list(names or VIEWS)
+    unknown = [name for name in names if name not in VIEWS]
+    if unknown:
+        raise ValueError(f"unknown analytics views: {', '.join(unknown)}")
+    return names
+
+
+def view(name: str):
+    """
+    a selectable for reading the named view
+    """
+    definition, _ = VIEWS[name]
+    return table(name, *[column(selected.name) for selected in definition().selected_columns])
+
+
+def view_sql(name: str) -> str:
+    definition, _ = VIEWS[name]
+    return str(definition().compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def create_views(connection, names: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    create the missing views (with their data) and their unique indexes
+    returns the names of the views created
+    """
+    created = []
+    for name in _check_views(names):
+        if connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+            continue
+        _, key = VIEWS[name]
+        connection.execute(text(f"CREATE MATERIALIZED VIEW {name} AS {view_sql(name)}"))
+        connection.execute(text(f"CREATE UNIQUE INDEX {name}_key ON {name} ({', '.join(key)})"))
+        created.append(name)
+    return created
+
+
+def drop_views(connection):
+    for name in VIEWS:
+        connection.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {name}"))
+
+
+def refresh_views(names: Optional[Iterable[str]] = None, concurrently: bool = True,
+                  lock_timeout_ms: int = LOCK_TIMEOUT_MS,
+                  statement_timeout_ms: int = REFRESH_TIMEOUT_MS) -> List[Dict[str, Any]]:
+    """
+    refresh the named views (all of them by default), each in its own
+    transaction; returns one result per view with its duration and row
+    count, ``skipped`` when another process is refreshing it or ``error``
+    when it failed
+    """
+    names = _check_views(names)
+    with db.engine.begin() as connection:
+        create_views(connection, names)
+
+    results = []
+    for name in names:
+        started = time.perf_counter()
+        try:
+            with db.engine.begin() as connection:
+                if not connection.execute(text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"),
+                                          {"key": f"analytics:{name}"}).scalar():
+                    results.append({"view": name, "skipped": True})
+                    continue
+                connection.execute(text("SELECT set_config('lock_timeout', :value, true)"), {"value": f"{lock_timeout_ms}ms"})
+                connection.execute(text("SELECT set_config('statement_timeout', :value, true)"), {"value": f"{statement_timeout_ms}ms"})
+
+                # the first refresh of a view created WITH NO DATA can't be concurrent
+                populated = connection.execute(text(
+                    "SELECT ispopulated FROM pg_matviews WHERE matviewname = :name AND schemaname = current_schema()"),
+                    {"name": name}).scalar()
+                mode = 'CONCURRENTLY ' if concurrently and populated else ''
+                connection.execute(text(f"REFRESH MATERIALIZED VIEW {mode}{name}"))
+
+                row_count = connection.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                statement = insert(AnalyticsRefresh).values(
+                    view_name=name,
+                    refreshed_at=datetime.now(timezone.utc),
+                    duration_ms=duration_ms,
+                    row_count=row_count
+                )
+                connection.execute(statement.on_conflict_do_update(
+                    index_elements=[AnalyticsRefresh.view_name],
+                    set_={key: getattr(statement.excluded, key) for key in ('refreshed_at', 'duration_ms', 'row_count')}
+                ))
+            results.append({"view": name, "duration_ms": duration_ms, "rows": row_count})
+        except OperationalError as e:
+            # lock or statement timeout: leave the view as it was and move on to the next one
+            logger.error(f"failed to refresh {name}: {str(e)}")
+            results.append({"view": name, "error": str(e.orig).strip() if e.orig else str(e)})
+    return results
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _read(statement) -> List[Dict[str, Any]]:
+    """
+    run a select in its own read-only transaction under the query timeout
+    """
+    timeout = current_app.config.get('ANALYTICS_QUERY_TIMEOUT_MS', QUERY_TIMEOUT_MS)
+    with db.engine.connect() as connection:
+        connection.execute(text("SET TRANSACTION READ ONLY"))
+        connection.execute(text("SELECT set_config('statement_timeout', :value, true)"), {"value": f"{timeout}ms"})
+        return [{key: _plain(value) for key, value in row.items()} for row in connection.execute(statement).mappings()]
+
+
+def top_products(limit: int = 20, category: Optional[str] = None, order_by: str = 'revenue') -> List[Dict[str, Any]]:
+    products = view('analytics_product_sales')
+    statement = select(products).order_by(products.c[order_by].desc(), products.c.product_id).limit(limit)
+    if category:
+        statement = statement.where(products.c.category == category)
+    return _read(statement)
+
+
+def category_demand(months: int = 12, category: Optional[str] = None) -> List[Dict[str, Any]]:
+    demand = view('analytics_category_demand')
+    since = add_months(month_start(datetime.utcnow()), 1 - months)
+    statement = select(demand).where(demand.c.month >= since).order_by(demand.c.month.desc(), demand.c.revenue.desc())
+    if category:
+        statement = statement.where(demand.c.category == category)
+    return _read(statement)
+
+
+def category_prices() -> List[Dict[str, Any]]:
+    prices = view('analytics_category_prices')
+    return _read(select(prices).order_by(prices.c.category))
+
+
+def farmer_activity(months: int = 12) -> List[Dict[str, Any]]:
+    activity = view('analytics_farmer_activity')
+    since = add_months(month_start(datetime.utcnow()), 1 - months)
+    return _read(select(activity).where(activity.c.month >= since).order_by(activity.c.month.desc()))
+
+
+def refreshed_at(name: str) -> Optional[str]:
+    rows = _read(select(AnalyticsRefresh.refreshed_at).where(AnalyticsRefresh.view_name == name))
+    return rows[0]['refreshed_at'] if rows else None
+
+
+def refresh_status() -> List[Dict[str, Any]]:
+    refreshed = {row['view_name']: row for row in _read(select(AnalyticsRefresh.__table__))}
+    return [{
+        "view": name,
+        "refreshed_at": refreshed[name]['refreshed_at'] if name in refreshed else None,
+        "duration_ms": refreshed[name]['duration_ms'] if name in refreshed else None,
+        "rows": refreshed[name]['row_count'] if name in refreshed else None
+    } for name in VIEWS]
+
+
+def _create_views(target, connection, **kw):
+    if connection.dialect.name == 'postgresql':
+        create_views(connection)
+
+
+def _drop_views(target, connection, **kw):
+    # the views depend on the tables, so they go first
+    if connection.dialect.name == 'postgresql':
+        drop_views(connection)
+
+
+event.listen(db.metadata, 'after_create', _create_views)
+event.listen(db.metadata, 'before_drop', _drop_views)
@@ -7,7 +7,21 @@ from .Routes.products import products
 from .Routes.dashboard import dashboard
 from .Routes.user import user
 from .Routes.orders import orders
+from .Routes.exports import exports
+from .Routes.tracking import tracking
+from .Routes.admin import admin
 from .extensions import mail, cache
+from .search import init_search
+from .caching import init_tiered_cache
+from .order_queue import init_order_queue
+from .order_summaries import init_order_summaries
+from .farmer_stats import init_farmer_stats
+from .recent_orders import init_recent_orders
+from .dashboard_bundle import init_dashboard_bundle
+from .events import init_events
+from .commands import init_commands
+from .passwords import init_password_hasher
+from .partitions import include_object
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 
@@ -17,10 +31,21 @@ app.config.from_object(Config)
 # Initialize extensions
 db.init_app(app)
 mail.init_app(app)
-migrate = Migrate(app, db)
+# partitions aren't models; keep autogenerate from dropping them
+migrate = Migrate(app, db, include_object=include_object)
 jwt = JWTManager()
 jwt.init_app(app)
 cache.init_app(app)
+init_tiered_cache(app)
+init_search(app)
+init_order_queue(app)
+init_order_summaries(app)
+init_farmer_stats(app)
+init_recent_orders(app)
+init_dashboard_bundle(app)
+init_events(app)
+init_commands(app)
+init_password_hasher(app)
 CORS(app, supports_credentials=True)
 
 # Register blueprints
@@ -29,6 +54,9 @@ app.register_blueprint(products, url_prefix='')
 app.register_blueprint(dashboard, url_prefix='')
 app.register_blueprint(user, url_prefix='')
 app.register_blueprint(orders, url_prefix='')
+app.register_blueprint(exports, url_prefix='')
+app.register_blueprint(tracking, url_prefix='')
+app.register_blueprint(admin, url_prefix='')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,424 @@
+"""
+cache helpers shared by the read endpoints
+
+cached pages are addressed through generation-stamped keys: every key embeds
+the current generation number of the scopes it depends on (``global`` and e.g.
+``category:vegetables``). a write bumps those generations with a single INCR
+each, so every affected page goes stale at once without scanning redis for
+keys; the orphaned entries simply age out through their TTL.
+
+expensive entries are rebuilt through get_or_compute/single_flight, which
+guard against cache stampedes with a rebuild lock and probabilistic early
+expiration.
+
+reads go through ``tiered_cache``: a small in-process LRU/TTL tier (L1) in
+front of the shared redis cache (L2). writes and generation bumps are
+broadcast over redis pub/sub so every worker drops its L1 copy.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from cachetools import TLRUCache
+from flask import request
+
+from .extensions import cache, logger
+
+PRODUCTS_NAMESPACE = 'products'
+GLOBAL_SCOPE = 'global'
+
+
+class CacheStats:
+    """
+    per-worker hit, miss and invalidation counters grouped by cache namespace
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def incr(self, namespace: str, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[namespace][counter] += amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            namespaces = {namespace: dict(counters) for namespace, counters in self._counters.items()}
+
+        for counters in namespaces.values():
+            # every "<tier>hits"/"<tier>misses" pair gets a matching "<tier>hit_ratio"
+            for name in [name for name in counters if name.endswith('hits') and 'stale' not in name]:
+                prefix = name[:-len('hits')]
+                hits, misses = counters[name], counters.get(f"{prefix}misses", 0)
+                counters[f"{prefix}hit_ratio"] = round(hits / (hits + misses), 4) if hits + misses else None
+        return {"pid": os.getpid(), "namespaces": namespaces}
+
+
+cache_stats = CacheStats()
+
+
+class TieredCache:
+    """
+    in-process L1 in front of the shared flask-caching backend (L2)
+
+    L1 is size bounded (LRU) and every entry expires after at most
+    ``l1_ttl`` seconds, which bounds staleness even if an invalidation message
+    is lost. when the L2 backend is redis, writes publish the affected keys on
+    ``channel`` and a subscriber thread in every worker evicts them from L1.
+    """
+
+    STATS_NAMESPACE = 'tiers'
+
+    def __init__(self, l2, maxsize: int = 1024, l1_ttl: float = 5.0, redis_client=None,
+                 channel: str = 'cache:invalidate'):
+        self.l2 = l2
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._redis = redis_client
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self.configure(maxsize, l1_ttl)
+
+    def configure(self, maxsize: int, l1_ttl: float, redis_client=None):
+        with self._lock:
+            self.l1_ttl = l1_ttl
+            self._l1 = TLRUCache(maxsize=maxsize, ttu=lambda key, value, now: value[0])
+            if redis_client is not None:
+                self._redis = redis_client
+                self._listener_pid = None
+
+    def _l1_get(self, key: str):
+        with self._lock:
+            item = self._l1.get(key)
+        return item[1] if item is not None else None
+
+    def _l1_set(self, key: str, value: Any, timeout: Optional[int] = None):
+        ttl = self.l1_ttl if not timeout else min(self.l1_ttl, timeout)
+        with self._lock:
+            self._l1[key] = (time.monotonic() + ttl, value)
+
+    def evict(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._l1.pop(key, None)
+
+    def clear_local(self):
+        with self._lock:
+            self._l1.clear()
+
+    def get(self, key: str):
+        self._ensure_listener()
+        value = self._l1_get(key)
+        if value is not None:
+            cache_stats.incr(self.STATS_NAMESPACE, 'l1_hits')
+            return value
+        cache_stats.incr(self.STATS_NAMESPACE, 'l1_misses')
+
+        value = self.l2.get(key)
+        if value is None:
+            cache_stats.incr(self.STATS_NAMESPACE, 'l2_misses')
+            return None
+        cache_stats.incr(self.STATS_NAMESPACE, 'l2_hits')
+        self._l1_set(key, value)
+        return value
+
+    def get_many(self, *keys: str) -> List[Any]:
+        self._ensure_listener()
+        values = [self._l1_get(key) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+        cache_stats.incr(self.STATS_NAMESPACE, 'l1_hits', len(keys) - len(missing))
+        cache_stats.incr(self.STATS_NAMESPACE, 'l1_misses', len(missing))
+
+        if missing:
+            fetched = self.l2.get_many(*[keys[index] for index in missing])
+            for index, value in zip(missing, fetched):
+                if value is None:
+                    cache_stats.incr(self.STATS_NAMESPACE, 'l2_misses')
+                    continue
+                cache_stats.incr(self.STATS_NAMESPACE, 'l2_hits')
+                values[index] = value
+                self._l1_set(keys[index], value)
+        return values
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None):
+        result = self.l2.set(key, value, timeout=timeout)
+        self._l1_set(key, value, timeout)
+        self.publish([key])
+        return result
+
+    def delete(self, key: str):
+        result = self.l2.delete(key)
+        self.invalidate([key])
+        return result
+
+    def inc(self, key: str, delta: int = 1):
+        result = self.l2.cache.inc(key, delta=delta)
+        self.invalidate([key])
+        return result
+
+    def invalidate(self, keys: List[str]):
+        """
+        drop keys from this worker's L1 and tell the other workers to do the same
+        """
+        self.evict(keys)
+        self.publish(keys)
+
+    def publish(self, keys: List[str]):
+        if self._redis is None:
+            return
+        try:
+            self._redis.publish(self.channel, json.dumps({"origin": self.origin, "keys": keys}))
+        except Exception as e:
+            logger.error(f"failed to publish cache invalidation: {str(e)}")
+
+    def _ensure_listener(self):
+        # started lazily and per process, so forked gunicorn workers get their own
+        if self._redis is None or self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._l1.clear()
+        threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self._handle(message)
+            except Exception as e:
+                logger.error(f"cache invalidation listener failed, retrying: {str(e)}")
+                # messages may have been missed while disconnected
+                self.clear_local()
+                time.sleep(1)
+
+    def _handle(self, message: dict):
+        try:
+            payload = json.loads(message['data'])
+        except (KeyError, TypeError, ValueError):
+            return
+        if payload.get('origin') != self.origin:
+            self.evict(payload.get('keys', []))
+
+
+tiered_cache = TieredCache(cache)
+
+
+def get_redis_client():
+    """
+    the redis client behind ``cache``, or None when it isn't backed by redis
+    """
+    return getattr(cache.cache, '_write_client', None)
+
+
+def init_tiered_cache(app):
+    """
+    size the L1 tier from config and hook it up to the redis client behind ``cache``
+    """
+    tiered_cache.configure(
+        maxsize=app.config.get('CACHE_L1_MAXSIZE', 1024),
+        l1_ttl=app.config.get('CACHE_L1_TTL', 5),
+        redis_client=get_redis_client()
+    )
+    return tiered_cache
+
+
+def generation_key(namespace: str, scope: str = GLOBAL_SCOPE) -> str:
+    return f"{namespace}:gen:{scope}"
+
+
+def category_scope(category: str) -> str:
+    return f"category:{category.strip().lower()}"
+
+
+def versioned_key(namespace: str, key: str, scopes: Sequence[str] = (GLOBAL_SCOPE,)) -> str:
+    """
+    build a cache key stamped with the current generation of each scope
+    """
+    values = tiered_cache.get_many(*[generation_key(namespace, scope) for scope in scopes])
+    stamp = '.'.join(str(int(value or 0)) for value in values)
+    return f"{namespace}:v{stamp}:{key}"
+
+
+def bump_generations(namespace: str, scopes: Iterable[str]):
+    """
+    invalidate every cached entry that depends on any of the given scopes
+
+    failures are logged rather than raised so a cache outage never fails the
+    write that triggered the invalidation.
+    """
+    try:
+        for scope in set(scopes):
+            tiered_cache.inc(generation_key(namespace, scope))
+        cache_stats.incr(namespace, 'invalidations')
+    except Exception as e:
+        logger.error(f"failed to bump cache generations for {namespace}: {str(e)}")
+
+
+def invalidate_product_listings(categories: Iterable[str] = ()):
+    """
+    mark the catalog pages stale after products were added, changed or sold
+    """
+    scopes = [GLOBAL_SCOPE] + [category_scope(category) for category in categories if category]
+    bump_generations(PRODUCTS_NAMESPACE, scopes)
+
+
+def _should_refresh(entry: dict, now: float, beta: float) -> bool:
+    """
+    probabilistic early expiration (xfetch): the closer an entry is to its
+    expiry and the longer it took to compute, the likelier a reader is to
+    refresh it ahead of time, so hot keys rarely expire under load
+    """
+    jitter = entry['delta'] * beta * -math.log(1.0 - random.random())
+    return now + jitter >= entry['expires_at']
+
+
+def _acquire_lock(lock_key: str, lock_timeout: int):
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, timeout=lock_timeout):
+        return token
+    return None
+
+
+# delete the lock only if it still holds our token, in one step, so a lock
+# that expired and was taken by another worker is never deleted from under it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _release_lock(lock_key: str, token: str):
+    try:
+        client = get_redis_client()
+        if client is None:
+            # an in-process cache has nothing to race with between the two calls
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+            return
+        backend = cache.cache
+        client.register_script(RELEASE_LOCK_SCRIPT)(
+            keys=[backend.key_prefix + lock_key], args=[backend.serializer.dumps(token)])
+    except Exception as e:
+        logger.error(f"failed to release cache lock {lock_key}: {str(e)}")
+
+
+def _recompute(key: str, compute: Callable[[], Any], timeout: int, stale_ttl: int) -> Any:
+    started = time.time()
+    value = compute()
+    finished = time.time()
+    tiered_cache.set(key, {
+        'value': value,
+        'delta': finished - started,
+        'expires_at': finished + timeout
+    }, timeout=timeout + stale_ttl)
+    return value
+
+
+def get_or_compute(key: str, compute: Callable[[], Any], timeout: int, namespace: str = 'default',
+                   beta: float = 1.0, stale_ttl: Optional[int] = None, lock_timeout: int = 10,
+                   wait_timeout: float = 5.0) -> Any:
+    """
+    return the cached value for key, recomputing it with single-flight semantics
+
+    entries outlive their logical ``timeout`` by ``stale_ttl`` seconds (defaults
+    to the timeout). once an entry is due, whether through expiry or early
+    refresh, only the worker holding the rebuild lock recomputes it while the
+    others keep serving the stale value. on a cold key the other workers wait
+    for the builder instead of all hitting the database at once.
+    """
+    stale_ttl = timeout if stale_ttl is None else stale_ttl
+    lock_key = f"lock:{key}"
+
+    entry = tiered_cache.get(key)
+    if entry is not None and not _should_refresh(entry, time.time(), beta):
+        cache_stats.incr(namespace, 'hits')
+        return entry['value']
+
+    token = _acquire_lock(lock_key, lock_timeout)
+    if token:
+        cache_stats.incr(namespace, 'misses' if entry is None else 'refreshes')
+        try:
+            return _recompute(key, compute, timeout, stale_ttl)
+        finally:
+            _release_lock(lock_key, token)
+
+    if entry is not None:
+        cache_stats.incr(namespace, 'stale_hits')
+        return entry['value']
+
+    # another worker is building a cold key, wait for it to land
+    cache_stats.incr(namespace, 'waits')
+    deadline = time.time() + wait_timeout
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = tiered_cache.get(key)
+        if entry is not None:
+            cache_stats.incr(namespace, 'hits')
+            return entry['value']
+
+    cache_stats.incr(namespace, 'misses')
+    return _recompute(key, compute, timeout, stale_ttl)
+
+
+def request_cache_key(*args, **kwargs) -> str:
+    """
+    cache key for the current request: path plus sorted query arguments
+    """
+    arguments = '&'.join(f"{name}={value}" for name, value in sorted(request.args.items(multi=True)))
+    return f"{request.path}?{arguments}"
+
+
+def single_flight(timeout: int, key_prefix: str, key_func: Optional[Callable[..., str]] = None,
+                  namespace: Optional[str] = None, cache_if: Optional[Callable[[Any], bool]] = None, **options):
+    """
+    decorator caching a function's return value through get_or_compute
+
+    the key is built from the call arguments unless ``key_func`` is given, which
+    is called with the same arguments as the function; view functions should
+    pass ``key_func=request_cache_key`` and return plain data (a dict, list or
+    ``(data, status)`` tuple) rather than a Response object. the cache codec
+    gives tuples back as tuples, so flask still reads the status.
+    results rejected by ``cache_if`` are returned but not kept.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if key_func is not None:
+                suffix = key_func(*args, **kwargs)
+            else:
+                suffix = repr((args, sorted(kwargs.items())))
+            key = f"{key_prefix}:{hashlib.sha1(suffix.encode()).hexdigest()}"
+
+            rejected = []
+
+            def compute():
+                value = function(*args, **kwargs)
+                if cache_if is not None and not cache_if(value):
+                    rejected.append(value)
+                    raise _UncacheableResult()
+                return value
+
+            try:
+                return get_or_compute(key, compute, timeout, namespace=namespace or key_prefix, **options)
+            except _UncacheableResult:
+                return rejected[0]
+        return wrapper
+    return decorator
+
+
+class _UncacheableResult(Exception):
+    pass
@@ -0,0 +1,127 @@
+"""
+order placement
+
+a checkout runs a fixed number of statements regardless of cart size: every
+product in the cart is loaded and row-locked with one SELECT ... FOR UPDATE
+(in id order, so concurrent checkouts lock rows in the same order and can't
+deadlock), quantities are validated in memory and the order, farmer orders
+and order items are inserted in one batched flush. stock is then taken for
+the whole cart with one guarded UPDATE (see inventory.reserve_stock_many).
+"""
+from decimal import Decimal
+from typing import Any, Dict, List, Set, Tuple
+
+from .models import db, Product, Order, FarmerOrder, OrderItem
+from .inventory import reserve_stock_many
+from .farmer_stats import StatsChanges
+
+
+class CheckoutError(Exception):
+    """
+    a cart that can't be turned into an order; carries the response to send back
+    """
+
+    def __init__(self, payload: Dict[str, Any], status: int = 400):
+        super().__init__(payload.get('error') or payload.get('message'))
+        self.payload = payload
+        self.status = status
+
+
+def parse_cart(items: Any) -> Dict[int, int]:
+    """
+    validate the shape of the cart and merge repeated products
+    returns a mapping of product id to requested quantity
+    """
+    if not isinstance(items, list) or not items:
+        raise CheckoutError({"error": "invalid request"})
+
+    cart: Dict[int, int] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise CheckoutError({"error": "invalid request"})
+
+        product_id = item.get('product_id')
+        quantity = item.get('quantity', 0)
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            raise CheckoutError({"error": "invalid product id"})
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            raise CheckoutError({"error": "quantity must be greater than zero"})
+
+        cart[product_id] = cart.get(product_id, 0) + quantity
+    return cart
+
+
+def lock_products(product_ids: List[int]) -> Dict[int, Product]:
+    """
+    load and row-lock the given products in a single statement, ordered by id
+    products already in the session are refreshed, so carts placed one after
+    another in a batch see the stock the earlier ones took
+    """
+    products = Product.query\
+        .filter(Product.id.in_(sorted(product_ids)))\
+        .order_by(Product.id)\
+        .with_for_update()\
+        .populate_existing()\
+        .all()
+    return {product.id: product for product in products}
+
+
+def place_order(buyer_id: int, cart: Dict[int, int]) -> Tuple[Order, Set[str]]:
+    """
+    create an order for the cart inside the current transaction
+
+    returns the flushed order and the categories of the products it touched;
+    the caller commits. raises CheckoutError if a product is missing or does
+    not have enough stock.
+    """
+    products = lock_products(list(cart))
+
+    missing = sorted(set(cart) - set(products))
+    if missing:
+        raise CheckoutError({"error": f"product {missing[0]} not found"}, 404)
+
+    for product_id, quantity in cart.items():
+        product = products[product_id]
+        if quantity > product.amount_available:
+            raise CheckoutError({"message": f"only {product.amount_available} is available"})
+
+    new_order = Order(buyer_id=buyer_id, total_amount=Decimal('0'), status='pending')
+    farmer_orders: Dict[int, FarmerOrder] = {}
+    categories = set()
+
+    for product_id, quantity in cart.items():
+        product = products[product_id]
+
+        farmer_order = farmer_orders.get(product.farmer_id)
+        if farmer_order is None:
+            farmer_order = FarmerOrder(order=new_order, farmer_id=product.farmer_id, subtotal_amount=Decimal('0'))
+            farmer_orders[product.farmer_id] = farmer_order
+
+        item_total = Decimal(quantity) * product.price_per_unit
+        OrderItem(
+            order=new_order,
+            farmer_order=farmer_order,
+            product_id=product.id,
+            quantity=quantity,
+            price_per_unit=product.price_per_unit
+        )
+        farmer_order.subtotal_amount += item_total
+        new_order.total_amount += item_total
+        categories.add(product.category)
+
+    reserved = reserve_stock_many(cart)
+    if reserved != set(cart):
+        product_id = min(set(cart) - reserved)
+        raise CheckoutError({"message": f"product {product_id} is no longer available in that quantity"}, 409)
+
+    # the reservation's UPDATE bypasses the flush, so count the listings it sold out here
+    sold_out = StatsChanges()
+    for product_id, quantity in cart.items():
+        product = products[product_id]
+        if product.status == 'available' and product.amount_available == quantity:
+            sold_out.listing(product.farmer_id, 'available', 'out_of_stock')
+    sold_out.apply()
+
+    db.session.add(new_order)
+    db.session.flush()
+    return new_order, categories
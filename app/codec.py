@@ -0,0 +1,126 @@
+"""
+compact serialization for cached api payloads
+
+flask-caching's redis backend pickles every value. our cached values are
+json-shaped (response payloads and their cache envelopes), so storing them as
+json bytes, compressed once they pass a size threshold, keeps redis memory and
+load times down. pages can also be cached as pre-encoded json bodies and sent
+back on a hit without going through jsonify again.
+"""
+import json
+import pickle
+import zlib
+from typing import Any, Optional
+
+from cachelib.serializers import RedisSerializer
+from flask import current_app
+from flask_caching.backends.rediscache import RedisCache
+
+JSON_TAG = b'J'
+COMPRESSED_TAG = b'Z'
+PICKLE_TAG = b'!'
+
+
+def _json_exact(value: Any) -> bool:
+    """
+    whether json.loads(json.dumps(value)) gives back an equal value of the same types
+    """
+    kind = type(value)
+    if kind is dict:
+        return all(type(key) is str and _json_exact(item) for key, item in value.items())
+    if kind is list:
+        return all(_json_exact(item) for item in value)
+    return kind in (str, int, float, bool) or value is None
+
+
+class CompactSerializer:
+    """
+    redis serializer writing tagged json bytes, zlib-compressed above a threshold
+
+    integers are stored as plain digits so INCR keeps working on them, values
+    json wouldn't give back exactly (tuples, non-string keys, other types)
+    fall back to pickle, and entries written by the default pickle serializer
+    are still readable. anything that can't be decoded reads as a miss.
+    """
+
+    def __init__(self, compress_threshold: int = 1024, compress_level: int = 1):
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def dumps(self, value: Any, protocol: int = pickle.HIGHEST_PROTOCOL) -> bytes:
+        if type(value) is int:
+            return str(value).encode('ascii')
+
+        try:
+            if not _json_exact(value):
+                raise TypeError("value doesn't round trip through json")
+            raw = json.dumps(value, separators=(',', ':'), allow_nan=False).encode()
+        except (TypeError, ValueError, RecursionError):
+            return PICKLE_TAG + pickle.dumps(value, protocol)
+
+        if self.compress_threshold is not None and len(raw) >= self.compress_threshold:
+            return COMPRESSED_TAG + zlib.compress(raw, self.compress_level)
+        return JSON_TAG + raw
+
+    def loads(self, value: Optional[bytes]) -> Any:
+        if value is None:
+            return None
+
+        tag, body = value[:1], value[1:]
+        try:
+            if tag == JSON_TAG:
+                return json.loads(body)
+            if tag == COMPRESSED_TAG:
+                return json.loads(zlib.decompress(body))
+            if tag == PICKLE_TAG:
+                return pickle.loads(body)
+            return int(value)
+        except Exception:
+            # corrupt, truncated or from an incompatible writer: recompute it
+            return None
+
+
+SERIALIZERS = {
+    'compact': CompactSerializer,
+    'pickle': RedisSerializer
+}
+
+
+class CompactRedisCache(RedisCache):
+    """
+    flask-caching redis backend with a pluggable serializer
+
+    selected with ``CACHE_TYPE='app.codec.CompactRedisCache'``;
+    ``CACHE_SERIALIZER`` picks the codec (``compact`` or ``pickle``) and
+    ``CACHE_COMPRESS_THRESHOLD`` the payload size in bytes above which values
+    are compressed.
+    """
+
+    def __init__(self, *args, serializer: str = 'compact', compress_threshold: int = 1024, **kwargs):
+        super().__init__(*args, **kwargs)
+        if serializer == 'compact':
+            self.serializer = CompactSerializer(compress_threshold=compress_threshold)
+        elif serializer in SERIALIZERS:
+            self.serializer = SERIALIZERS[serializer]()
+        else:
+            raise ValueError(f"unknown cache serializer: {serializer}")
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.setdefault('serializer', config.get('CACHE_SERIALIZER', 'compact'))
+        kwargs.setdefault('compress_threshold', int(config.get('CACHE_COMPRESS_THRESHOLD', 1024)))
+        return super().factory(app, config, args, kwargs)
+
+
+def encode_json(payload: Any) -> str:
+    """
+    encode a payload exactly the way jsonify would, for caching as a ready body
+    """
+    return current_app.json.dumps(payload)
+
+
+def json_body_response(body: str, status: int = 200):
+    """
+    build a json response from an already encoded body
+    """
+    return current_app.response_class(f"{body}\n", status=status, mimetype=current_app.json.mimetype)
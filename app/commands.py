@@ -0,0 +1,202 @@
+"""
+flask cli commands
+
+    flask orders work                drain the redis order queue in this process
+    flask orders rebuild-summaries   rebuild the order history read model
+    flask orders reconcile           check stored order totals against line items
+    flask orders rebuild-stats       rebuild the farmer dashboard stats rollup
+    flask partitions create          create upcoming monthly partitions
+    flask partitions list            show the partitions of each partitioned table
+    flask partitions detach          detach (archive or drop) old monthly partitions
+    flask partitions convert         rebuild existing plain tables as partitioned ones
+    flask analytics refresh          refresh the marketplace analytics views
+"""
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .models import db
+from .farmer_stats import rebuild_farmer_stats
+from .order_summaries import rebuild_order_summaries
+from .partitions import (PARTITIONED_TABLES, ARCHIVE_SCHEMA, MONTHS_AHEAD, ensure_partitions,
+                         list_partitions, detach_partitions, convert_to_partitioned, align_created_at)
+from .reconcile import reconcile_totals
+from .analytics import VIEWS, LOCK_TIMEOUT_MS, REFRESH_TIMEOUT_MS, refresh_views
+
+orders_cli = AppGroup('orders', help='order processing commands')
+partitions_cli = AppGroup('partitions', help='monthly partition maintenance')
+analytics_cli = AppGroup('analytics', help='marketplace analytics views')
+
+
+def _parse_month(value):
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise click.BadParameter("months must be formatted as YYYY-MM")
+
+
+@orders_cli.command('work')
+@click.option('--batch-size', type=int, default=None, help='orders placed per transaction')
+@click.option('--recover', is_flag=True, help='first requeue jobs left unfinished by dead workers (run with no other workers up)')
+def work_orders(batch_size, recover):
+    """
+    place queued orders until interrupted
+    """
+    pool = current_app.extensions['order_queue']
+    if batch_size:
+        pool.batch_size = batch_size
+    if recover and hasattr(pool.queue, 'recover'):
+        click.echo(f"requeued {pool.queue.recover()} unfinished orders")
+    click.echo(f"draining order queue with batches of {pool.batch_size}")
+    pool.run()
+
+
+@orders_cli.command('rebuild-summaries')
+@click.option('--batch-size', type=int, default=1000, help='orders rebuilt per statement')
+def rebuild_summaries(batch_size):
+    """
+    rebuild every order summary from the order tables
+    """
+    processed = rebuild_order_summaries(batch_size=batch_size)
+    click.echo(f"rebuilt {processed} order summaries")
+
+
+@orders_cli.command('rebuild-stats')
+@click.option('--batch-size', type=int, default=500, help='farmers rebuilt per transaction')
+def rebuild_stats(batch_size):
+    """
+    recompute the farmer stats rollup from order and product history
+    """
+    processed = rebuild_farmer_stats(batch_size=batch_size)
+    click.echo(f"rebuilt stats for {processed} farmers")
+
+
+@orders_cli.command('reconcile')
+@click.option('--fix', is_flag=True, help='overwrite stored totals with the line item sums')
+@click.option('--batch-size', type=int, default=10000, help='ids checked per statement')
+@click.option('--show', type=int, default=20, help='mismatches to list per table')
+def reconcile(fix, batch_size, show):
+    """
+    verify order and farmer order totals against their line items
+    exits with status 1 when mismatches are found and not fixed
+    """
+    report = reconcile_totals(batch_size=batch_size, fix=fix)
+
+    for label, checked, mismatches in (
+        ('orders', report.orders_checked, report.order_mismatches),
+        ('farmer orders', report.farmer_orders_checked, report.farmer_order_mismatches),
+    ):
+        click.echo(f"{label}: {checked} checked, {len(mismatches)} mismatched")
+        for row_id, stored, expected in mismatches[:show]:
+            click.echo(f"  {row_id}: stored {stored}, line items {expected}")
+
+    if report.clean:
+        click.echo("totals are consistent")
+    elif fix:
+        click.echo("mismatched totals were corrected")
+    else:
+        raise SystemExit(1)
+
+
+@partitions_cli.command('create')
+@click.option('--months-ahead', type=int, default=MONTHS_AHEAD, help='months past the current one to create')
+@click.option('--from', 'start', default=None, help='first month to create, as YYYY-MM (default: current month)')
+def create_partitions(months_ahead, start):
+    """
+    create any missing monthly partitions, moving matching rows out of the default partitions
+    run it from a monthly cron job so new months never land in the default partition
+    """
+    with db.engine.begin() as connection:
+        created = ensure_partitions(connection, months_ahead=months_ahead, start=_parse_month(start))
+    for name in created:
+        click.echo(f"created {name}")
+    click.echo(f"{len(created)} partitions created")
+
+
+@partitions_cli.command('list')
+def show_partitions():
+    """
+    list each partitioned table's partitions with their bounds and estimated rows
+    """
+    with db.engine.connect() as connection:
+        for table in PARTITIONED_TABLES:
+            click.echo(table)
+            for partition in list_partitions(connection, table):
+                bounds = 'DEFAULT' if partition.is_default else f"{partition.low:%Y-%m-%d} .. {partition.high:%Y-%m-%d}"
+                click.echo(f"  {partition.name:<32} {bounds:<24} ~{partition.rows} rows")
+
+
+@partitions_cli.command('detach')
+@click.option('--before', required=True, help='detach partitions ending on or before this month, as YYYY-MM')
+@click.option('--drop', is_flag=True, help=f'drop detached partitions instead of moving them to the {ARCHIVE_SCHEMA} schema')
+def detach_old_partitions(before, drop):
+    """
+    detach monthly partitions older than a month, archiving or dropping them
+    """
+    with db.engine.begin() as connection:
+        detached = detach_partitions(connection, _parse_month(before), drop=drop)
+    for name in detached:
+        click.echo(f"{'dropped' if drop else f'archived to {ARCHIVE_SCHEMA}:'} {name}")
+    click.echo(f"{len(detached)} partitions detached")
+
+
+@partitions_cli.command('convert')
+@click.argument('tables', nargs=-1)
+def convert_tables(tables):
+    """
+    rebuild plain order_items / order_tracking tables as partitioned ones
+    locks each table while its rows are copied; run it in a maintenance window.
+    tables already partitioned only get line items older than their orders aligned
+    """
+    for table in tables or PARTITIONED_TABLES:
+        if table not in PARTITIONED_TABLES:
+            raise click.BadParameter(f"{table} is not a partitioned table")
+        with db.engine.begin() as connection:
+            copied = convert_to_partitioned(connection, table)
+            aligned = align_created_at(connection, table) if copied < 0 else 0
+        if copied < 0:
+            click.echo(f"{table} is already partitioned, {aligned} rows aligned with their orders")
+        else:
+            click.echo(f"{table}: {copied} rows copied into monthly partitions")
+
+
+@analytics_cli.command('refresh')
+@click.argument('views', nargs=-1)
+@click.option('--every', type=int, default=None, help='keep running and refresh every this many seconds')
+@click.option('--lock-timeout', type=int, default=LOCK_TIMEOUT_MS, help='ms to wait for a lock before giving up on a view')
+@click.option('--timeout', type=int, default=REFRESH_TIMEOUT_MS, help='ms a single view may take to refresh')
+def refresh_analytics(views, every, lock_timeout, timeout):
+    """
+    refresh the analytics views (all of them by default) without blocking writers
+    creates missing views first
+    """
+    unknown = [view for view in views if view not in VIEWS]
+    if unknown:
+        raise click.BadParameter(f"unknown views: {', '.join(unknown)}; choose from {', '.join(VIEWS)}")
+
+    while True:
+        failed = False
+        for result in refresh_views(views, lock_timeout_ms=lock_timeout, statement_timeout_ms=timeout):
+            if result.get('skipped'):
+                click.echo(f"{result['view']}: skipped, another refresh is running")
+            elif 'error' in result:
+                failed = True
+                click.echo(f"{result['view']}: failed, {result['error']}")
+            else:
+                click.echo(f"{result['view']}: {result['rows']} rows in {result['duration_ms']} ms")
+        if not every:
+            if failed:
+                raise SystemExit(1)
+            return
+        time.sleep(every)
+
+
+def init_commands(app):
+    app.cli.add_command(orders_cli)
+    app.cli.add_command(partitions_cli)
+    app.cli.add_command(analytics_cli)
@@ -0,0 +1,211 @@
+"""
+farmer dashboard bundle
+
+the dashboard's stats, recent orders and available products in one request,
+so the token is verified once and the sections load side by side instead of
+one request after another.
+
+every section has its own cache TTL (``DASHBOARD_*_TTL``, 0 turns the cache
+off for that section); the cached sections are looked up with one
+``get_many``. the sections that miss are loaded on a per-process thread
+pool, each task in its own app context and so with its own session and
+pooled connection. a lone miss is loaded on the request thread, where a
+pool hop would only add latency.
+
+a section that fails or runs past ``DASHBOARD_SECTION_TIMEOUT`` comes back
+as null with its error, so one slow part doesn't blank the whole dashboard.
+every section reports how long it took and whether it came from the cache.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence
+
+from flask import current_app
+
+from .models import Product
+from .extensions import logger
+from .loading import COLUMNS_ONLY
+from .caching import PRODUCTS_NAMESPACE, tiered_cache, versioned_key
+from .farmer_stats import load_dashboard_stats
+from .recent_orders import recent_orders
+
+SECTIONS = ('stats', 'recent_orders', 'available_products')
+DEFAULT_TTLS = {'stats': 15, 'recent_orders': 0, 'available_products': 60}
+TTL_SETTINGS = {
+    'stats': 'DASHBOARD_STATS_TTL',
+    'recent_orders': 'DASHBOARD_RECENT_ORDERS_TTL',
+    'available_products': 'DASHBOARD_PRODUCTS_TTL'
+}
+
+
+def available_products(farmer_id: int) -> List[Dict[str, Any]]:
+    products = Product.query.options(*COLUMNS_ONLY).filter_by(
+        farmer_id=farmer_id,
+        status='available'
+    ).all()
+
+    return [{
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'amount_available': float(product.amount_available),
+        'price_per_unit': float(product.price_per_unit),
+        'category': product.category
+    } for product in products]
+
+
+def load_section(name: str, farmer_id: int, limit: int):
+    if name == 'stats':
+        return load_dashboard_stats(farmer_id)
+    if name == 'recent_orders':
+        return recent_orders(farmer_id, limit)
+    return available_products(farmer_id)
+
+
+def section_key(name: str, farmer_id: int, limit: int) -> str:
+    if name == 'available_products':
+        # stamped with the catalog generation, so product writes and sales drop it
+        return versioned_key(PRODUCTS_NAMESPACE, f"dashboard:available:{farmer_id}")
+    if name == 'recent_orders':
+        return f"dashboard:bundle:recent:{farmer_id}:{limit}"
+    return f"dashboard:bundle:{name}:{farmer_id}"
+
+
+def parse_sections(value: Optional[str]) -> List[str]:
+    """
+    the sections named in a comma separated list, all of them when empty
+    raises ValueError on an unknown name
+    """
+    if not value:
+        return list(SECTIONS)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SECTIONS]
+    if unknown:
+        raise ValueError(f"unknown sections: {', '.join(unknown)}; choose from {', '.join(SECTIONS)}")
+    return [name for name in SECTIONS if name in names]
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+class DashboardBundle:
+    """
+    loads dashboard sections, cache first and the misses concurrently
+    """
+
+    def __init__(self, app, ttls: Dict[str, int], workers: int = 4, timeout: float = 5.0):
+        self.app = app
+        self.ttls = ttls
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def executor(self) -> ThreadPoolExecutor:
+        # created lazily and per process, so forked gunicorn workers get their own threads
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='dashboard')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, name: str, farmer_id: int, limit: int):
+        with self.app.app_context():
+            started = time.perf_counter()
+            return load_section(name, farmer_id, limit), _elapsed_ms(started)
+
+    def load(self, farmer_id: int, sections: Sequence[str] = SECTIONS, limit: int = 5) -> Dict[str, Any]:
+        """
+        the requested sections plus ``timings`` (and ``errors`` when a section failed)
+        """
+        started = time.perf_counter()
+        result, timings, errors = {}, {}, {}
+
+        keys = {name: section_key(name, farmer_id, limit) for name in sections if self.ttls.get(name)}
+        lookup_started = time.perf_counter()
+        try:
+            values = tiered_cache.get_many(*keys.values()) if keys else []
+        except Exception as e:
+            logger.error(f"failed to read cached dashboard sections: {str(e)}")
+            values = [None] * len(keys)
+        lookup_ms = _elapsed_ms(lookup_started)
+        for name, value in zip(keys, values):
+            if value is not None:
+                result[name] = value
+                timings[name] = {"ms": lookup_ms, "cached": True}
+
+        missing = [name for name in sections if name not in result]
+        loaded = {}
+        if len(missing) == 1:
+            try:
+                section_started = time.perf_counter()
+                loaded[missing[0]] = (load_section(missing[0], farmer_id, limit), _elapsed_ms(section_started))
+            except Exception as e:
+                errors[missing[0]] = str(e)
+        elif missing:
+            futures = {self.executor().submit(self._run, name, farmer_id, limit): name for name in missing}
+            done, _ = wait(futures, timeout=self.timeout)
+            for future, name in futures.items():
+                if future not in done:
+                    future.cancel()
+                    errors[name] = f"timed out after {self.timeout:g}s"
+                elif future.exception() is not None:
+                    errors[name] = str(future.exception())
+                else:
+                    loaded[name] = future.result()
+
+        for name, (value, ms) in loaded.items():
+            result[name] = value
+            timings[name] = {"ms": ms, "cached": False}
+            if name in keys:
+                try:
+                    tiered_cache.set(keys[name], value, timeout=self.ttls[name])
+                except Exception as e:
+                    logger.error(f"failed to cache dashboard section {name}: {str(e)}")
+
+        for name, error in errors.items():
+            logger.error(f"dashboard section {name} failed for farmer {farmer_id}: {error}")
+            result[name] = None
+            timings[name] = {"ms": None, "cached": False}
+
+        bundle = {name: result[name] for name in sections}
+        bundle['timings'] = {**{name: timings[name] for name in sections}, "total_ms": _elapsed_ms(started)}
+        if errors:
+            bundle['errors'] = errors
+        return bundle
+
+
+def server_timing(timings: Dict[str, Any]) -> str:
+    """
+    the bundle timings as a Server-Timing header, for the browser's network panel
+    """
+    entries = []
+    for name, timing in timings.items():
+        if name == 'total_ms':
+            entries.append(f"total;dur={timing}")
+        elif timing['ms'] is not None:
+            description = 'cache' if timing['cached'] else 'load'
+            entries.append(f'{name};desc="{description}";dur={timing["ms"]}')
+    return ', '.join(entries)
+
+
+def get_dashboard_bundle() -> DashboardBundle:
+    return current_app.extensions['dashboard_bundle']
+
+
+def init_dashboard_bundle(app):
+    """
+    set up the dashboard bundle with the configured section TTLs and pool size
+    """
+    ttls = {name: int(app.config.get(setting, DEFAULT_TTLS[name])) for name, setting in TTL_SETTINGS.items()}
+    app.extensions['dashboard_bundle'] = DashboardBundle(
+        app,
+        ttls,
+        workers=app.config.get('DASHBOARD_WORKERS', 4),
+        timeout=app.config.get('DASHBOARD_SECTION_TIMEOUT', 5.0)
+    )
@@ -0,0 +1,149 @@
+"""
+order change events
+
+status changes of orders and farmer orders, and new tracking events, are
+published to redis pub/sub on one channel per user (``events:buyer:<id>``,
+``events:farmer:<id>``). the server-sent event stream (app/sse.py) relays them
+to connected clients, so apps no longer have to poll the order endpoints.
+
+events are only published once the transaction that produced them commits.
+ORM writes to orders and farmer orders are picked up from the flush
+automatically; code that writes with set-based statements (tracking ingest,
+bulk transitions) queues its events with queue_events.
+"""
+import json
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import event, inspect, select
+
+from .models import db, Order, FarmerOrder
+from .extensions import logger, current_transaction, descends_from
+from .caching import get_redis_client
+
+CHANNEL_PREFIX = 'events'
+
+
+def user_channel(role: str, user_id: int) -> str:
+    return f"{CHANNEL_PREFIX}:{role}:{user_id}"
+
+
+def make_event(kind: str, **data) -> Dict[str, Any]:
+    return {"id": uuid.uuid4().hex, "type": kind, "at": time.time(), "data": data}
+
+
+def queue_events(session, events: Iterable[Tuple[Iterable[str], Dict[str, Any]]]):
+    """
+    hold (channels, event) pairs until the session's transaction commits;
+    they are dropped if the (possibly nested) transaction is rolled back
+    """
+    transaction = current_transaction(session)
+    session.info.setdefault('pending_events', []).extend(
+        (transaction, tuple(channels), payload) for channels, payload in events)
+
+
+def publish_events(events: List[Tuple[Tuple[str, ...], Dict[str, Any]]]):
+    """
+    publish events right away, one pipeline round trip for the whole batch
+    """
+    client = get_redis_client()
+    if client is None or not events:
+        return
+    try:
+        pipeline = client.pipeline(transaction=False)
+        for channels, payload in events:
+            message = json.dumps(payload)
+            for channel in channels:
+                pipeline.publish(channel, message)
+        pipeline.execute()
+    except Exception as e:
+        # clients resync on reconnect; a lost event must never fail the write
+        logger.error(f"failed to publish order events: {str(e)}")
+
+
+def _status_changed(instance) -> bool:
+    return inspect(instance).attrs.status.history.has_changes()
+
+
+def _order_buyers(session, order_ids) -> Dict[int, int]:
+    """
+    buyer of each order, from the identity map where possible
+    """
+    buyers, missing = {}, set()
+    for order_id in order_ids:
+        order = session.identity_map.get(session.identity_key(Order, order_id))
+        if order is not None:
+            buyers[order_id] = order.buyer_id
+        else:
+            missing.add(order_id)
+    if missing:
+        rows = session.connection().execute(select(Order.id, Order.buyer_id).where(Order.id.in_(missing)))
+        buyers.update({order_id: buyer_id for order_id, buyer_id in rows})
+    return buyers
+
+
+def _collect_flush_events(session) -> List[Tuple[Tuple[str, ...], Dict[str, Any]]]:
+    events = []
+    changed_farmer_orders = []
+
+    for instance in session.new:
+        if isinstance(instance, Order) and instance.buyer_id is not None:
+            events.append(((user_channel('buyer', instance.buyer_id),), make_event(
+                'order.created', order_id=instance.id, status=instance.status,
+                total_amount=float(instance.total_amount))))
+        elif isinstance(instance, FarmerOrder):
+            events.append(((user_channel('farmer', instance.farmer_id),), make_event(
+                'farmer_order.created', order_id=instance.order_id, farmer_order_id=instance.id,
+                status=instance.status, subtotal=float(instance.subtotal_amount))))
+
+    for instance in session.dirty:
+        if isinstance(instance, Order) and instance.buyer_id is not None and _status_changed(instance):
+            events.append(((user_channel('buyer', instance.buyer_id),), make_event(
+                'order.status', order_id=instance.id, status=instance.status)))
+        elif isinstance(instance, FarmerOrder) and _status_changed(instance):
+            changed_farmer_orders.append(instance)
+
+    if changed_farmer_orders:
+        buyers = _order_buyers(session, {farmer_order.order_id for farmer_order in changed_farmer_orders})
+        for farmer_order in changed_farmer_orders:
+            channels = [user_channel('farmer', farmer_order.farmer_id)]
+            if buyers.get(farmer_order.order_id) is not None:
+                channels.append(user_channel('buyer', buyers[farmer_order.order_id]))
+            events.append((tuple(channels), make_event(
+                'farmer_order.status', order_id=farmer_order.order_id,
+                farmer_order_id=farmer_order.id, status=farmer_order.status)))
+    return events
+
+
+def install(session):
+    """
+    publish order events written through the given session once they commit
+    """
+    @event.listens_for(session, 'after_flush')
+    def collect_events(session, flush_context):
+        events = _collect_flush_events(session)
+        if events:
+            queue_events(session, events)
+
+    @event.listens_for(session, 'after_commit')
+    def publish_pending(session):
+        publish_events([(channels, payload) for _, channels, payload in session.info.pop('pending_events', [])])
+
+    @event.listens_for(session, 'after_soft_rollback')
+    def discard_pending(session, previous_transaction):
+        # a savepoint rollback (e.g. one failed job in an order batch) drops only its own events
+        pending = session.info.get('pending_events')
+        if pending:
+            session.info['pending_events'] = [
+                (transaction, channels, payload) for transaction, channels, payload in pending
+                if not descends_from(transaction, previous_transaction)]
+
+
+def init_events(app):
+    """
+    publish order events from writes on the app's session
+    """
+    if not app.extensions.get('order_events'):
+        install(db.session)
+        app.extensions['order_events'] = True
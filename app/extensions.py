@@ -19,9 +19,11 @@ load_dotenv()
 
 mail = Mail()
 cache = Cache(config={
-    'CACHE_TYPE': 'RedisCache',
+    'CACHE_TYPE': 'app.codec.CompactRedisCache',
     'CACHE_REDIS_URL': os.getenv('REDIS_URL'),
-    'CACHE_DEFAULT_TIMEOUT': 300
+    'CACHE_DEFAULT_TIMEOUT': 300,
+    'CACHE_SERIALIZER': os.getenv('CACHE_SERIALIZER', 'compact'),
+    'CACHE_COMPRESS_THRESHOLD': int(os.getenv('CACHE_COMPRESS_THRESHOLD', 1024))
 })
 
 def get_current_user():
@@ -43,6 +45,23 @@ def get_current_user_id():
         return identity['id']
     return None
 
+def current_transaction(session):
+    """
+    the innermost transaction of the session, to tag work queued until commit
+    """
+    return session.get_nested_transaction() or session.get_transaction()
+
+def descends_from(transaction, ancestor) -> bool:
+    """
+    whether the transaction is the ancestor or nested inside it, i.e. whether
+    rolling the ancestor back undoes it
+    """
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
 def validate_phone_number(phone_number):
     if not re.search(r"\d{10}$", phone_number):
         return False
@@ -0,0 +1,359 @@
+"""
+farmer dashboard stats rollup
+
+the dashboard figures are kept as running totals instead of being
+aggregated on every load: ``farmer_stats`` holds each farmer's sales per
+month (by the month the farmer order was placed) and ``farmer_stats_totals``
+their all-time figures and active listings, so the dashboard is a primary
+key read of both. ``farmer_sales_daily`` breaks delivered sales down by
+product and day for the sales charts (app/sales_series.py).
+
+every write that moves a figure adds its delta to these tables in the same
+transaction. the upserts are additive (``x = x + excluded.x``), so concurrent
+checkouts for one farmer queue on the row lock instead of overwriting each
+other's counts. deltas come from:
+
+- the session's flushes: farmer orders created, changing status or deleted,
+  and products listed, changing status or deleted
+- checkout, for the products its stock reservation sells out
+- bulk farmer order transitions, which bypass the flush
+
+cached sales charts of the farmers whose sales changed are invalidated once
+the transaction commits. ``flask orders rebuild-stats`` recomputes all three
+tables from history.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import Date, Integer, and_, case, cast, column, delete, event, func, inspect, select, values
+from sqlalchemy.dialects.postgresql import insert
+
+from .models import db, Farmer, FarmerOrder, FarmerSalesDaily, FarmerStats, FarmerStatsTotals, OrderItem, Product
+from .caching import bump_generations
+from .extensions import current_transaction, descends_from
+from .partitions import month_start
+
+FIGURES = ('products_sold', 'revenue', 'pending_orders', 'delivered_orders')
+SALES_NAMESPACE = 'sales'
+
+
+def farmer_scope(farmer_id: int) -> str:
+    return f"farmer:{farmer_id}"
+
+
+def farmer_order_figures(status: Optional[str], quantity: int = 0, subtotal=None) -> Dict[str, Any]:
+    """
+    what a single farmer order adds to the stats while it has status
+    """
+    if status == 'pending':
+        return {'pending_orders': 1}
+    if status == 'delivered':
+        return {'products_sold': quantity or 0, 'revenue': subtotal or Decimal('0'), 'delivered_orders': 1}
+    return {}
+
+
+class StatsChanges:
+    """
+    deltas to the rollup, gathered in memory and written with one upsert per table
+    """
+
+    def __init__(self):
+        self.monthly = defaultdict(lambda: dict.fromkeys(FIGURES, 0))
+        self.listings = defaultdict(int)
+        # farmer order id -> +1 when it became delivered, -1 when it stopped being
+        self.sales = defaultdict(int)
+        self.sales_farmers = set()
+
+    def farmer_order(self, farmer_id: int, created_at, old_status: Optional[str], new_status: Optional[str],
+                     quantity: int = 0, subtotal=None, old_subtotal=None, farmer_order_id: Optional[int] = None):
+        """
+        record a farmer order moving from old_status to new_status (None when
+        it is created or deleted)
+        """
+        sign = (new_status == 'delivered') - (old_status == 'delivered')
+        if sign and farmer_order_id is not None:
+            self.sales[farmer_order_id] += sign
+            self.sales_farmers.add(farmer_id)
+
+        row = self.monthly[(farmer_id, month_start(created_at))]
+        for key, value in farmer_order_figures(new_status, quantity, subtotal).items():
+            row[key] += value
+        old_subtotal = subtotal if old_subtotal is None else old_subtotal
+        for key, value in farmer_order_figures(old_status, quantity, old_subtotal).items():
+            row[key] -= value
+
+    def listing(self, farmer_id: int, old_status: Optional[str], new_status: Optional[str]):
+        self.listings[farmer_id] += (new_status == 'available') - (old_status == 'available')
+
+    def __bool__(self):
+        return any(any(row.values()) for row in self.monthly.values()) or any(self.listings.values()) \
+            or any(self.sales.values())
+
+    def apply(self, session=None) -> None:
+        """
+        add the deltas to the rollup inside the session's transaction, rows in
+        key order so concurrent writers lock them alike
+        """
+        if not self:
+            return
+        session = session or db.session()
+        # core execution on the session's connection, so this doesn't re-enter a flush
+        connection = session.connection()
+
+        monthly = [{"farmer_id": farmer_id, "month": month, **row}
+                   for (farmer_id, month), row in sorted(self.monthly.items()) if any(row.values())]
+        totals = defaultdict(lambda: dict.fromkeys(FIGURES + ('active_listings',), 0))
+        for row in monthly:
+            for key in FIGURES:
+                totals[row['farmer_id']][key] += row[key]
+        for farmer_id, change in self.listings.items():
+            if change:
+                totals[farmer_id]['active_listings'] += change
+
+        if monthly:
+            statement = insert(FarmerStats)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[FarmerStats.farmer_id, FarmerStats.month],
+                set_={key: getattr(FarmerStats, key) + getattr(statement.excluded, key) for key in FIGURES}
+            ), monthly)
+
+        statement = insert(FarmerStatsTotals)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[FarmerStatsTotals.farmer_id],
+            set_={key: getattr(FarmerStatsTotals, key) + getattr(statement.excluded, key)
+                  for key in FIGURES + ('active_listings',)}
+        ), [{"farmer_id": farmer_id, **row} for farmer_id, row in sorted(totals.items())])
+
+        sales = [(farmer_order_id, sign) for farmer_order_id, sign in sorted(self.sales.items()) if sign]
+        if sales:
+            connection.execute(_daily_sales_delta(sales))
+            # days whose every delivered order was taken back leave nothing to chart
+            connection.execute(delete(FarmerSalesDaily).where(
+                FarmerSalesDaily.farmer_id.in_(sorted(self.sales_farmers)), FarmerSalesDaily.orders == 0))
+            session.info.setdefault('sales_changed', []).append((current_transaction(session), self.sales_farmers))
+
+
+def _daily_sales_delta(sales):
+    """
+    add (or with sign -1, take back) the line items of the given farmer
+    orders to the daily product sales, in one INSERT ... SELECT
+    """
+    changes = values(column('farmer_order_id', Integer), column('sign', Integer), name='changes').data(sales)
+    day = cast(FarmerOrder.created_at, Date)
+    rows = select(
+            FarmerOrder.farmer_id,
+            day,
+            OrderItem.product_id,
+            func.sum(OrderItem.quantity * changes.c.sign),
+            func.sum(OrderItem.calculate_item_total * changes.c.sign),
+            func.sum(changes.c.sign)
+        )\
+        .select_from(changes)\
+        .join(FarmerOrder, FarmerOrder.id == changes.c.farmer_order_id)\
+        .join(OrderItem, and_(OrderItem.farmer_order_id == FarmerOrder.id, OrderItem.created_at >= FarmerOrder.created_at))\
+        .group_by(FarmerOrder.farmer_id, day, OrderItem.product_id)\
+        .order_by(FarmerOrder.farmer_id, day, OrderItem.product_id)
+
+    statement = insert(FarmerSalesDaily).from_select(['farmer_id', 'day', 'product_id', 'quantity', 'revenue', 'orders'], rows)
+    return statement.on_conflict_do_update(
+        index_elements=[FarmerSalesDaily.farmer_id, FarmerSalesDaily.day, FarmerSalesDaily.product_id],
+        set_={key: getattr(FarmerSalesDaily, key) + getattr(statement.excluded, key) for key in ('quantity', 'revenue', 'orders')}
+    )
+
+
+def _farmer_order_quantity(session, farmer_order) -> int:
+    # from the loaded line items when there are any, otherwise summed in the database
+    if 'order_items' not in inspect(farmer_order).unloaded:
+        return sum(item.quantity for item in farmer_order.order_items)
+    return session.connection().scalar(
+        select(func.coalesce(func.sum(OrderItem.quantity), 0))
+        .where(OrderItem.farmer_order_id == farmer_order.id, OrderItem.created_at >= farmer_order.created_at))
+
+
+def _previous(instance, attribute: str):
+    history = inspect(instance).attrs[attribute].history
+    return history.deleted[0] if history.deleted else getattr(instance, attribute)
+
+
+def collect_flush_changes(session) -> StatsChanges:
+    """
+    the rollup deltas of the farmer orders and products in the current flush
+    """
+    changes = StatsChanges()
+
+    def farmer_order(instance, old_status, new_status, old_subtotal=None):
+        quantity = _farmer_order_quantity(session, instance) if 'delivered' in (old_status, new_status) else 0
+        changes.farmer_order(instance.farmer_id, instance.created_at, old_status, new_status,
+                             quantity=quantity, subtotal=instance.subtotal_amount, old_subtotal=old_subtotal,
+                             farmer_order_id=instance.id)
+
+    for instance in session.new:
+        if isinstance(instance, FarmerOrder):
+            farmer_order(instance, None, instance.status)
+        elif isinstance(instance, Product):
+            changes.listing(instance.farmer_id, None, instance.status)
+
+    for instance in session.dirty:
+        if isinstance(instance, FarmerOrder):
+            state = inspect(instance).attrs
+            if state.status.history.has_changes() or state.subtotal_amount.history.has_changes():
+                farmer_order(instance, _previous(instance, 'status'), instance.status,
+                             old_subtotal=_previous(instance, 'subtotal_amount'))
+        elif isinstance(instance, Product) and inspect(instance).attrs.status.history.has_changes():
+            changes.listing(instance.farmer_id, _previous(instance, 'status'), instance.status)
+
+    for instance in session.deleted:
+        if isinstance(instance, FarmerOrder):
+            farmer_order(instance, instance.status, None)
+        elif isinstance(instance, Product):
+            changes.listing(instance.farmer_id, instance.status, None)
+
+    return changes
+
+
+def install(session):
+    """
+    fold the farmer orders and products written through the given session into the rollup
+    """
+    @event.listens_for(session, 'after_flush')
+    def update_farmer_stats(session, flush_context):
+        collect_flush_changes(session).apply(session)
+
+    @event.listens_for(session, 'after_commit')
+    def invalidate_sales(session):
+        farmer_ids = set()
+        for _, changed in session.info.pop('sales_changed', []):
+            farmer_ids.update(changed)
+        if farmer_ids:
+            bump_generations(SALES_NAMESPACE, [farmer_scope(farmer_id) for farmer_id in farmer_ids])
+
+    @event.listens_for(session, 'after_soft_rollback')
+    def discard_sales(session, previous_transaction):
+        pending = session.info.get('sales_changed')
+        if pending:
+            session.info['sales_changed'] = [
+                (transaction, changed) for transaction, changed in pending
+                if not descends_from(transaction, previous_transaction)]
+
+
+def init_farmer_stats(app):
+    """
+    keep the farmer stats rollup in sync with writes on the app's session
+    """
+    if not app.extensions.get('farmer_stats'):
+        install(db.session)
+        app.extensions['farmer_stats'] = True
+
+
+def load_dashboard_stats(farmer_id: int, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    the farmer's dashboard figures: two primary key lookups in one statement
+    """
+    month = month_start(today or datetime.utcnow())
+    row = db.session.execute(
+        select(
+            FarmerStatsTotals.products_sold,
+            FarmerStatsTotals.pending_orders,
+            FarmerStatsTotals.active_listings,
+            FarmerStats.revenue
+        )
+        .outerjoin(FarmerStats, and_(FarmerStats.farmer_id == FarmerStatsTotals.farmer_id, FarmerStats.month == month))
+        .where(FarmerStatsTotals.farmer_id == farmer_id)
+    ).first()
+
+    products_sold, pending_orders, active_listings, revenue = row if row else (0, 0, 0, 0)
+    return {
+        "products_sold": float(products_sold or 0),
+        "current_month_revenue": float(revenue or 0),
+        "pending_orders": pending_orders or 0,
+        "active_listings": active_listings or 0
+    }
+
+
+def rebuild_statements(farmer_ids: Iterable[int]):
+    """
+    statements recomputing the rollup of the given farmers from their orders and products
+    """
+    farmer_ids = sorted(set(farmer_ids))
+    delivered = FarmerOrder.status == 'delivered'
+    month = cast(func.date_trunc('month', FarmerOrder.created_at), Date)
+    quantity = select(func.coalesce(func.sum(OrderItem.quantity), 0))\
+        .where(OrderItem.farmer_order_id == FarmerOrder.id, OrderItem.created_at >= FarmerOrder.created_at)\
+        .correlate(FarmerOrder)\
+        .scalar_subquery()
+
+    monthly = select(
+            FarmerOrder.farmer_id,
+            month,
+            func.coalesce(func.sum(case((delivered, quantity))), 0),
+            func.coalesce(func.sum(FarmerOrder.subtotal_amount).filter(delivered), 0),
+            func.count().filter(FarmerOrder.status == 'pending'),
+            func.count().filter(delivered)
+        )\
+        .where(FarmerOrder.farmer_id.in_(farmer_ids))\
+        .group_by(FarmerOrder.farmer_id, month)
+
+    sums = select(FarmerStats.farmer_id, *[func.sum(getattr(FarmerStats, key)).label(key) for key in FIGURES])\
+        .where(FarmerStats.farmer_id.in_(farmer_ids))\
+        .group_by(FarmerStats.farmer_id)\
+        .subquery()
+    listings = select(Product.farmer_id, func.count().label('active_listings'))\
+        .where(Product.farmer_id.in_(farmer_ids), Product.status == 'available')\
+        .group_by(Product.farmer_id)\
+        .subquery()
+    totals = select(
+            Farmer.id,
+            *[func.coalesce(getattr(sums.c, key), 0) for key in FIGURES],
+            func.coalesce(listings.c.active_listings, 0)
+        )\
+        .outerjoin(sums, sums.c.farmer_id == Farmer.id)\
+        .outerjoin(listings, listings.c.farmer_id == Farmer.id)\
+        .where(Farmer.id.in_(farmer_ids))
+
+    day = cast(FarmerOrder.created_at, Date)
+    daily = select(
+            FarmerOrder.farmer_id,
+            day,
+            OrderItem.product_id,
+            func.sum(OrderItem.quantity),
+            func.sum(OrderItem.calculate_item_total),
+            func.count()
+        )\
+        .join(OrderItem, and_(OrderItem.farmer_order_id == FarmerOrder.id, OrderItem.created_at >= FarmerOrder.created_at))\
+        .where(FarmerOrder.farmer_id.in_(farmer_ids), delivered)\
+        .group_by(FarmerOrder.farmer_id, day, OrderItem.product_id)
+
+    upsert_totals = insert(FarmerStatsTotals).from_select(['farmer_id', *FIGURES, 'active_listings'], totals)
+    return (
+        delete(FarmerStats).where(FarmerStats.farmer_id.in_(farmer_ids)),
+        insert(FarmerStats).from_select(['farmer_id', 'month', *FIGURES], monthly),
+        delete(FarmerSalesDaily).where(FarmerSalesDaily.farmer_id.in_(farmer_ids)),
+        insert(FarmerSalesDaily).from_select(['farmer_id', 'day', 'product_id', 'quantity', 'revenue', 'orders'], daily),
+        upsert_totals.on_conflict_do_update(
+            index_elements=[FarmerStatsTotals.farmer_id],
+            set_={key: getattr(upsert_totals.excluded, key) for key in FIGURES + ('active_listings',)}
+        ),
+    )
+
+
+def rebuild_farmer_stats(batch_size: int = 500) -> int:
+    """
+    recompute the rollup of every farmer, batch_size farmers per transaction
+    returns the number of farmers processed
+    """
+    processed = 0
+    last_id = 0
+    while True:
+        farmer_ids = db.session.execute(
+            select(Farmer.id).where(Farmer.id > last_id).order_by(Farmer.id).limit(batch_size)
+        ).scalars().all()
+        if not farmer_ids:
+            return processed
+        for statement in rebuild_statements(farmer_ids):
+            db.session.execute(statement)
+        db.session.commit()
+        bump_generations(SALES_NAMESPACE, [farmer_scope(farmer_id) for farmer_id in farmer_ids])
+        processed += len(farmer_ids)
+        last_id = farmer_ids[-1]
@@ -0,0 +1,130 @@
+"""
+idempotency keys for unsafe endpoints
+
+clients that retry a request send the same ``Idempotency-Key`` header with it.
+the first request claims the key in redis (SET NX) and runs; its response is
+stored under the key together with a fingerprint of the request. a retry with
+the same key gets the stored response back without running the view again,
+and a duplicate arriving while the first is still running waits for it
+instead of racing it. reusing a key for a different request is rejected.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from flask import jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+from .extensions import cache, logger
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def _record_key(key: str) -> str:
+    identity = get_jwt_identity()
+    if isinstance(identity, dict):
+        owner = f"{identity.get('role')}:{identity.get('id')}"
+    else:
+        owner = str(identity)
+    digest = hashlib.sha256(f"{owner}:{request.method}:{request.path}:{key}".encode()).hexdigest()
+    return f"idempotency:{digest}"
+
+
+def _fingerprint() -> str:
+    return hashlib.sha256(request.method.encode() + request.path.encode() + request.get_data()).hexdigest()
+
+
+def _replay(record: dict):
+    response = make_response(record['body'], record['status'])
+    response.mimetype = record['mimetype']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(record_key: str, fingerprint: str, lock_ttl: int, wait_timeout: float):
+    """
+    claim the key for this request, returns None once claimed or the record
+    that stopped us (another request's, a finished one, or one still in
+    flight after ``wait_timeout``)
+    """
+    deadline = time.monotonic() + wait_timeout
+    while not cache.add(record_key, {"state": "in_flight", "fingerprint": fingerprint}, timeout=lock_ttl):
+        # None is either a claim given up in between (take it over on the next
+        # pass) or a record that can't be read (lagging replica, undecodable),
+        # so it waits and times out like a claim still in flight
+        record = cache.get(record_key)
+        if record is not None and (record.get('fingerprint') != fingerprint or record.get('state') == 'completed'):
+            return record
+        if time.monotonic() >= deadline:
+            return record or {"state": "in_flight", "fingerprint": fingerprint}
+        time.sleep(0.1)
+    return None
+
+
+def _forget(record_key: str):
+    try:
+        cache.delete(record_key)
+    except Exception as e:
+        logger.error(f"failed to release idempotency key: {str(e)}")
+
+
+def idempotent(ttl: int = 86400, lock_ttl: int = 30, wait_timeout: float = 10.0):
+    """
+    decorator making a view safe to retry with an Idempotency-Key header
+
+    ``ttl`` is how long a finished response can be replayed, ``lock_ttl`` how
+    long a claimed key stays in flight if its worker dies, and ``wait_timeout``
+    how long a concurrent duplicate waits before giving up with a 409.
+    responses with a 5xx status are not stored, so the client can retry them.
+    when redis can't be reached the request is refused with a 503 rather than
+    run without the guard, since running it twice is what the key prevents.
+    must be applied inside jwt_required so keys are scoped to the caller.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > 255:
+                return jsonify({"error": "idempotency key is too long"}), 400
+
+            record_key = _record_key(key)
+            fingerprint = _fingerprint()
+
+            try:
+                record = _claim(record_key, fingerprint, lock_ttl, wait_timeout)
+            except Exception as e:
+                logger.error(f"idempotency store unavailable: {str(e)}")
+                response = jsonify({"error": "service temporarily unavailable, retry with the same idempotency key"})
+                response.headers['Retry-After'] = '1'
+                return response, 503
+            if record is not None:
+                if record.get('fingerprint') != fingerprint:
+                    return jsonify({"error": "idempotency key was already used for a different request"}), 422
+                if record.get('state') == 'completed':
+                    return _replay(record)
+                return jsonify({"error": "a request with this idempotency key is still being processed"}), 409
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                _forget(record_key)
+                raise
+
+            try:
+                if response.status_code >= 500 or response.is_streamed:
+                    cache.delete(record_key)
+                else:
+                    cache.set(record_key, {
+                        "state": "completed",
+                        "fingerprint": fingerprint,
+                        "status": response.status_code,
+                        "mimetype": response.mimetype,
+                        "body": response.get_data(as_text=True)
+                    }, timeout=ttl)
+            except Exception as e:
+                logger.error(f"failed to store idempotent response: {str(e)}")
+            return response
+        return wrapper
+    return decorator
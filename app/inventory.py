@@ -0,0 +1,64 @@
+"""
+stock reservation
+
+stock is only ever taken through a guarded UPDATE that checks and decrements
+in one statement, so two checkouts racing for the last units of a lot can't
+both succeed: the loser's update matches no row. a product that reaches zero
+is flipped to out_of_stock by the same statement.
+"""
+from typing import Dict, Set
+
+from sqlalchemy import Integer, case, column, update, values
+
+from .models import db, Product
+
+
+def _remaining_status(quantity):
+    return case((Product.amount_available == quantity, 'out_of_stock'), else_=Product.status)
+
+
+def reserve_stock(product_id: int, quantity: int) -> bool:
+    """
+    atomically take quantity units of a product
+    returns False, changing nothing, if not enough stock is left
+    """
+    statement = update(Product)\
+        .where(Product.id == product_id, Product.amount_available >= quantity)\
+        .values(
+            amount_available=Product.amount_available - quantity,
+            status=_remaining_status(quantity)
+        )\
+        .execution_options(synchronize_session=False)
+    return db.session.execute(statement).rowcount == 1
+
+
+def reserve_stock_many(cart: Dict[int, int]) -> Set[int]:
+    """
+    atomically take stock for a whole cart with a single UPDATE ... FROM (VALUES ...)
+
+    returns the ids of the products that were reserved; any product missing
+    from the result did not have enough stock and the caller should roll the
+    transaction back. rows should already be locked in id order (see
+    checkout.lock_products) when carts can overlap, to rule out deadlocks.
+    """
+    if not cart:
+        return set()
+
+    requested = values(
+        column('product_id', Integer),
+        column('quantity', Integer),
+        name='requested'
+    ).data(sorted(cart.items()))
+
+    statement = update(Product)\
+        .where(
+            Product.id == requested.c.product_id,
+            Product.amount_available >= requested.c.quantity
+        )\
+        .values(
+            amount_available=Product.amount_available - requested.c.quantity,
+            status=_remaining_status(requested.c.quantity)
+        )\
+        .returning(Product.id)\
+        .execution_options(synchronize_session=False)
+    return set(db.session.execute(statement).scalars())
@@ -0,0 +1,66 @@
+"""
+relationship loading profiles
+
+relationships on the models are lazy by default, so nothing is eagerly loaded
+unless a query asks for it. each endpoint applies the profile matching what it
+serializes, e.g. ``Product.query.options(*CATALOG)``, which keeps the number of
+statements per request fixed instead of growing with the data.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, raiseload, selectinload
+
+from .models import db, Farmer, Product, Order, OrderItem
+
+# product listings: the product row plus its seller's name, in one statement
+CATALOG = (
+    joinedload(Product.farmer).load_only(Farmer.first_name, Farmer.last_name),
+    raiseload('*'),
+)
+
+# buyer order history and order details: orders, then their line items with
+# each product and the product's seller in a second statement
+ORDER_DETAIL = (
+    selectinload(Order.order_items)
+    .joinedload(OrderItem.product)
+    .load_only(Product.name, Product.farmer_id)
+    .joinedload(Product.farmer)
+    .load_only(Farmer.first_name, Farmer.last_name),
+    raiseload('*'),
+)
+
+# endpoints that serialize plain columns only
+COLUMNS_ONLY = (
+    raiseload('*'),
+)
+
+
+class StatementCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_statements():
+    """
+    record the sql statements executed inside the block
+
+        with count_statements() as counter:
+            client.get('/api/v1/products')
+        assert counter.count == 1
+    """
+    counter = StatementCounter()
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
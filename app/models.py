@@ -1,8 +1,10 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.dialects.postgresql import ENUM
+from sqlalchemy import DDL, event, func, inspect, select
+from sqlalchemy.orm import object_session
+from sqlalchemy.dialects.postgresql import ENUM, JSONB, TSVECTOR
 from datetime import datetime, timezone
+from .passwords import password_hasher
 
 db = SQLAlchemy()
 
@@ -36,10 +38,22 @@ class UserMixin:
     password_hash = db.Column(db.String(255), nullable=False)
     
     def hash_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # on the password hashing pool (app/passwords.py); may raise PasswordHasherBusy
+        self.password_hash = password_hasher.hash(password)
+        return self.password_hash
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def rehash_password_if_outdated(self, password):
+        """
+        rehash with the current work factor after a successful login
+        returns whether the stored hash changed and needs to be committed
+        """
+        if not password_hasher.needs_rehash(self.password_hash):
+            return False
+        self.hash_password(password)
+        return True
     
     @hybrid_property
     def full_name(self):
@@ -48,14 +62,14 @@ class UserMixin:
 class Farmer(BaseModel, UserMixin):
     __tablename__ = 'farmers'
     
-    products = db.relationship('Product', back_populates='farmer', lazy='selectin', cascade='all, delete-orphan')
-    farmer_orders = db.relationship('FarmerOrder', back_populates='farmer', lazy='selectin')
+    products = db.relationship('Product', back_populates='farmer', cascade='all, delete-orphan')
+    farmer_orders = db.relationship('FarmerOrder', back_populates='farmer')
 
 
 class Buyer(BaseModel, UserMixin):
     __tablename__ = 'buyers'
     
-    orders = db.relationship('Order', back_populates='buyer', lazy='selectin')
+    orders = db.relationship('Order', back_populates='buyer')
 
 class Product(BaseModel):
     __tablename__ = 'products'
@@ -71,9 +85,38 @@ class Product(BaseModel):
         nullable=False
     )
     status = db.Column(product_status_enum, default='available', nullable=False)
+    # search document maintained by postgres, only used inside search queries
+    search_vector = db.deferred(db.Column(
+        TSVECTOR,
+        db.Computed(
+            "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(category, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'C')",
+            persisted=True
+        )
+    ))
+    
+    __table_args__ = (
+        db.Index('ix_products_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_products_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+    )
     
     farmer = db.relationship('Farmer', back_populates='products')
-    order_items = db.relationship('OrderItem', back_populates='product', lazy='selectin') 
+    order_items = db.relationship('OrderItem', back_populates='product') 
+
+# the trigram index on products.name needs the pg_trgm extension
+event.listen(
+    Product.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+def _items_unloaded(instance) -> bool:
+    # totals of stored rows whose items aren't loaded are summed by the database
+    # instead of loading every item just to add them up
+    state = inspect(instance)
+    return state.persistent and 'order_items' in state.unloaded
 
 class Order(BaseModel):
     __tablename__ = 'orders'
@@ -84,13 +127,22 @@ class Order(BaseModel):
     status = db.Column(order_status_enum, default='pending', nullable=False)
     
     buyer = db.relationship('Buyer', back_populates='orders')
-    order_items = db.relationship('OrderItem', back_populates='order', lazy='selectin', cascade='all, delete-orphan')
-    tracking = db.relationship('OrderTracking', back_populates='order', lazy='selectin', cascade='all, delete-orphan')
-    farmers_orders = db.relationship('FarmerOrder', back_populates='order', lazy='selectin', cascade='all, delete-orphan')
+    order_items = db.relationship('OrderItem', back_populates='order', cascade='all, delete-orphan')
+    tracking = db.relationship('OrderTracking', back_populates='order', cascade='all, delete-orphan')
+    farmers_orders = db.relationship('FarmerOrder', back_populates='order', cascade='all, delete-orphan')
     
-    @property
+    @hybrid_property
     def calculate_total_amount(self):
+        if _items_unloaded(self):
+            return object_session(self).scalar(select(Order.calculate_total_amount).where(Order.id == self.id))
         return sum(item.calculate_item_total for item in self.order_items)
+    
+    @calculate_total_amount.expression
+    def calculate_total_amount(cls):
+        return select(func.coalesce(func.sum(OrderItem.calculate_item_total), 0))\
+            .where(OrderItem.order_id == cls.id, OrderItem.created_at >= cls.created_at)\
+            .correlate_except(OrderItem)\
+            .scalar_subquery()
 
 class FarmerOrder(BaseModel):
     __tablename__ = 'farmer_orders'
@@ -100,19 +152,37 @@ class FarmerOrder(BaseModel):
     subtotal_amount = db.Column(db.Numeric(10, 2), nullable=False)
     status = db.Column(order_status_enum, default='pending', nullable=False)
     
+    __table_args__ = (
+        # farmer inbox filtered by status, and unfiltered, both newest first
+        db.Index('ix_farmer_orders_farmer_status_created', 'farmer_id', 'status', 'created_at'),
+        db.Index('ix_farmer_orders_farmer_created_id', 'farmer_id', 'created_at', 'id'),
+    )
+    
     order = db.relationship('Order', back_populates='farmers_orders')
     farmer = db.relationship('Farmer', back_populates='farmer_orders')
-    order_items = db.relationship('OrderItem', back_populates='farmer_order', lazy='selectin')
+    order_items = db.relationship('OrderItem', back_populates='farmer_order')
     
-    @property
+    @hybrid_property
     def calculate_subtotal(self):
+        if _items_unloaded(self):
+            return object_session(self).scalar(select(FarmerOrder.calculate_subtotal).where(FarmerOrder.id == self.id))
         return sum(item.calculate_item_total for item in self.order_items)
+    
+    @calculate_subtotal.expression
+    def calculate_subtotal(cls):
+        return select(func.coalesce(func.sum(OrderItem.calculate_item_total), 0))\
+            .where(OrderItem.farmer_order_id == cls.id, OrderItem.created_at >= cls.created_at)\
+            .correlate_except(OrderItem)\
+            .scalar_subquery()
 
 class OrderItem(BaseModel):
     __tablename__ = 'order_items'
     
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
-    farmer_order_id = db.Column(db.Integer, db.ForeignKey('farmer_orders.id', ondelete='CASCADE'), nullable=False)
+    # range partitioned by month on created_at (app/partitions.py), so the key has to include it
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    created_at = db.Column(db.DateTime, primary_key=True, default=lambda: datetime.now(timezone.utc))
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False, index=True)
+    farmer_order_id = db.Column(db.Integer, db.ForeignKey('farmer_orders.id', ondelete='CASCADE'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price_per_unit = db.Column(db.Numeric(10, 2), nullable=False)
@@ -121,16 +191,118 @@ class OrderItem(BaseModel):
     product = db.relationship('Product', back_populates='order_items')
     farmer_order = db.relationship('FarmerOrder', back_populates='order_items')
     
-    @property
+    __table_args__ = {'postgresql_partition_by': 'RANGE (created_at)'}
+    
+    @hybrid_property
     def calculate_item_total(self):
         return self.quantity * self.price_per_unit
 
 class OrderTracking(BaseModel):
     __tablename__ = 'order_tracking'
     
+    # range partitioned by month on created_at (app/partitions.py), so the key has to include it
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    created_at = db.Column(db.DateTime, primary_key=True, default=lambda: datetime.now(timezone.utc))
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
     status = db.Column(db.String(50), nullable=False)
     location = db.Column(db.String(200))
     notes = db.Column(db.Text)
     
+    # append only: events are never updated, the newest per order lives in order_tracking_latest
+    __table_args__ = (
+        db.Index('ix_order_tracking_order_created', 'order_id', 'created_at'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+    
     order = db.relationship('Order', back_populates='tracking')
+
+@event.listens_for(FarmerOrder, 'before_insert')
+@event.listens_for(OrderItem, 'before_insert')
+def _stamp_order_created_at(mapper, connection, target):
+    # farmer orders and line items share their order's created_at, so the
+    # order's timestamp tells which order_items partition holds its lines
+    order = inspect(target).attrs.order.loaded_value
+    if isinstance(order, Order) and order.created_at is not None:
+        target.created_at = order.created_at
+
+class OrderTrackingLatest(db.Model):
+    """
+    the most recent tracking event of each order, upserted on ingest
+    """
+    __tablename__ = 'order_tracking_latest'
+    
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), primary_key=True)
+    tracking_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    location = db.Column(db.String(200))
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+class OrderSummary(db.Model):
+    """
+    denormalized copy of an order as the buyer's order history shows it,
+    maintained by app.order_summaries whenever the order is written
+    """
+    __tablename__ = 'order_summaries'
+    
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), primary_key=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('buyers.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(order_status_enum, nullable=False)
+    document = db.Column(JSONB, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_order_summaries_buyer_created', 'buyer_id', 'created_at', 'order_id'),
+    )
+
+class FarmerStats(db.Model):
+    """
+    a farmer's sales in one month, by the month their farmer orders were
+    placed; maintained by app.farmer_stats
+    """
+    __tablename__ = 'farmer_stats'
+    
+    farmer_id = db.Column(db.Integer, db.ForeignKey('farmers.id', ondelete='CASCADE'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    products_sold = db.Column(db.BigInteger, default=0, nullable=False)
+    revenue = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+    pending_orders = db.Column(db.Integer, default=0, nullable=False)
+    delivered_orders = db.Column(db.Integer, default=0, nullable=False)
+
+class FarmerStatsTotals(db.Model):
+    """
+    a farmer's all-time dashboard figures; maintained by app.farmer_stats
+    """
+    __tablename__ = 'farmer_stats_totals'
+    
+    farmer_id = db.Column(db.Integer, db.ForeignKey('farmers.id', ondelete='CASCADE'), primary_key=True)
+    products_sold = db.Column(db.BigInteger, default=0, nullable=False)
+    revenue = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+    pending_orders = db.Column(db.Integer, default=0, nullable=False)
+    delivered_orders = db.Column(db.Integer, default=0, nullable=False)
+    active_listings = db.Column(db.Integer, default=0, nullable=False)
+
+class FarmerSalesDaily(db.Model):
+    """
+    a farmer's delivered sales of one product on one day (the day the farmer
+    order was placed); maintained by app.farmer_stats
+    """
+    __tablename__ = 'farmer_sales_daily'
+    
+    farmer_id = db.Column(db.Integer, db.ForeignKey('farmers.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    quantity = db.Column(db.BigInteger, default=0, nullable=False)
+    revenue = db.Column(db.Numeric(14, 2), default=0, nullable=False)
+    orders = db.Column(db.Integer, default=0, nullable=False)
+
+class AnalyticsRefresh(db.Model):
+    """
+    when each marketplace analytics view was last refreshed; written by app.analytics
+    """
+    __tablename__ = 'analytics_refreshes'
+    
+    view_name = db.Column(db.String(63), primary_key=True)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+    duration_ms = db.Column(db.Integer, nullable=False)
+    row_count = db.Column(db.BigInteger, nullable=False)
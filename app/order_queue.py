@@ -0,0 +1,318 @@
+"""
+asynchronous order placement
+
+at peak times buyers can hand their cart to a queue instead of holding a
+request open for the whole checkout: the endpoint only validates the cart
+shape, enqueues a job and answers 202 with a handle. workers drain the queue
+in batches and place each batch inside one transaction, locking every product
+the batch touches up front (in id order) with a single statement, then
+placing each job in its own savepoint so a rejected cart doesn't undo the
+rest of the batch. job status is kept in redis for the status endpoint.
+
+two queue backends are provided: an in-process queue served by worker
+threads (the default, also used to measure throughput in tests) and a redis
+list consumed by ``flask orders work`` processes. the in-process queue lives
+in memory, so jobs still queued when the process exits are lost and their
+status stays pending; production deployments should use the redis queue.
+
+a worker moves the jobs it takes into a processing list and removes them
+only once their status is written, so a worker that dies mid-batch leaves
+its jobs there for ``flask orders work --recover`` to put back; jobs whose
+final status was already written are skipped rather than placed twice. a
+job hitting a database error is queued again, up to ``MAX_ATTEMPTS`` times,
+and is then marked failed with ``retryable`` set, as is a batch a worker
+failed on for any other reason, so the buyer knows to submit it again.
+"""
+import json
+import os
+import queue
+import threading
+import uuid
+from typing import Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from .models import db
+from .extensions import cache, logger
+from .checkout import CheckoutError, lock_products, place_order
+from .caching import get_redis_client, invalidate_product_listings
+
+PENDING = 'pending'
+PLACED = 'placed'
+REJECTED = 'rejected'
+FAILED = 'failed'
+
+JOB_TTL = 86400
+MAX_ATTEMPTS = 3
+
+
+def job_key(handle: str) -> str:
+    return f"orders:job:{handle}"
+
+
+def get_job(handle: str) -> Optional[dict]:
+    return cache.get(job_key(handle))
+
+
+def _unfinished(jobs: List[dict]) -> List[dict]:
+    """
+    the jobs not yet placed or rejected, e.g. when recovered after a crash
+    """
+    stored = cache.get_many(*[job_key(job['handle']) for job in jobs])
+    return [job for job, record in zip(jobs, stored)
+            if not record or record.get('status') not in (PLACED, REJECTED)]
+
+
+def _set_job(job: dict, status: str, **fields):
+    cache.set(job_key(job['handle']), dict(
+        handle=job['handle'],
+        buyer_id=job['buyer_id'],
+        status=status,
+        **fields
+    ), timeout=JOB_TTL)
+
+
+class InProcessOrderQueue:
+    """
+    queue living in this process, drained by worker threads started on demand
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, job: dict):
+        self._queue.put(job)
+
+    def take(self, max_items: int, timeout: float) -> List[dict]:
+        try:
+            jobs = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(jobs) < max_items:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def ack(self, jobs: List[dict]):
+        pass
+
+
+class RedisOrderQueue:
+    """
+    queue kept in a redis list so any worker process can drain it
+    """
+
+    def __init__(self, client, name: str = 'orders:queue'):
+        self.client = client
+        self.name = name
+        self.processing = f"{name}:processing"
+
+    def put(self, job: dict):
+        self.client.lpush(self.name, json.dumps(job))
+
+    def take(self, max_items: int, timeout: float) -> List[dict]:
+        """
+        move up to ``max_items`` jobs into the processing list, where they stay until acked
+        """
+        first = self.client.blmove(self.name, self.processing, max(1, int(timeout)), 'RIGHT', 'LEFT')
+        if first is None:
+            return []
+        jobs = [json.loads(first)]
+        if max_items > 1:
+            pipeline = self.client.pipeline()
+            for _ in range(max_items - 1):
+                pipeline.lmove(self.name, self.processing, 'RIGHT', 'LEFT')
+            jobs.extend(json.loads(raw) for raw in pipeline.execute() if raw is not None)
+        return jobs
+
+    def ack(self, jobs: List[dict]):
+        # jobs are stored as written by put, so dumping them again gives the same member
+        pipeline = self.client.pipeline()
+        for job in jobs:
+            pipeline.lrem(self.processing, 1, json.dumps(job))
+        pipeline.execute()
+
+    def recover(self) -> int:
+        """
+        put jobs left in the processing list by dead workers back on the queue
+        only safe while no other worker is running
+        """
+        recovered = 0
+        while self.client.lmove(self.processing, self.name, 'RIGHT', 'RIGHT') is not None:
+            recovered += 1
+        return recovered
+
+    def __len__(self):
+        return self.client.llen(self.name)
+
+
+def process_batch(jobs: List[dict], order_queue=None) -> Dict[str, str]:
+    """
+    place a batch of queued orders in one transaction
+    returns the final status of every job by handle; jobs that hit a
+    database error are put back on ``order_queue`` while they have attempts left
+    """
+    jobs = _unfinished(jobs)
+    if not jobs:
+        return {}
+    outcomes = {}
+    categories = set()
+
+    try:
+        lock_products([product_id for job in jobs for product_id, _ in job['cart']])
+        for job in jobs:
+            savepoint = db.session.begin_nested()
+            try:
+                order, touched = place_order(job['buyer_id'], dict(job['cart']))
+                savepoint.commit()
+                outcomes[job['handle']] = (PLACED, {"order_id": order.id})
+                categories |= touched
+            except CheckoutError as e:
+                savepoint.rollback()
+                outcomes[job['handle']] = (REJECTED, {"error": e.payload, "status_code": e.status})
+        db.session.commit()
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        if len(jobs) > 1:
+            # retry one job per transaction so one bad order can't sink the batch
+            logger.error(f"order batch failed, retrying jobs one by one: {str(e)}")
+            return {handle: status for job in jobs for handle, status in process_batch([job], order_queue).items()}
+
+        # deadlocks, failovers and timeouts pass, so the job is tried again before giving up
+        job = jobs[0]
+        attempts = job.get('attempts', 1)
+        logger.error(f"failed to place queued order {job['handle']} (attempt {attempts}): {str(e)}")
+        if order_queue is not None and attempts < MAX_ATTEMPTS:
+            order_queue.put(dict(job, attempts=attempts + 1))
+            outcomes = {job['handle']: (PENDING, {"attempts": attempts + 1})}
+        else:
+            outcomes = {job['handle']: (FAILED, {"error": {"message": "failed to create order"}, "retryable": True})}
+
+    # the orders are committed by now: a failure below must not get them placed again
+    if categories:
+        invalidate_product_listings(categories)
+    for job in jobs:
+        status, fields = outcomes[job['handle']]
+        try:
+            _set_job(job, status, **fields)
+        except Exception as e:
+            logger.error(f"failed to record status {status} of queued order {job['handle']}: {str(e)}")
+    return {handle: status for handle, (status, _) in outcomes.items()}
+
+
+def _fail(jobs: List[dict]):
+    """
+    mark jobs of a batch that failed before committing as failed, so their buyers resubmit them
+    """
+    for job in jobs:
+        _set_job(job, FAILED, error={"message": "failed to create order"}, retryable=True)
+
+
+class OrderWorkerPool:
+    """
+    threads draining an order queue in batches, each inside an app context
+    """
+
+    def __init__(self, app, order_queue, workers: int = 2, batch_size: int = 20, poll_timeout: float = 1.0):
+        self.app = app
+        self.queue = order_queue
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def ensure_started(self):
+        # started lazily and per process, so forked gunicorn workers get their own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            for index in range(self.workers):
+                threading.Thread(target=self.run, name=f"order-worker-{index}", daemon=True).start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                try:
+                    jobs = self.queue.take(self.batch_size, self.poll_timeout)
+                except Exception as e:
+                    logger.error(f"order worker failed to read the queue: {str(e)}")
+                    self._stopping.wait(self.poll_timeout)
+                    continue
+                if not jobs:
+                    continue
+                try:
+                    process_batch(jobs, self.queue)
+                except Exception as e:
+                    logger.error(f"order worker failed on a batch: {str(e)}")
+                    db.session.rollback()
+                    try:
+                        _fail(jobs)
+                    except Exception as e:
+                        # left in the processing list for recovery
+                        logger.error(f"failed to record failed order batch: {str(e)}")
+                        continue
+                finally:
+                    db.session.remove()
+                try:
+                    self.queue.ack(jobs)
+                except Exception as e:
+                    logger.error(f"failed to acknowledge order batch: {str(e)}")
+
+
+def init_order_queue(app):
+    """
+    create the configured order queue and its worker pool
+    """
+    backend = app.config.get('ORDER_QUEUE_BACKEND', 'inprocess')
+    if backend == 'inprocess':
+        order_queue = InProcessOrderQueue()
+    elif backend == 'redis':
+        client = get_redis_client()
+        if client is None:
+            raise ValueError("the redis order queue needs a redis backed cache")
+        order_queue = RedisOrderQueue(client)
+    else:
+        raise ValueError(f"unknown order queue backend: {backend}")
+
+    app.extensions['order_queue'] = OrderWorkerPool(
+        app,
+        order_queue,
+        workers=app.config.get('ORDER_QUEUE_WORKERS', 2),
+        batch_size=app.config.get('ORDER_QUEUE_BATCH_SIZE', 20)
+    )
+    return app.extensions['order_queue']
+
+
+def enqueue_order(buyer_id: int, cart: Dict[int, int]) -> str:
+    """
+    queue a validated cart for placement and return its handle
+    """
+    pool = current_app.extensions['order_queue']
+    job = {
+        "handle": uuid.uuid4().hex,
+        "buyer_id": buyer_id,
+        "cart": sorted(cart.items())
+    }
+    _set_job(job, PENDING)
+    pool.queue.put(job)
+
+    # redis queues are drained by `flask orders work`, in-process ones by local threads
+    if isinstance(pool.queue, InProcessOrderQueue):
+        pool.ensure_started()
+    return job['handle']
@@ -0,0 +1,173 @@
+"""
+order history read model
+
+the buyer's order history used to be assembled from orders, order items,
+products and farmers on every request, with several lazy loads per line item.
+instead every order keeps a denormalized summary row (``order_summaries``)
+holding the json document the history endpoint returns, so a page of history
+is one indexed range scan on (buyer_id, created_at).
+
+summaries are rebuilt inside the same flush that writes an order, its items
+or its farmer orders, so they commit and roll back together with the order.
+line items are snapshots: renaming a product later doesn't rewrite the
+history, just like the price on the item. code that changes orders with
+set-based UPDATEs bypasses the flush and must call refresh_order_summaries
+itself.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import case, event, func, literal, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+
+from .models import db, Order, OrderItem, FarmerOrder, OrderSummary, Product, Farmer
+from .pagination import keyset_page
+
+HISTORY_SORT = (OrderSummary.created_at, OrderSummary.order_id)
+
+
+def _isoformat(column):
+    """
+    render a timestamp exactly like datetime.isoformat(): six fraction digits,
+    or none at all on a whole second
+    """
+    return case(
+        (func.date_trunc('second', column) == column, func.to_char(column, 'YYYY-MM-DD"T"HH24:MI:SS')),
+        else_=func.to_char(column, 'YYYY-MM-DD"T"HH24:MI:SS.US')
+    )
+
+
+def _summary_document():
+    """
+    jsonb document for the order in the enclosing select, shaped like the
+    order history response
+    """
+    item = func.jsonb_build_object(
+        'product_id', Product.id,
+        'product_name', Product.name,
+        'quantity', OrderItem.quantity,
+        'price_per_unit', OrderItem.price_per_unit,
+        'subtotal', OrderItem.quantity * OrderItem.price_per_unit,
+        'farmer_name', Farmer.first_name + literal(' ') + Farmer.last_name
+    )
+    items = select(func.coalesce(
+            func.jsonb_agg(aggregate_order_by(item, OrderItem.id)),
+            func.jsonb_build_array()
+        ))\
+        .select_from(OrderItem)\
+        .join(Product, Product.id == OrderItem.product_id)\
+        .outerjoin(Farmer, Farmer.id == Product.farmer_id)\
+        .where(OrderItem.order_id == Order.id, OrderItem.created_at >= Order.created_at)\
+        .scalar_subquery()
+
+    return func.jsonb_build_object(
+        'id', Order.id,
+        'total_amount', Order.total_amount,
+        'order_date', _isoformat(Order.created_at),
+        'delivery_date', _isoformat(Order.delivery_date),
+        'status', Order.status,
+        'items', items
+    )
+
+
+def refresh_statement(order_ids: Iterable[int]):
+    """
+    upsert the summaries of the given orders with a single INSERT ... SELECT
+    """
+    rows = select(Order.id, Order.buyer_id, Order.created_at, Order.status, _summary_document())\
+        .where(Order.id.in_(sorted(set(order_ids))), Order.buyer_id.isnot(None))
+
+    statement = insert(OrderSummary).from_select(
+        ['order_id', 'buyer_id', 'created_at', 'status', 'document'], rows)
+    return statement.on_conflict_do_update(
+        index_elements=[OrderSummary.order_id],
+        set_={
+            'buyer_id': statement.excluded.buyer_id,
+            'status': statement.excluded.status,
+            'document': statement.excluded.document
+        }
+    )
+
+
+def refresh_order_summaries(order_ids: Iterable[int], connection=None) -> None:
+    """
+    rebuild the summaries of the given orders from their current rows
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    (connection or db.session.connection()).execute(refresh_statement(order_ids))
+
+
+def rebuild_order_summaries(batch_size: int = 1000) -> int:
+    """
+    rebuild every summary, batch_size orders per statement
+    returns the number of orders processed
+    """
+    processed = 0
+    last_id = 0
+    while True:
+        order_ids = db.session.execute(
+            select(Order.id).where(Order.id > last_id).order_by(Order.id).limit(batch_size)
+        ).scalars().all()
+        if not order_ids:
+            return processed
+        refresh_order_summaries(order_ids)
+        db.session.commit()
+        processed += len(order_ids)
+        last_id = order_ids[-1]
+
+
+def install(session):
+    """
+    refresh the summary of every order written through the given session
+    """
+    @event.listens_for(session, 'after_flush')
+    def refresh_written_orders(session, flush_context):
+        order_ids = set()
+        for instance in list(session.new) + list(session.dirty):
+            if isinstance(instance, Order):
+                order_ids.add(instance.id)
+            elif isinstance(instance, (OrderItem, FarmerOrder)):
+                order_ids.add(instance.order_id)
+        order_ids.discard(None)
+
+        # core execution on the flush's connection, so this doesn't re-enter the flush
+        refresh_order_summaries(order_ids, session.connection())
+
+
+def init_order_summaries(app):
+    """
+    keep order summaries in sync with writes on the app's session
+    """
+    if not app.extensions.get('order_summaries'):
+        install(db.session)
+        app.extensions['order_summaries'] = True
+
+
+def load_order_history(buyer_id: int, page: int, per_page: int, cursor: Optional[str] = None) -> dict:
+    """
+    one page of a buyer's order history, newest first
+
+    with a cursor (empty for the first page) the page is fetched by keyset
+    over (created_at, order_id) and no count is run
+    """
+    query = OrderSummary.query.filter(OrderSummary.buyer_id == buyer_id)
+
+    if cursor is not None:
+        summaries, next_cursor = keyset_page(query, HISTORY_SORT, per_page, cursor=cursor)
+        return {
+            "orders": [summary.document for summary in summaries],
+            "per_page": per_page,
+            "next_cursor": next_cursor
+        }
+
+    pagination = query\
+        .order_by(*[column.desc() for column in HISTORY_SORT])\
+        .paginate(page=page, per_page=per_page)
+    return {
+        "orders": [summary.document for summary in pagination.items],
+        "page": pagination.page,
+        "per_page": pagination.per_page,
+        "total_pages": pagination.pages,
+        "total_items": pagination.total
+    }
@@ -0,0 +1,86 @@
+"""
+keyset (cursor) pagination helpers
+
+offset pagination gets slower the deeper a client pages and needs a full
+count on every request; keyset pagination instead seeks straight to the last
+row a client saw through an index on the sort columns, so every page costs
+the same no matter how far into the listing it is.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, Integer, Numeric, String, tuple_
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """
+    turn the sort key of the last row on a page into an opaque token
+    """
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: str, columns: Sequence) -> Tuple[Any, ...]:
+    """
+    decode a token produced by encode_cursor for the given sort columns
+    raises ValueError if the token is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError("invalid cursor")
+
+    decoded = []
+    for column, value in zip(columns, values):
+        if isinstance(column.type, DateTime):
+            try:
+                value = datetime.fromisoformat(value)
+            except (ValueError, TypeError):
+                raise ValueError("invalid cursor")
+        elif not _matches(column, value):
+            # a crafted token must not reach the query as a list, dict or the wrong type
+            raise ValueError("invalid cursor")
+        decoded.append(value)
+    return tuple(decoded)
+
+
+def _matches(column, value) -> bool:
+    """
+    whether a decoded cursor value has the type of the column it stands for
+    """
+    if isinstance(column.type, Integer):
+        # postgres compares integers up to bigint; larger ones fail the query
+        return type(value) is int and -2 ** 63 <= value < 2 ** 63
+    if isinstance(column.type, String):
+        return isinstance(value, str)
+    if isinstance(column.type, Numeric):
+        return type(value) in (int, float)
+    return type(value) in (str, int, float)
+
+
+def keyset_page(query, columns: Sequence, per_page: int, cursor: Optional[str] = None) -> Tuple[List[Any], Optional[str]]:
+    """
+    fetch one page of a query ordered descending by the given columns
+
+    the columns must form a unique sort key (e.g. created_at, id) and should be
+    backed by a composite index. returns the rows and the cursor for the next
+    page, or None when this is the last page.
+    """
+    if cursor:
+        query = query.filter(tuple_(*columns) < tuple_(*decode_cursor(cursor, columns)))
+
+    rows = query.order_by(*[column.desc() for column in columns]).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in columns])
+    return rows, next_cursor
@@ -0,0 +1,274 @@
+"""
+monthly range partitions of the order line tables
+
+``order_items`` and ``order_tracking`` are partitioned by ``created_at``, one
+partition per calendar month plus a default partition that catches rows no
+monthly partition covers yet. queries that bound ``created_at`` only touch
+the months they need, and old months can be detached or archived as a whole
+instead of deleted row by row.
+
+``orders`` and ``farmer_orders`` stay plain tables: every line table points
+at them, and a partitioned table's unique keys must include the partition
+key, so partitioning them would mean carrying ``created_at`` in every
+foreign key. their line items take the order's ``created_at`` when inserted
+(see app/models.py), so a line item is never older than its order and an
+order's ``created_at`` bounds where its items live. rows written before that
+may be stamped earlier than their order; align_created_at moves them up to
+it, and converting a table does so before copying its rows.
+
+partitions are named ``<table>_pYYYY_MM``; detached partitions are moved to
+the ``archive`` schema unless dropped.
+"""
+import re
+from datetime import date, datetime
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import event, text
+
+from .models import FarmerOrder, Order, OrderItem, OrderTracking
+
+PARTITIONED_TABLES = {
+    OrderItem.__tablename__: OrderItem.__table__,
+    OrderTracking.__tablename__: OrderTracking.__table__,
+}
+PARTITION_KEY = 'created_at'
+ARCHIVE_SCHEMA = 'archive'
+MONTHS_AHEAD = 3
+
+_PARTITION_NAME = re.compile(r'^(?P<table>\w+)_(p\d{4}_\d{2}|default)$')
+_BOUNDS = re.compile(r"FROM \('(?P<low>[^']+)'\) TO \('(?P<high>[^']+)'\)")
+
+
+class Partition(NamedTuple):
+    name: str
+    low: Optional[datetime]
+    high: Optional[datetime]
+    rows: int
+
+    @property
+    def is_default(self) -> bool:
+        return self.low is None
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def _check_table(table: str):
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"{table} is not a partitioned table")
+
+
+def list_partitions(connection, table: str) -> List[Partition]:
+    """
+    the partitions attached to table, oldest first and the default last
+    """
+    _check_table(table)
+    rows = connection.execute(text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid), child.reltuples::bigint
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_namespace ON pg_namespace.oid = parent.relnamespace
+        WHERE parent.relname = :table AND pg_namespace.nspname = current_schema()
+    """), {"table": table}).all()
+
+    partitions = []
+    for name, bounds, estimated_rows in rows:
+        match = _BOUNDS.search(bounds)
+        if match:
+            low, high = datetime.fromisoformat(match['low']), datetime.fromisoformat(match['high'])
+        else:
+            low = high = None
+        partitions.append(Partition(name, low, high, max(estimated_rows, 0)))
+    return sorted(partitions, key=lambda partition: (partition.low is None, partition.low or datetime.min))
+
+
+def create_partition(connection, table: str, month: date) -> bool:
+    """
+    create the partition of table for month unless it exists
+
+    rows for that month already sitting in the default partition are moved
+    into the new partition before it is attached, since postgres refuses to
+    attach a range the default partition still holds rows for.
+    returns whether a partition was created.
+    """
+    _check_table(table)
+    name = partition_name(table, month)
+    if connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return False
+
+    low, high = month, add_months(month, 1)
+    bounds = f"FOR VALUES FROM ('{low.isoformat()}') TO ('{high.isoformat()}')"
+    in_range = f"{PARTITION_KEY} >= '{low.isoformat()}' AND {PARTITION_KEY} < '{high.isoformat()}'"
+    default = f"{table}_default"
+
+    has_default = connection.execute(text("SELECT to_regclass(:name)"), {"name": default}).scalar() is not None
+    if has_default and connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})")).scalar():
+        connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        connection.execute(text(f"INSERT INTO {name} SELECT * FROM {default} WHERE {in_range}"))
+        connection.execute(text(f"DELETE FROM {default} WHERE {in_range}"))
+        connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} {bounds}"))
+    else:
+        connection.execute(text(f"CREATE TABLE {name} PARTITION OF {table} {bounds}"))
+    return True
+
+
+def ensure_partitions(connection, months_ahead: int = MONTHS_AHEAD, start: Optional[date] = None,
+                      tables=None) -> List[str]:
+    """
+    make sure every partitioned table has a default partition and monthly
+    partitions from start (the current month by default) to months_ahead
+    months from now; returns the names of the partitions created
+    """
+    current = month_start(datetime.utcnow())
+    first = month_start(start) if start else current
+    last = add_months(current, months_ahead)
+
+    created = []
+    for table in tables or PARTITIONED_TABLES:
+        _check_table(table)
+        default = f"{table}_default"
+        if connection.execute(text("SELECT to_regclass(:name)"), {"name": default}).scalar() is None:
+            connection.execute(text(f"CREATE TABLE {default} PARTITION OF {table} DEFAULT"))
+            created.append(default)
+
+        month = first
+        while month <= last:
+            if create_partition(connection, table, month):
+                created.append(partition_name(table, month))
+            month = add_months(month, 1)
+    return created
+
+
+def detach_partitions(connection, before: date, drop: bool = False, tables=None) -> List[str]:
+    """
+    detach every monthly partition that ends on or before ``before``
+
+    detached partitions are moved to the archive schema, where they stay
+    queryable as plain tables, or dropped with drop. returns their names.
+    """
+    if not drop:
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+
+    detached = []
+    for table in tables or PARTITIONED_TABLES:
+        for partition in list_partitions(connection, table):
+            if partition.is_default or partition.high.date() > before:
+                continue
+            connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition.name}"))
+            if drop:
+                connection.execute(text(f"DROP TABLE {partition.name}"))
+            else:
+                connection.execute(text(f"ALTER TABLE {partition.name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+            detached.append(partition.name)
+    return detached
+
+
+def is_partitioned(connection, table: str) -> bool:
+    return connection.execute(text("""
+        SELECT EXISTS (SELECT 1 FROM pg_partitioned_table
+                       JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid
+                       JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+                       WHERE pg_class.relname = :table AND pg_namespace.nspname = current_schema())
+    """), {"table": table}).scalar()
+
+
+# queries bound line items by their order's and farmer order's created_at, so no item may be older than either
+_ALIGNED_PARENTS = {
+    OrderItem.__tablename__: ((Order.__tablename__, 'order_id'), (FarmerOrder.__tablename__, 'farmer_order_id')),
+}
+
+
+def align_created_at(connection, table: str, source: Optional[str] = None) -> int:
+    """
+    raise the ``created_at`` of rows stamped before their parent orders to
+    the latest parent's, so the partition bounds used by the order queries
+    don't skip them; ``source`` is the table to update if not ``table``
+    itself. returns the number of rows changed
+    """
+    _check_table(table)
+    parents = _ALIGNED_PARENTS.get(table)
+    if not parents:
+        return 0
+    floor = f"greatest({', '.join(f'{parent}.{PARTITION_KEY}' for parent, _ in parents)})"
+    joins = ' AND '.join(f"{parent}.id = line.{column}" for parent, column in parents)
+    return connection.execute(text(
+        f"UPDATE {source or table} AS line SET {PARTITION_KEY} = {floor} "
+        f"FROM {', '.join(parent for parent, _ in parents)} "
+        f"WHERE {joins} AND line.{PARTITION_KEY} < {floor}")).rowcount
+
+
+def convert_to_partitioned(connection, table: str, months_ahead: int = MONTHS_AHEAD) -> int:
+    """
+    rebuild an existing plain table as a partitioned one, keeping its rows and ids
+
+    the old table is renamed out of the way (with its indexes and id
+    sequence), the partitioned table is created from the model, monthly
+    partitions are made for every month that has rows and the rows are
+    copied across, aligned with their orders' ``created_at`` first. meant to run inside a migration's transaction, e.g.
+    ``convert_to_partitioned(op.get_bind(), 'order_items')``; the table is
+    locked for the duration. returns the number of rows copied, or -1 if
+    the table was already partitioned.
+    """
+    _check_table(table)
+    if is_partitioned(connection, table):
+        return -1
+
+    legacy = f"{table}_legacy"
+    connection.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    for index_name, in connection.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :table AND schemaname = current_schema()"),
+            {"table": legacy}):
+        connection.execute(text(f"ALTER INDEX {index_name} RENAME TO {index_name}_legacy"))
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": legacy}).scalar()
+    if sequence:
+        connection.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {legacy}_id_seq"))
+
+    # creating the table fires _create_partitions below
+    PARTITIONED_TABLES[table].create(connection)
+
+    align_created_at(connection, table, source=legacy)
+    oldest = connection.execute(text(f"SELECT min({PARTITION_KEY}) FROM {legacy}")).scalar()
+    if oldest is not None:
+        ensure_partitions(connection, months_ahead=months_ahead, start=oldest, tables=[table])
+
+    columns = ', '.join(column.name for column in PARTITIONED_TABLES[table].columns)
+    copied = connection.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy}")).rowcount
+    connection.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce((SELECT max(id) FROM {table}), 0) + 1, false)"))
+    connection.execute(text(f"DROP TABLE {legacy}"))
+    return copied
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """
+    alembic autogenerate filter: partitions and archived tables aren't in
+    the models, so keep migrations from trying to drop them
+    """
+    if type_ == 'table' and reflected and compare_to is None:
+        match = _PARTITION_NAME.match(name)
+        if match and match['table'] in PARTITIONED_TABLES:
+            return False
+        if getattr(object, 'schema', None) == ARCHIVE_SCHEMA:
+            return False
+    return True
+
+
+def _create_partitions(target, connection, **kw):
+    if connection.dialect.name == 'postgresql':
+        ensure_partitions(connection, tables=[target.name])
+
+
+for _table in PARTITIONED_TABLES.values():
+    event.listen(_table, 'after_create', _create_partitions)
@@ -0,0 +1,173 @@
+"""
+password hashing service
+
+hashing and checking passwords is deliberately slow (scrypt by default), so
+running it on the request threads lets a burst of logins pin every worker
+on cpu and starve cheap reads like the catalog. instead hashes are computed
+on a bounded process pool of ``PASSWORD_HASH_WORKERS`` processes per app
+process, and at most ``PASSWORD_HASH_MAX_PENDING`` hashes may be queued or
+running at once; past that the caller gets ``PasswordHasherBusy``, which
+the auth endpoints answer with 503 and Retry-After instead of queueing
+without bound. ``PASSWORD_HASH_WORKERS=0`` hashes on the calling thread
+(tests and local development), still under the same limit.
+
+the work factor is the werkzeug method string in ``PASSWORD_HASH_METHOD``
+(e.g. ``scrypt:32768:8:1`` or ``pbkdf2:sha256:1000000``). stored hashes
+carry the method they were made with; a hash made with another method is
+replaced on the user's next successful login, so raising the work factor
+takes effect without resetting anyone's password.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# not the shared logger in .extensions: that module imports the models, which import this one
+logger = logging.getLogger(__name__)
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class PasswordHasherBusy(Exception):
+    """
+    raised when the hashing queue is full or a hash didn't finish in time
+    """
+    retry_after = 1
+
+
+def _method_of(password_hash: str) -> str:
+    return password_hash.split('$', 1)[0]
+
+
+def _canonical_method(method: str) -> str:
+    """
+    the method prefix werkzeug stores for hashes made with method, with the
+    defaults of a bare name ("scrypt", "pbkdf2") filled in the way it does
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == 'pbkdf2' and len(args) <= 2:
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"unsupported password hash method: {method}")
+
+
+class PasswordHasher:
+    """
+    hashes and checks passwords on a bounded process pool
+    """
+
+    def __init__(self, method: str = DEFAULT_METHOD, workers: int = 0, max_pending: int = 8,
+                 timeout: float = 10.0, start_method: str = 'spawn'):
+        self.configure(method, workers, max_pending, timeout, start_method)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def configure(self, method: str, workers: int, max_pending: int, timeout: float, start_method: str = 'spawn'):
+        self.method = method
+        # worked out here, so a bad PASSWORD_HASH_METHOD fails at startup
+        self._stored_method = _canonical_method(method)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.start_method = start_method
+
+    def executor(self) -> ProcessPoolExecutor:
+        # created lazily and per process, so forked gunicorn workers get their own pool
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(self.start_method)
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, function, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PasswordHasherBusy(f"{self._pending} password hashes already pending")
+            self._pending += 1
+        if not self.workers:
+            try:
+                return function(*args)
+            finally:
+                self._release()
+
+        try:
+            future = self.executor().submit(function, *args)
+        except Exception:
+            self._release()
+            raise
+        # a hash that timed out still occupies the pool until it finishes, so the
+        # slot is given back when the future is done (or cancelled), not when we stop waiting
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy(f"password hash took longer than {self.timeout:g}s")
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: Optional[str], password: str) -> bool:
+        if not password_hash:
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    @property
+    def stored_method(self) -> str:
+        """
+        the method prefix of hashes made now, worked out from the method
+        string so no request thread pays for a sample hash
+        """
+        return self._stored_method
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return _method_of(password_hash) != self.stored_method
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+
+password_hasher = PasswordHasher()
+
+
+def init_password_hasher(app):
+    """
+    apply the configured work factor, pool size and queue limit
+    """
+    workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+    password_hasher.shutdown()
+    password_hasher.configure(
+        method=app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        workers=workers,
+        max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING', max(workers, 1) * 4),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 10.0),
+        start_method=app.config.get('PASSWORD_HASH_START_METHOD', 'spawn')
+    )
+    logger.info(f"password hashing with {password_hasher.method} on {workers or 'no'} worker processes")
+    return password_hasher
@@ -0,0 +1,198 @@
+"""
+dashboard recent orders feed
+
+each farmer's most recent farmer orders are kept in redis as a capped sorted
+set (``dashboard:recent:<farmer id>``) of compact json summaries, scored by
+farmer order id, so the dashboard's recent orders widget is one ZREVRANGE.
+new farmer orders and status changes are pushed to the feed once their
+transaction commits; a status change replaces the summary with the same
+score.
+
+a feed is only trusted while it carries the ``~`` sentinel member, scored
++inf so it always comes back first. a feed without it (never built, evicted
+or expired) is rebuilt from one indexed query on farmer_orders under WATCH,
+so a push racing the rebuild makes the rebuild give up rather than be lost.
+"""
+import json
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+from redis.exceptions import RedisError, WatchError
+from sqlalchemy import event, inspect, literal, select
+
+from .models import db, Buyer, FarmerOrder, Order
+from .extensions import logger, current_transaction, descends_from
+from .caching import get_redis_client
+
+FEED_SIZE = 50
+FEED_TTL = 7 * 86400
+WARM = b'~'
+
+
+def feed_key(farmer_id: int) -> str:
+    return f"dashboard:recent:{farmer_id}"
+
+
+def _summaries():
+    return select(
+            FarmerOrder.id,
+            FarmerOrder.farmer_id,
+            FarmerOrder.order_id,
+            FarmerOrder.status,
+            FarmerOrder.subtotal_amount,
+            Order.created_at,
+            (Buyer.first_name + literal(' ') + Buyer.last_name).label('buyer_name')
+        )\
+        .join(Order, Order.id == FarmerOrder.order_id)\
+        .outerjoin(Buyer, Buyer.id == Order.buyer_id)
+
+
+def _entry(row) -> Tuple[int, int, bytes]:
+    """
+    (farmer id, score, member) for a summary row
+    """
+    summary = {
+        "farmer_order_id": row.id,
+        "order_id": row.order_id,
+        "order_date": row.created_at.isoformat(),
+        "total_amount": float(row.subtotal_amount),
+        "status": row.status,
+        "buyer_name": row.buyer_name or "Unknown"
+    }
+    return row.farmer_id, row.id, json.dumps(summary, separators=(',', ':')).encode()
+
+
+def queue_feed_updates(session, farmer_order_ids: Iterable[int], connection=None):
+    """
+    load the summaries of the given farmer orders and hold them until the
+    session's transaction commits
+    """
+    farmer_order_ids = sorted(set(farmer_order_ids))
+    if not farmer_order_ids:
+        return
+    rows = (connection or session.connection()).execute(_summaries().where(FarmerOrder.id.in_(farmer_order_ids)))
+    # remember the (innermost) transaction, so a rolled back savepoint takes its entries with it
+    transaction = current_transaction(session)
+    session.info.setdefault('recent_orders', []).extend((transaction, _entry(row)) for row in rows)
+
+
+def push_feed_updates(entries: List[Tuple[int, int, bytes]]):
+    """
+    add or replace summaries in their farmers' feeds, one pipeline for the batch
+    """
+    client = get_redis_client()
+    if client is None or not entries:
+        return
+    feeds = defaultdict(list)
+    for farmer_id, score, member in entries:
+        feeds[farmer_id].append((score, member))
+    try:
+        pipeline = client.pipeline(transaction=True)
+        for farmer_id, members in feeds.items():
+            key = feed_key(farmer_id)
+            for score, member in members:
+                pipeline.zremrangebyscore(key, score, score)
+                pipeline.zadd(key, {member: score})
+            # keep the sentinel and the FEED_SIZE newest summaries
+            pipeline.zremrangebyrank(key, 0, -(FEED_SIZE + 2))
+            pipeline.expire(key, FEED_TTL)
+        pipeline.execute()
+    except Exception as e:
+        # a missed push only leaves a feed stale until it expires or is dropped
+        logger.error(f"failed to update recent order feeds: {str(e)}")
+
+
+def load_feed_from_db(farmer_id: int, limit: int = FEED_SIZE) -> List[Tuple[int, int, bytes]]:
+    rows = db.session.execute(
+        _summaries()
+        .where(FarmerOrder.farmer_id == farmer_id)
+        .order_by(FarmerOrder.created_at.desc(), FarmerOrder.id.desc())
+        .limit(limit)
+    )
+    return [_entry(row) for row in rows]
+
+
+def rebuild_feed(farmer_id: int) -> List[bytes]:
+    """
+    rebuild the farmer's feed from the database; returns its members, newest first
+    """
+    client = get_redis_client()
+    if client is None:
+        return [member for _, _, member in load_feed_from_db(farmer_id)]
+
+    key = feed_key(farmer_id)
+    entries = None
+    try:
+        with client.pipeline(transaction=True) as pipeline:
+            # watched before the query, so anything pushed while it runs aborts the write
+            pipeline.watch(key)
+            entries = load_feed_from_db(farmer_id)
+            pipeline.multi()
+            pipeline.delete(key)
+            pipeline.zadd(key, {WARM: float('inf'), **{member: score for _, score, member in entries}})
+            pipeline.expire(key, FEED_TTL)
+            pipeline.execute()
+    except WatchError:
+        pass
+    except RedisError as e:
+        # the feed stays cold and the next read tries again; this one is served from the database
+        logger.error(f"failed to rebuild recent order feed: {str(e)}")
+    if entries is None:
+        entries = load_feed_from_db(farmer_id)
+    return [member for _, score, member in sorted(entries, key=lambda entry: entry[1], reverse=True)]
+
+
+def recent_orders(farmer_id: int, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    the farmer's newest farmer order summaries, from the feed when it is warm
+    """
+    limit = min(limit, FEED_SIZE)
+    client = get_redis_client()
+    members = None
+    if client is not None:
+        try:
+            members = client.zrevrange(feed_key(farmer_id), 0, limit)
+        except Exception as e:
+            logger.error(f"failed to read recent order feed: {str(e)}")
+            return [json.loads(member) for _, _, member in load_feed_from_db(farmer_id, limit)]
+
+    if members and members[0] == WARM:
+        members = members[1:]
+    else:
+        members = rebuild_feed(farmer_id)
+    return [json.loads(member) for member in members[:limit]]
+
+
+def install(session):
+    """
+    push farmer orders written through the given session to their feeds once they commit
+    """
+    @event.listens_for(session, 'after_flush')
+    def collect_feed_updates(session, flush_context):
+        farmer_order_ids = [
+            instance.id for instance in list(session.new) + list(session.dirty)
+            if isinstance(instance, FarmerOrder) and (
+                instance in session.new or inspect(instance).attrs.status.history.has_changes())
+        ]
+        queue_feed_updates(session, farmer_order_ids, session.connection())
+
+    @event.listens_for(session, 'after_commit')
+    def push_pending(session):
+        push_feed_updates([entry for _, entry in session.info.pop('recent_orders', [])])
+
+    @event.listens_for(session, 'after_soft_rollback')
+    def discard_pending(session, previous_transaction):
+        pending = session.info.get('recent_orders')
+        if pending:
+            session.info['recent_orders'] = [
+                (transaction, entry) for transaction, entry in pending
+                if not descends_from(transaction, previous_transaction)]
+
+
+def init_recent_orders(app):
+    """
+    keep the recent order feeds in sync with writes on the app's session
+    """
+    if not app.extensions.get('recent_orders'):
+        install(db.session)
+        app.extensions['recent_orders'] = True
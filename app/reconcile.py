@@ -0,0 +1,133 @@
+"""
+order total reconciliation
+
+checks the stored ``orders.total_amount`` and ``farmer_orders.subtotal_amount``
+against the sum of their line items. the line items of a whole id range are
+aggregated with one GROUP BY and compared with one join, so a batch costs
+one statement per table however many orders it covers; with fix, the same
+comparison drives a single UPDATE ... FROM per table and batch.
+
+the set-based UPDATE bypasses the flush hooks that keep the farmer stats
+rollup in step with subtotals, so a batch that corrects farmer orders also
+rebuilds the rollup of their farmers in the same transaction and drops
+their cached sales charts and dashboard stats once it commits.
+"""
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from sqlalchemy import func, select, update
+
+from .models import db, Order, FarmerOrder, OrderItem
+from .caching import bump_generations, tiered_cache
+from .extensions import logger
+from .dashboard_bundle import section_key
+from .farmer_stats import SALES_NAMESPACE, farmer_scope, rebuild_statements
+from .order_summaries import refresh_order_summaries
+
+
+@dataclass
+class ReconcileReport:
+    orders_checked: int = 0
+    farmer_orders_checked: int = 0
+    # (id, stored, expected)
+    order_mismatches: List[Tuple[int, object, object]] = field(default_factory=list)
+    farmer_order_mismatches: List[Tuple[int, object, object]] = field(default_factory=list)
+    fixed: bool = False
+
+    @property
+    def clean(self) -> bool:
+        return not self.order_mismatches and not self.farmer_order_mismatches
+
+
+def _mismatches(model, stored_column, item_key, low: int, high: int):
+    """
+    rows of model with ids in [low, high) whose stored total differs from
+    the sum of their line items, as a subquery of (id, stored, expected)
+    """
+    item_totals = select(item_key.label('parent_id'), func.sum(OrderItem.calculate_item_total).label('total'))\
+        .where(item_key >= low, item_key < high)\
+        .group_by(item_key)\
+        .subquery()
+    expected = func.coalesce(item_totals.c.total, 0)
+
+    return select(model.id.label('id'), stored_column.label('stored'), expected.label('expected'))\
+        .outerjoin(item_totals, item_totals.c.parent_id == model.id)\
+        .where(model.id >= low, model.id < high, stored_column != expected)\
+        .subquery()
+
+
+def _reconcile_range(model, stored_column, item_key, low: int, high: int, fix: bool):
+    mismatches = _mismatches(model, stored_column, item_key, low, high)
+    rows = db.session.execute(select(mismatches)).all()
+
+    if fix and rows:
+        db.session.execute(
+            update(model)
+            .where(model.id == mismatches.c.id)
+            .values({stored_column.key: mismatches.c.expected})
+            .execution_options(synchronize_session=False)
+        )
+    return [tuple(row) for row in rows]
+
+
+def _rebuild_farmer_stats(farmer_order_ids: List[int]) -> List[int]:
+    """
+    recompute the rollup of the farmers owning the given farmer orders
+    returns the farmer ids
+    """
+    farmer_ids = db.session.execute(
+        select(FarmerOrder.farmer_id).where(FarmerOrder.id.in_(farmer_order_ids)).distinct()
+    ).scalars().all()
+    for statement in rebuild_statements(farmer_ids):
+        db.session.execute(statement)
+    return farmer_ids
+
+
+def _invalidate_farmer_stats(farmer_ids: List[int]):
+    if not farmer_ids:
+        return
+    bump_generations(SALES_NAMESPACE, [farmer_scope(farmer_id) for farmer_id in farmer_ids])
+    try:
+        for farmer_id in farmer_ids:
+            tiered_cache.delete(section_key('stats', farmer_id, 0))
+    except Exception as e:
+        logger.error(f"failed to drop cached dashboard stats: {str(e)}")
+
+
+def reconcile_totals(batch_size: int = 10000, fix: bool = False) -> ReconcileReport:
+    """
+    compare stored totals with their line items, batch_size ids at a time
+
+    with fix, stored totals are overwritten with the line item sums and the
+    affected order summaries and farmer stats are rebuilt; each batch commits
+    on its own
+    """
+    report = ReconcileReport(fixed=fix)
+
+    checks = (
+        (Order, Order.total_amount, OrderItem.order_id, report.order_mismatches, 'orders_checked'),
+        (FarmerOrder, FarmerOrder.subtotal_amount, OrderItem.farmer_order_id, report.farmer_order_mismatches, 'farmer_orders_checked'),
+    )
+    for model, stored_column, item_key, mismatches, counter in checks:
+        low_id, high_id, count = db.session.execute(
+            select(func.min(model.id), func.max(model.id), func.count(model.id))).one()
+        setattr(report, counter, count)
+        if count == 0:
+            continue
+
+        for low in range(low_id, high_id + 1, batch_size):
+            found = _reconcile_range(model, stored_column, item_key, low, low + batch_size, fix)
+            farmer_ids = []
+            if fix and found and model is Order:
+                refresh_order_summaries([order_id for order_id, _, _ in found])
+            elif fix and found and model is FarmerOrder:
+                farmer_ids = _rebuild_farmer_stats([farmer_order_id for farmer_order_id, _, _ in found])
+            mismatches.extend(found)
+            # keep each batch's locks and snapshot short
+            if fix:
+                db.session.commit()
+                _invalidate_farmer_stats(farmer_ids)
+            else:
+                db.session.rollback()
+
+    return report
@@ -0,0 +1,191 @@
+"""
+farmer sales time series
+
+charts of a farmer's delivered sales per product or per category, in day,
+week or month buckets. the database only rolls the pre-aggregated daily rows
+of ``farmer_sales_daily`` (see app/farmer_stats.py) up into buckets with
+date_trunc, so a year is at most 365 rows per product whatever the order
+volume. filling empty buckets with zeros and the trailing moving averages
+are done with numpy on whole arrays rather than per point in python.
+
+results are cached per farmer and query under the farmer's ``sales``
+generation, which is bumped whenever their delivered sales change.
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Tuple
+
+import numpy as np
+from sqlalchemy import Date, cast, func, select
+
+from .models import db, FarmerSalesDaily, Product
+from .caching import get_or_compute, versioned_key
+from .farmer_stats import SALES_NAMESPACE, farmer_scope
+
+INTERVALS = ('day', 'week', 'month')
+GROUPS = ('product', 'category')
+DEFAULT_RANGE_DAYS = 90
+MAX_RANGE_DAYS = 3 * 366
+DEFAULT_WINDOWS = {'day': 7, 'week': 4, 'month': 3}
+MAX_WINDOW = 90
+CACHE_TIMEOUT = 3600
+
+
+def parse_series_args(args) -> Tuple[str, str, date, date, int]:
+    """
+    validate interval, group, start_date, end_date and window from a request's args
+    raises ValueError with a message fit for the client
+    """
+    interval = args.get('interval', 'day')
+    if interval not in INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(INTERVALS)}")
+
+    group = args.get('group', 'product')
+    if group not in GROUPS:
+        raise ValueError(f"group must be one of {', '.join(GROUPS)}")
+
+    try:
+        end_date = datetime.strptime(args['end_date'], '%Y-%m-%d').date() if args.get('end_date') else datetime.utcnow().date()
+        start_date = datetime.strptime(args['start_date'], '%Y-%m-%d').date() if args.get('start_date') \
+            else end_date - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    except ValueError:
+        raise ValueError("dates must be formatted as YYYY-MM-DD")
+    if start_date > end_date:
+        raise ValueError("start_date must not be after end_date")
+    if (end_date - start_date).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"a series can span at most {MAX_RANGE_DAYS} days")
+
+    window = args.get('window', DEFAULT_WINDOWS[interval])
+    try:
+        window = int(window)
+    except (TypeError, ValueError):
+        raise ValueError("window must be a number")
+    if window < 1 or window > MAX_WINDOW:
+        raise ValueError(f"window must be between 1 and {MAX_WINDOW}")
+
+    return interval, group, start_date, end_date, window
+
+
+def bucket_starts(start_date: date, end_date: date, interval: str) -> np.ndarray:
+    """
+    the first day of every bucket overlapping [start_date, end_date], as
+    date_trunc numbers them (weeks start on monday)
+    """
+    start, end = np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D')
+    if interval == 'day':
+        return np.arange(start, end + 1, dtype='datetime64[D]')
+    if interval == 'week':
+        monday = start - np.timedelta64(start_date.weekday(), 'D')
+        return np.arange(monday, end + 1, np.timedelta64(7, 'D'))
+    return np.arange(start.astype('datetime64[M]'), end.astype('datetime64[M]') + 1).astype('datetime64[D]')
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    trailing mean over the last window buckets along the last axis; the
+    first buckets average over the ones available so far
+    """
+    totals = np.cumsum(values, axis=-1)
+    totals[..., window:] = totals[..., window:] - totals[..., :-window]
+    counts = np.minimum(np.arange(1, values.shape[-1] + 1), window)
+    return totals / counts
+
+
+def _rounded(values: np.ndarray) -> list:
+    return np.round(values, 2).tolist()
+
+
+def compute_series(farmer_id: int, interval: str, group: str, start_date: date, end_date: date,
+                   window: int) -> Dict[str, Any]:
+    """
+    build the series from the database, bypassing the cache
+    """
+    bucket = cast(func.date_trunc(interval, FarmerSalesDaily.day), Date)
+    if group == 'product':
+        keys = (FarmerSalesDaily.product_id, Product.name)
+    else:
+        keys = (Product.category, Product.category)
+
+    rows = db.session.execute(
+        select(
+            bucket,
+            *keys,
+            func.sum(FarmerSalesDaily.quantity),
+            func.sum(FarmerSalesDaily.revenue),
+            func.sum(FarmerSalesDaily.orders)
+        )
+        .join(Product, Product.id == FarmerSalesDaily.product_id)
+        .where(
+            FarmerSalesDaily.farmer_id == farmer_id,
+            FarmerSalesDaily.day >= start_date,
+            FarmerSalesDaily.day <= end_date
+        )
+        .group_by(bucket, *keys)
+    ).all()
+
+    buckets = bucket_starts(start_date, end_date, interval)
+    labels = {}
+    for row in rows:
+        labels.setdefault(row[1], row[2])
+    series_keys = list(labels)
+    shape = (len(series_keys), len(buckets))
+    quantity, revenue, orders = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+
+    if rows:
+        # scatter every (bucket, key) total into its cell; buckets without sales stay zero
+        key_index = {key: index for index, key in enumerate(series_keys)}
+        rows_at = np.array([key_index[row[1]] for row in rows])
+        columns_at = np.searchsorted(buckets, np.array([row[0] for row in rows], dtype='datetime64[D]'))
+        np.add.at(quantity, (rows_at, columns_at), np.array([row[3] for row in rows], dtype=float))
+        np.add.at(revenue, (rows_at, columns_at), np.array([row[4] for row in rows], dtype=float))
+        np.add.at(orders, (rows_at, columns_at), np.array([row[5] for row in rows], dtype=float))
+
+    revenue_average = moving_average(revenue, window)
+    quantity_average = moving_average(quantity, window)
+    # biggest sellers first
+    ranking = np.argsort(-revenue.sum(axis=1), kind='stable')
+
+    return {
+        "interval": interval,
+        "group": group,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "window": window,
+        "buckets": [str(day) for day in buckets],
+        "series": [{
+            "key": series_keys[index],
+            "label": labels[series_keys[index]],
+            "quantity": quantity[index].astype(int).tolist(),
+            "revenue": _rounded(revenue[index]),
+            "orders": orders[index].astype(int).tolist(),
+            "quantity_moving_average": _rounded(quantity_average[index]),
+            "revenue_moving_average": _rounded(revenue_average[index]),
+            "total_quantity": int(quantity[index].sum()),
+            "total_revenue": round(float(revenue[index].sum()), 2)
+        } for index in ranking],
+        "totals": {
+            "quantity": quantity.sum(axis=0).astype(int).tolist(),
+            "revenue": _rounded(revenue.sum(axis=0)),
+            "revenue_moving_average": _rounded(moving_average(revenue.sum(axis=0), window))
+        }
+    }
+
+
+def sales_series(farmer_id: int, interval: str, group: str, start_date: date, end_date: date,
+                 window: int, cached: bool = True) -> Dict[str, Any]:
+    """
+    the farmer's sales series, served from the cache while their sales are unchanged
+    """
+    if not cached:
+        return compute_series(farmer_id, interval, group, start_date, end_date, window)
+
+    key = versioned_key(
+        SALES_NAMESPACE,
+        f"{farmer_id}:{interval}:{group}:{start_date.isoformat()}:{end_date.isoformat()}:{window}",
+        [farmer_scope(farmer_id)]
+    )
+    return get_or_compute(
+        key,
+        lambda: compute_series(farmer_id, interval, group, start_date, end_date, window),
+        timeout=CACHE_TIMEOUT,
+        namespace=SALES_NAMESPACE
+    )
@@ -0,0 +1,258 @@
+"""
+product search backends
+
+the catalog search is pluggable: production leans on a postgres full-text
+document (``products.search_vector``) plus a trigram index on the product name,
+while tests and local runs can use an in-process inverted index that offers
+the same ranking, prefix and typo tolerance without a postgres server.
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from flask import current_app
+from sqlalchemy import case, event, func, literal, or_
+
+from .models import db, Product
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    split free text into lowercase search tokens
+    """
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+class PostgresSearchBackend:
+    """
+    search backed by the generated tsvector column and the pg_trgm name index
+
+    every query token is matched as a prefix against the weighted search
+    document (name > category > description); misspelt terms still match
+    through trigram word similarity on the product name.
+    """
+
+    def __init__(self, text_config: str = 'simple'):
+        self.text_config = text_config
+
+    def apply(self, query, term: str, ranked: bool = True):
+        tokens = tokenize(term)
+        if not tokens:
+            return query
+
+        tsquery = func.to_tsquery(self.text_config, ' & '.join(f"{token}:*" for token in tokens))
+        phrase = ' '.join(tokens)
+
+        query = query.filter(or_(
+            Product.search_vector.op('@@')(tsquery),
+            literal(phrase).op('<%')(Product.name)
+        ))
+
+        if ranked:
+            rank = func.ts_rank_cd(Product.search_vector, tsquery) + func.word_similarity(phrase, Product.name)
+            query = query.order_by(rank.desc(), Product.id.desc())
+        return query
+
+
+class InMemorySearchBackend:
+    """
+    inverted index kept in process memory
+
+    postings are maintained from committed product writes, so the index never
+    sees rows from a rolled back transaction. lookups are by exact token,
+    prefix (bisect over the sorted vocabulary) and single-edit typos through a
+    deletion neighbourhood, so no lookup walks the whole catalog.
+    """
+
+    FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+    EXACT, PREFIX, FUZZY = 1.0, 0.7, 0.4
+    MIN_FUZZY_LENGTH = 4
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._documents: Dict[int, Set[str]] = {}
+        self._deletions: Dict[str, Set[str]] = defaultdict(set)
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self._loaded = False
+
+    @staticmethod
+    def _deletes(token: str) -> Set[str]:
+        return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+    def index_document(self, product_id: int, fields: Dict[str, str]):
+        with self._lock:
+            self.remove_document(product_id)
+            weights: Dict[str, float] = {}
+            for field, weight in self.FIELD_WEIGHTS.items():
+                for token in tokenize(fields.get(field)):
+                    weights[token] = max(weights.get(token, 0.0), weight)
+
+            for token, weight in weights.items():
+                if token not in self._postings:
+                    self._vocabulary_dirty = True
+                    for variant in self._deletes(token):
+                        self._deletions[variant].add(token)
+                self._postings[token][product_id] = weight
+            self._documents[product_id] = set(weights)
+
+    def remove_document(self, product_id: int):
+        with self._lock:
+            for token in self._documents.pop(product_id, ()):
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[token]
+                    self._vocabulary_dirty = True
+                    for variant in self._deletes(token):
+                        self._deletions[variant].discard(token)
+
+    def rebuild(self):
+        """
+        reload every product from the database into a fresh index
+        """
+        rows = db.session.query(Product.id, Product.name, Product.category, Product.description).all()
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._deletions.clear()
+            self._vocabulary_dirty = True
+            for row in rows:
+                self.index_document(row.id, {
+                    'name': row.name,
+                    'category': row.category,
+                    'description': row.description
+                })
+            self._loaded = True
+
+    def _expand(self, token: str) -> Iterable[Tuple[str, float]]:
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+
+        if token in self._postings:
+            yield token, self.EXACT
+
+        position = bisect_left(self._vocabulary, token)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(token):
+            candidate = self._vocabulary[position]
+            if candidate != token:
+                yield candidate, self.PREFIX
+            position += 1
+
+        if len(token) >= self.MIN_FUZZY_LENGTH and token not in self._postings:
+            candidates = set(self._deletions.get(token, ()))
+            for variant in self._deletes(token):
+                if variant in self._postings:
+                    candidates.add(variant)
+                candidates |= self._deletions.get(variant, set())
+            for candidate in candidates:
+                yield candidate, self.FUZZY
+
+    def search(self, term: str) -> List[Tuple[int, float]]:
+        """
+        rank products matching every token of the term, best match first
+        """
+        tokens = tokenize(term)
+        if not tokens:
+            return []
+
+        with self._lock:
+            scores: Dict[int, float] = {}
+            for position, token in enumerate(tokens):
+                token_scores: Dict[int, float] = {}
+                for candidate, quality in self._expand(token):
+                    for product_id, weight in self._postings[candidate].items():
+                        token_scores[product_id] = max(token_scores.get(product_id, 0.0), weight * quality)
+
+                if position == 0:
+                    scores = token_scores
+                else:
+                    scores = {
+                        product_id: score + token_scores[product_id]
+                        for product_id, score in scores.items() if product_id in token_scores
+                    }
+                if not scores:
+                    return []
+
+        return sorted(scores.items(), key=lambda hit: (-hit[1], -hit[0]))
+
+    def apply(self, query, term: str, ranked: bool = True):
+        if not tokenize(term):
+            return query
+        if not self._loaded:
+            self.rebuild()
+
+        product_ids = [product_id for product_id, _ in self.search(term)]
+        if not product_ids:
+            return query.filter(db.false())
+
+        query = query.filter(Product.id.in_(product_ids))
+        if ranked:
+            ordering = case({product_id: rank for rank, product_id in enumerate(product_ids)}, value=Product.id)
+            query = query.order_by(ordering)
+        return query
+
+    def install(self, session):
+        """
+        keep the index in sync with committed product writes on the given session
+        """
+        @event.listens_for(session, 'after_flush')
+        def collect_changes(session, flush_context):
+            changes = session.info.setdefault('search_changes', {})
+            for instance in list(session.new) + list(session.dirty):
+                if isinstance(instance, Product) and instance.id is not None:
+                    changes[instance.id] = {
+                        'name': instance.name,
+                        'category': instance.category,
+                        'description': instance.description
+                    }
+            for instance in session.deleted:
+                if isinstance(instance, Product):
+                    changes[instance.id] = None
+
+        @event.listens_for(session, 'after_commit')
+        def apply_changes(session):
+            for product_id, fields in session.info.pop('search_changes', {}).items():
+                if fields is None:
+                    self.remove_document(product_id)
+                else:
+                    self.index_document(product_id, fields)
+
+        @event.listens_for(session, 'after_soft_rollback')
+        def discard_changes(session, previous_transaction):
+            if previous_transaction.parent is None:
+                session.info.pop('search_changes', None)
+
+
+SEARCH_BACKENDS = {
+    'postgres': PostgresSearchBackend,
+    'memory': InMemorySearchBackend
+}
+
+
+def init_search(app):
+    """
+    create the configured search backend and attach it to the app
+    """
+    name = app.config.get('SEARCH_BACKEND', 'postgres')
+    try:
+        backend = SEARCH_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"unknown search backend: {name}")
+
+    if isinstance(backend, InMemorySearchBackend):
+        backend.install(db.session)
+    app.extensions['search'] = backend
+    return backend
+
+
+def get_search_backend():
+    return current_app.extensions['search']
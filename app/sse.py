@@ -0,0 +1,257 @@
+"""
+server-sent event stream of order changes
+
+``GET /api/v1/events`` keeps a connection open per client and relays the
+events app/events.py publishes for the authenticated buyer or farmer. it is
+a small asgi app mounted next to the flask app (see asgi.py) rather than a
+flask view, so an idle connection is one parked coroutine instead of a
+blocked worker thread.
+
+every process holds a single redis pub/sub connection shared by all of its
+streams: a channel is subscribed when its first local client connects and
+unsubscribed when the last one leaves, and each message is framed once and
+handed to the matching clients' queues. clients too slow to keep up are
+disconnected (EventSource reconnects on its own) instead of buffering
+without bound. streams also end when the access token expires, so a client
+reconnects with a fresh one.
+"""
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Set
+from urllib.parse import parse_qs
+
+import redis.asyncio as aioredis
+from flask_jwt_extended import decode_token, get_unverified_jwt_headers
+from flask_jwt_extended.internal_utils import verify_token_not_blocklisted
+
+from .events import user_channel
+from .extensions import logger
+
+EVENTS_PATH = '/api/v1/events'
+ROLES = ('buyer', 'farmer')
+
+
+def format_event(message: bytes) -> bytes:
+    """
+    frame a published event as an sse message, using its id and type
+    """
+    try:
+        payload = json.loads(message)
+        header = f"id: {payload['id']}\nevent: {payload['type']}\n"
+    except (ValueError, KeyError, TypeError):
+        header = ''
+    data = message.decode() if isinstance(message, bytes) else message
+    return f"{header}data: {data}\n\n".encode()
+
+
+class Subscriber:
+    """
+    one open stream: a bounded queue of framed events
+    """
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, frame: bytes):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Broker:
+    """
+    the per-process redis subscription shared by every open stream
+    """
+
+    def __init__(self, redis_url: str):
+        self.redis_url = redis_url
+        self._client = None
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._subscribers: Dict[str, Set[Subscriber]] = defaultdict(set)
+
+    async def subscribe(self, channel: str, subscriber: Subscriber):
+        async with self._get_lock():
+            if self._pubsub is None:
+                self._client = aioredis.from_url(self.redis_url)
+                self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            if not self._subscribers.get(channel):
+                await self._pubsub.subscribe(channel)
+            self._subscribers[channel].add(subscriber)
+            if self._reader is None:
+                self._reader = asyncio.create_task(self._read())
+
+    async def unsubscribe(self, channel: str, subscriber: Subscriber):
+        async with self._get_lock():
+            subscribers = self._subscribers.get(channel)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[channel]
+                try:
+                    await self._pubsub.unsubscribe(channel)
+                except Exception as e:
+                    logger.error(f"failed to unsubscribe from {channel}: {str(e)}")
+
+    @property
+    def connections(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            await self._client.aclose()
+            self._pubsub = self._client = None
+        self._subscribers.clear()
+
+    def _get_lock(self) -> asyncio.Lock:
+        # created on first use so it binds to the server's event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _read(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                channel = message['channel'].decode() if isinstance(message['channel'], bytes) else message['channel']
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    frame = format_event(message['data'])
+                    for subscriber in list(subscribers):
+                        subscriber.offer(frame)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # redis-py resubscribes on reconnect; events published meanwhile are lost
+                logger.error(f"event stream subscription failed, retrying: {str(e)}")
+                await asyncio.sleep(1)
+
+
+class EventStream:
+    """
+    asgi app serving the sse endpoint for the given flask app's users
+    """
+
+    def __init__(self, flask_app, broker: Optional[Broker] = None):
+        self.flask_app = flask_app
+        self.broker = broker or Broker(flask_app.config.get('REDIS_URL'))
+        self.keepalive = flask_app.config.get('SSE_KEEPALIVE', 15)
+        self.queue_size = flask_app.config.get('SSE_QUEUE_SIZE', 100)
+        self.retry_ms = flask_app.config.get('SSE_RETRY_MS', 5000)
+
+    def authenticate(self, scope) -> Optional[dict]:
+        """
+        decode the access token from the Authorization header, the ``token``
+        query parameter (EventSource can't set headers) or the jwt cookie;
+        refresh tokens and revoked tokens are refused like protected views do.
+        blocking (the blocklist lookup), so __call__ runs it in a thread
+        """
+        # latin-1 maps every byte, so a malformed header is a bad token rather than an error
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope.get('headers', [])}
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        config = self.flask_app.config
+
+        token = None
+        if headers.get('authorization', '').startswith('Bearer '):
+            token = headers['authorization'][len('Bearer '):]
+        elif query.get('token'):
+            token = query['token'][0]
+        elif 'cookie' in headers:
+            cookie_name = config.get('JWT_ACCESS_COOKIE_NAME', 'access_token_cookie')
+            for part in headers['cookie'].split(';'):
+                name, _, value = part.strip().partition('=')
+                if name == cookie_name:
+                    token = value
+        if not token:
+            return None
+
+        try:
+            with self.flask_app.app_context():
+                decoded = decode_token(token)
+                if decoded.get('type') != 'access':
+                    return None
+                verify_token_not_blocklisted(get_unverified_jwt_headers(token), decoded)
+        except Exception:
+            return None
+
+        identity = decoded.get(config.get('JWT_IDENTITY_CLAIM', 'sub'))
+        if not isinstance(identity, dict) or identity.get('role') not in ROLES:
+            return None
+        return {"id": identity['id'], "role": identity['role'], "exp": decoded.get('exp')}
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            return await self._json(scope, send, 405, {"error": "method not allowed"})
+
+        # the blocklist loader may hit redis or the database, so keep it off the event loop
+        identity = await asyncio.to_thread(self.authenticate, scope)
+        if identity is None:
+            return await self._json(scope, send, 401, {"error": "a valid access token is required"})
+
+        channel = user_channel(identity['role'], identity['id'])
+        subscriber = Subscriber(self.queue_size)
+        await self.broker.subscribe(channel, subscriber)
+        disconnected = asyncio.create_task(self._wait_for_disconnect(receive))
+
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': self._headers(scope, [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ])
+            })
+            await send({'type': 'http.response.body', 'body': f"retry: {self.retry_ms}\n: connected\n\n".encode(), 'more_body': True})
+
+            while not disconnected.done() and not subscriber.overflowed:
+                if identity['exp'] and time.time() >= identity['exp']:
+                    break
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    frame = b": keepalive\n\n"
+                if not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except OSError:
+            # the client went away mid-write
+            pass
+        finally:
+            disconnected.cancel()
+            await self.broker.unsubscribe(channel, subscriber)
+
+    @staticmethod
+    async def _wait_for_disconnect(receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    def _headers(self, scope, headers):
+        # mirror the credentialed cors policy the flask app applies to its routes
+        origin = dict(scope.get('headers', [])).get(b'origin')
+        if origin:
+            headers += [(b'access-control-allow-origin', origin), (b'access-control-allow-credentials', b'true'), (b'vary', b'Origin')]
+        return headers
+
+    async def _json(self, scope, send, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': self._headers(scope, [(b'content-type', b'application/json')])})
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,172 @@
+"""
+order tracking ingest
+
+couriers push location and status pings for many orders at once. a batch is
+validated in one pass, checked against the orders table with one query and
+written with one multi-row insert into the append-only ``order_tracking``
+table. the newest event per order is upserted into ``order_tracking_latest``
+in the same transaction, so "where is my order" is a primary key lookup
+instead of a scan over the event history. the upsert only moves forward in
+time, so late or replayed pings can't overwrite a newer status. the newest
+event of each order is also pushed to its buyer and farmers (app/events.py).
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .models import db, Order, FarmerOrder, OrderTracking, OrderTrackingLatest
+from .events import make_event, queue_events, user_channel
+
+STATUS_MAX_LENGTH = 50
+LOCATION_MAX_LENGTH = 200
+
+
+def _parse_timestamp(value: Any) -> datetime:
+    """
+    parse an iso 8601 event time into the naive utc the tables store
+    """
+    if not isinstance(value, str):
+        raise ValueError("timestamp must be an ISO 8601 string")
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def validate_events(events: Any) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    check the shape of every event in one pass
+
+    returns the rows ready to insert and the rejected events as
+    {"index", "error"} entries; timestamps default to the time of ingest
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows, rejected = [], []
+
+    for index, event in enumerate(events):
+        if not isinstance(event, dict):
+            rejected.append({"index": index, "error": "event must be an object"})
+            continue
+
+        order_id = event.get('order_id')
+        status = event.get('status')
+        location = event.get('location')
+        notes = event.get('notes')
+
+        if not isinstance(order_id, int) or isinstance(order_id, bool):
+            error = "invalid order id"
+        elif not isinstance(status, str) or not status.strip() or len(status) > STATUS_MAX_LENGTH:
+            error = f"status must be a non-empty string of at most {STATUS_MAX_LENGTH} characters"
+        elif location is not None and (not isinstance(location, str) or len(location) > LOCATION_MAX_LENGTH):
+            error = f"location must be a string of at most {LOCATION_MAX_LENGTH} characters"
+        elif notes is not None and not isinstance(notes, str):
+            error = "notes must be a string"
+        else:
+            error = None
+
+        if error is None:
+            try:
+                created_at = _parse_timestamp(event['timestamp']) if event.get('timestamp') is not None else now
+            except ValueError:
+                error = "timestamp must be an ISO 8601 string"
+
+        if error:
+            rejected.append({"index": index, "error": error})
+            continue
+
+        rows.append({
+            "index": index,
+            "order_id": order_id,
+            "status": status.strip().lower(),
+            "location": location,
+            "notes": notes,
+            "created_at": created_at,
+            "updated_at": now
+        })
+
+    return rows, rejected
+
+
+def ingest_events(rows: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    write validated events and refresh the latest status of their orders
+
+    events for orders that don't exist are rejected. returns the number of
+    events written and the rejected ones; the caller commits.
+    """
+    order_ids = {row['order_id'] for row in rows}
+    buyers = dict(db.session.execute(select(Order.id, Order.buyer_id).where(Order.id.in_(order_ids))).all())
+
+    rejected = [{"index": row['index'], "error": f"order {row['order_id']} not found"}
+                for row in rows if row['order_id'] not in buyers]
+    rows = [row for row in rows if row['order_id'] in buyers]
+    if not rows:
+        return 0, rejected
+
+    record_events(rows, buyers)
+    return len(rows), rejected
+
+
+def record_events(rows: List[Dict[str, Any]], buyers: Dict[int, int], notify: bool = True) -> None:
+    """
+    insert tracking rows for existing orders, move their latest status
+    forward and, with notify, queue the change for their buyer and farmers
+
+    rows carry order_id, status, location, notes, created_at and updated_at;
+    buyers maps every order id in rows to its buyer id.
+    """
+    columns = ('order_id', 'status', 'location', 'notes', 'created_at', 'updated_at')
+    inserted = db.session.execute(
+        insert(OrderTracking).returning(OrderTracking.id, sort_by_parameter_order=True),
+        [{column: row[column] for column in columns} for row in rows]
+    ).scalars().all()
+
+    # newest event per order in this batch; ties go to the later event in the batch
+    latest = {}
+    for tracking_id, row in zip(inserted, rows):
+        current = latest.get(row['order_id'])
+        if current is None or row['created_at'] >= current['created_at']:
+            latest[row['order_id']] = {
+                "order_id": row['order_id'],
+                "tracking_id": tracking_id,
+                "status": row['status'],
+                "location": row['location'],
+                "notes": row['notes'],
+                "created_at": row['created_at']
+            }
+
+    # executemany, so the statement compiles once whatever the batch size
+    statement = pg_insert(OrderTrackingLatest)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[OrderTrackingLatest.order_id],
+        set_={
+            'tracking_id': statement.excluded.tracking_id,
+            'status': statement.excluded.status,
+            'location': statement.excluded.location,
+            'notes': statement.excluded.notes,
+            'created_at': statement.excluded.created_at
+        },
+        where=statement.excluded.created_at >= OrderTrackingLatest.created_at
+    ), sorted(latest.values(), key=lambda row: row['order_id']))
+
+    if not notify:
+        return
+
+    # let the buyer and the farmers of each order know, once this commits
+    farmers = defaultdict(list)
+    for order_id, farmer_id in db.session.execute(
+            select(FarmerOrder.order_id, FarmerOrder.farmer_id).where(FarmerOrder.order_id.in_(latest))):
+        farmers[order_id].append(farmer_id)
+
+    events = []
+    for order_id, row in latest.items():
+        channels = [user_channel('farmer', farmer_id) for farmer_id in farmers[order_id]]
+        if buyers[order_id] is not None:
+            channels.append(user_channel('buyer', buyers[order_id]))
+        events.append((channels, make_event(
+            'tracking', order_id=order_id, status=row['status'], location=row['location'],
+            timestamp=row['created_at'].isoformat())))
+    queue_events(db.session(), events)
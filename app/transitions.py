@@ -0,0 +1,182 @@
+"""
+farmer order status transitions
+
+a farmer moves many farmer orders to a new status in one request, in a fixed
+number of statements however many orders are involved:
+
+1. the parent orders are row-locked in id order, so concurrent transitions
+   touching the same order serialize instead of deadlocking, and each sees
+   the other's farmer order statuses when it recomputes the parent
+2. one guarded UPDATE moves every farmer order whose current status allows
+   the transition; anything it didn't match is explained by a single lookup
+3. one UPDATE ... FROM (aggregate) recomputes the parent orders' status from
+   all of their farmer orders
+4. tracking rows for every change go in with one multi-row insert; clients
+   are told through the farmer_order.status event rather than a second
+   tracking event
+
+order summaries, the farmer stats rollup, recent order feeds and change
+events are maintained here, since set-based statements bypass the ORM
+flush hooks.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, cast, func, select, update
+from sqlalchemy.orm import aliased
+
+from .models import db, Order, FarmerOrder, OrderItem, order_status_enum
+from .events import make_event, queue_events, user_channel
+from .farmer_stats import StatsChanges
+from .order_summaries import refresh_order_summaries
+from .recent_orders import queue_feed_updates
+from .tracking import record_events
+
+# target status -> statuses a farmer order may move to it from
+TRANSITIONS = {
+    'delivered': ('pending',),
+    'canceled': ('pending',),
+    'refunded': ('pending', 'delivered'),
+}
+
+
+class TransitionError(Exception):
+    """
+    a transition request that can't be applied at all
+    """
+
+
+def order_status_from_farmer_orders():
+    """
+    the status an order takes from its farmer orders: pending while any of
+    them is, otherwise delivered if any was delivered, then refunded, and
+    canceled only when every farmer order was
+    """
+    return cast(case(
+        (func.bool_or(FarmerOrder.status == 'pending'), 'pending'),
+        (func.bool_or(FarmerOrder.status == 'delivered'), 'delivered'),
+        (func.bool_or(FarmerOrder.status == 'refunded'), 'refunded'),
+        else_='canceled'
+    ), order_status_enum)
+
+
+def recompute_order_status(order_ids, now: datetime) -> List[Tuple[int, Optional[int], str]]:
+    """
+    set the status of the given orders from their farmer orders with one UPDATE
+    returns (order id, buyer id, status) for the orders whose status changed
+    """
+    derived = select(FarmerOrder.order_id, order_status_from_farmer_orders().label('status'))\
+        .where(FarmerOrder.order_id.in_(order_ids))\
+        .group_by(FarmerOrder.order_id)\
+        .subquery()
+
+    statement = update(Order)\
+        .where(Order.id == derived.c.order_id, Order.status != derived.c.status)\
+        .values(status=derived.c.status, updated_at=now)\
+        .returning(Order.id, Order.buyer_id, Order.status)\
+        .execution_options(synchronize_session=False)
+    return [tuple(row) for row in db.session.execute(statement)]
+
+
+def transition_farmer_orders(farmer_id: int, farmer_order_ids: List[int], status: str,
+                             notes: Optional[str] = None, location: Optional[str] = None
+                             ) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """
+    move the farmer's farmer orders to ``status`` inside the current transaction
+
+    returns the ids that moved and the rejected ones as {"id", "error"}
+    entries; the caller commits. raises TransitionError for an unknown target.
+    """
+    if status not in TRANSITIONS:
+        raise TransitionError(f"farmer orders can't be moved to {status}")
+
+    ids = sorted(set(farmer_order_ids))
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    buyers = dict(db.session.execute(
+        select(Order.id, Order.buyer_id)
+        .where(Order.id.in_(select(FarmerOrder.order_id).where(FarmerOrder.id.in_(ids), FarmerOrder.farmer_id == farmer_id)))
+        .order_by(Order.id)
+        .with_for_update()
+    ).all())
+
+    # the rows as they were before the update, with their item quantities, for the stats rollup;
+    # the parent order locks above keep them from changing underneath
+    before = aliased(FarmerOrder)
+    previous = select(
+            before.id,
+            before.status,
+            select(func.coalesce(func.sum(OrderItem.quantity), 0))
+            .where(OrderItem.farmer_order_id == before.id, OrderItem.created_at >= before.created_at)
+            .scalar_subquery()
+            .label('quantity')
+        )\
+        .where(before.id.in_(ids), before.farmer_id == farmer_id)\
+        .subquery()
+
+    moved = db.session.execute(
+        update(FarmerOrder)
+        .where(
+            FarmerOrder.id == previous.c.id,
+            FarmerOrder.status.in_(TRANSITIONS[status])
+        )
+        .values(status=status, updated_at=now)
+        .returning(FarmerOrder.id, FarmerOrder.order_id, FarmerOrder.created_at, FarmerOrder.subtotal_amount,
+                   previous.c.status.label('previous_status'), previous.c.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    rejected = []
+    if len(moved) < len(ids):
+        moved_ids = {row.id for row in moved}
+        current = dict(db.session.execute(
+            select(FarmerOrder.id, FarmerOrder.status)
+            .where(FarmerOrder.id.in_(set(ids) - moved_ids), FarmerOrder.farmer_id == farmer_id)
+        ).all())
+        for farmer_order_id in ids:
+            if farmer_order_id in moved_ids:
+                continue
+            if farmer_order_id not in current:
+                error = "farmer order not found"
+            else:
+                error = f"can't move from {current[farmer_order_id]} to {status}"
+            rejected.append({"id": farmer_order_id, "error": error})
+
+    if not moved:
+        return [], rejected
+
+    order_ids = sorted({row.order_id for row in moved})
+    changed_orders = recompute_order_status(order_ids, now)
+
+    stats = StatsChanges()
+    for row in moved:
+        stats.farmer_order(farmer_id, row.created_at, row.previous_status, status,
+                           quantity=row.quantity, subtotal=row.subtotal_amount, farmer_order_id=row.id)
+    stats.apply()
+
+    record_events([{
+        "order_id": row.order_id,
+        "status": status,
+        "location": location,
+        "notes": notes or f"farmer order {row.id} marked {status}",
+        "created_at": now,
+        "updated_at": now
+    } for row in moved], buyers, notify=False)
+
+    refresh_order_summaries([order_id for order_id, _, _ in changed_orders])
+    queue_feed_updates(db.session(), [row.id for row in moved])
+
+    events = []
+    for row in moved:
+        channels = [user_channel('farmer', farmer_id)]
+        if buyers.get(row.order_id) is not None:
+            channels.append(user_channel('buyer', buyers[row.order_id]))
+        events.append((channels, make_event(
+            'farmer_order.status', order_id=row.order_id, farmer_order_id=row.id, status=status)))
+    for order_id, buyer_id, order_status in changed_orders:
+        if buyer_id is not None:
+            events.append(([user_channel('buyer', buyer_id)], make_event(
+                'order.status', order_id=order_id, status=order_status)))
+    queue_events(db.session(), events)
+
+    return [row.id for row in moved], rejected
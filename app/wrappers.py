@@ -1,5 +1,6 @@
+import hmac
 from functools import wraps
-from flask import session, abort,jsonify
+from flask import session, abort, jsonify, request, current_app
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 
 def farmer_required(function):
@@ -22,6 +23,29 @@ def buyer_required(function):
         return function(*args, **kwargs)
     return wrapper
 
+def courier_required(function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        # couriers are integrations, not users: they authenticate with a shared api key
+        api_key = request.headers.get('X-API-Key', '')
+        # compared as bytes: compare_digest refuses non-ascii strings
+        if not api_key or not any(hmac.compare_digest(api_key.encode(), key.encode())
+                                  for key in current_app.config.get('COURIER_API_KEYS', [])):
+            return jsonify({"error": "courier api key required"}), 401
+        return function(*args, **kwargs)
+    return wrapper
+
+def admin_required(function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        # operations tooling, not a user role: authenticated with a shared api key like couriers
+        api_key = request.headers.get('X-API-Key', '')
+        if not api_key or not any(hmac.compare_digest(api_key.encode(), key.encode())
+                                  for key in current_app.config.get('ADMIN_API_KEYS', [])):
+            return jsonify({"error": "admin api key required"}), 401
+        return function(*args, **kwargs)
+    return wrapper
+
 def login_is_required(function):
     @wraps(function)
     def wrapper(*args, **kwargs):
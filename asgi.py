@@ -0,0 +1,37 @@
+"""
+asgi entry point
+
+serves the flask app (through a wsgi adapter) together with the server-sent
+event stream, which needs a native asgi handler to hold thousands of idle
+connections cheaply:
+
+    uvicorn asgi:application
+    hypercorn asgi:application
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from app.app import app
+from app.sse import EVENTS_PATH, EventStream
+
+flask_application = WsgiToAsgi(app)
+event_stream = EventStream(app)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await event_stream.broker.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        await event_stream(scope, receive, send)
+    else:
+        await flask_application(scope, receive, send)
@@ -0,0 +1,80 @@
+"""
+checkout latency during analytics refreshes
+
+seeds order history, then places orders through POST /api/v1/orders/create
+twice: on a quiet database and while another thread refreshes the analytics
+views back to back. concurrent refreshes take no locks checkout waits on,
+so no checkout should stall for the length of a refresh; what difference
+remains is the refresh competing for cpu and i/o, which on a shared box
+(or with the database on the same host) shows up in every percentile.
+the refresh durations are reported alongside.
+
+usage:
+    DATABASE_URI=postgresql://.../scratch REDIS_URL=redis://... python -m benchmarks.analytics_refresh
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.fixtures import load_app, ensure_schema, seed_farmers, seed_buyers, seed_products, auth_header
+from benchmarks.order_history import seed_orders
+
+
+def checkouts(app, headers, product_ids, rounds: int):
+    client = app.test_client()
+    timings = []
+    for index in range(rounds):
+        items = [{"product_id": product_ids[(index + offset) % len(product_ids)], "quantity": 1} for offset in range(3)]
+        started = time.perf_counter()
+        response = client.post('/api/v1/orders/create', json={"items": items}, headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 201:
+            raise SystemExit(f"checkout failed: {response.status_code} {response.get_data(as_text=True)}")
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95) - 1], timings[-1]
+
+
+def run(app, orders: int, rounds: int):
+    from app.analytics import refresh_views
+
+    with app.app_context():
+        ensure_schema()
+        farmer_ids = seed_farmers(20)
+        product_ids = seed_products(farmer_ids, per_farmer=10, amount_available=10 ** 7)
+        buyer_id = seed_buyers(1)[0]
+        seed_orders(buyer_id, product_ids, orders, items_per_order=3)
+        headers = auth_header(buyer_id, 'buyer')
+        refresh_views()
+
+    print(f"{'phase':<22} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    print(f"{'quiet':<22} " + ' '.join(f"{value:>8.1f}" for value in checkouts(app, headers, product_ids, rounds)))
+
+    stopping = threading.Event()
+    durations = []
+
+    def refresher():
+        with app.app_context():
+            while not stopping.is_set():
+                started = time.perf_counter()
+                results = refresh_views()
+                if any('error' in result for result in results):
+                    raise SystemExit(f"refresh failed: {results}")
+                durations.append((time.perf_counter() - started) * 1000)
+
+    thread = threading.Thread(target=refresher, daemon=True)
+    thread.start()
+    try:
+        print(f"{'refreshing':<22} " + ' '.join(f"{value:>8.1f}" for value in checkouts(app, headers, product_ids, rounds)))
+    finally:
+        stopping.set()
+        thread.join()
+    print(f"{len(durations)} full refreshes during the run, {sum(durations) / max(len(durations), 1):.0f} ms each on average")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=200)
+    arguments = parser.parse_args()
+    run(load_app(arguments.database_uri), arguments.orders, arguments.rounds)
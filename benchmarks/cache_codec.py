@@ -0,0 +1,87 @@
+"""
+compare the pickle cache path with the compact json codec
+
+for catalog pages of increasing size this reports the stored value size and
+the latency of a cache hit up to a ready response body:
+
+- pickle:  unpickle the cached dict, then json-encode it (what jsonify does)
+- compact: decode the cached envelope holding the pre-encoded json body
+
+usage:
+    python -m benchmarks.cache_codec [--redis-url redis://localhost:6379/15]
+
+with --redis-url the round trip through a real redis server is included.
+"""
+import argparse
+import json
+import random
+import string
+import time
+import timeit
+
+from cachelib.serializers import RedisSerializer
+
+from app.codec import CompactSerializer
+
+
+def make_page(size: int) -> dict:
+    random.seed(size)
+    words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(400)]
+    products = [{
+        "id": index,
+        "name": ' '.join(random.choices(words, k=3)).title(),
+        "description": ' '.join(random.choices(words, k=40)),
+        "price": round(random.uniform(10, 5000), 2),
+        "amount": random.randint(0, 1000),
+        "category": random.choice(['vegetables', 'fruits', 'grains', 'dairy', 'poultry']),
+        "seller": f"{random.choice(words).title()} {random.choice(words).title()}"
+    } for index in range(size)]
+    return {"products": products, "page": 1, "per_page": size, "total_pages": 40, "total_items": 40 * size}
+
+
+def envelope(value) -> dict:
+    return {'value': value, 'delta': 0.012, 'expires_at': time.time() + 300}
+
+
+def encode_body(payload: dict) -> str:
+    # mirrors flask's default json provider outside debug mode
+    return json.dumps(payload, separators=(',', ':'), sort_keys=True)
+
+
+def run(sizes, repeat: int, redis_url: str = None):
+    pickle_codec = RedisSerializer()
+    compact_codec = CompactSerializer()
+    client = None
+    if redis_url:
+        import redis
+        client = redis.Redis.from_url(redis_url)
+
+    print(f"{'items':>6} {'codec':>8} {'bytes':>9} {'hit us':>9}")
+    for size in sizes:
+        payload = make_page(size)
+        candidates = {
+            'pickle': (pickle_codec.dumps(envelope(payload)),
+                       lambda raw: encode_body(pickle_codec.loads(raw)['value'])),
+            'compact': (compact_codec.dumps(envelope(encode_body(payload))),
+                        lambda raw: compact_codec.loads(raw)['value'])
+        }
+
+        for name, (stored, hit) in candidates.items():
+            if client is not None:
+                key = f"bench:codec:{name}:{size}"
+                client.set(key, stored)
+                fetch = lambda key=key, hit=hit: hit(client.get(key))
+            else:
+                fetch = lambda stored=stored, hit=hit: hit(stored)
+
+            best = min(timeit.repeat(fetch, number=repeat, repeat=5)) / repeat
+            print(f"{size:>6} {name:>8} {len(stored):>9} {best * 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[12, 48, 200])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--redis-url', default=None)
+    arguments = parser.parse_args()
+    run(arguments.sizes, arguments.repeat, arguments.redis_url)
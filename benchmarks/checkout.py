@@ -0,0 +1,51 @@
+"""
+checkout latency against cart size
+
+places orders of increasing cart size through POST /api/v1/orders/create and
+reports latency percentiles and the number of sql statements per checkout,
+which should stay flat as the cart grows.
+
+usage:
+    DATABASE_URI=postgresql://.../scratch REDIS_URL=redis://... python -m benchmarks.checkout
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.fixtures import load_app, ensure_schema, seed_farmers, seed_buyers, seed_products, auth_header
+
+
+def run(app, sizes, rounds: int):
+    from app.loading import count_statements
+
+    with app.app_context():
+        ensure_schema()
+        farmer_ids = seed_farmers(10)
+        product_ids = seed_products(farmer_ids, per_farmer=max(sizes) // 10 + 1, amount_available=10 ** 7)
+        headers = auth_header(seed_buyers(1)[0], 'buyer')
+
+    client = app.test_client()
+    print(f"{'cart':>5} {'p50 ms':>8} {'p95 ms':>8} {'statements':>10}")
+    for size in sizes:
+        items = [{"product_id": product_id, "quantity": 1} for product_id in product_ids[:size]]
+        timings = []
+        for _ in range(rounds):
+            with app.app_context(), count_statements() as counter:
+                started = time.perf_counter()
+                response = client.post('/api/v1/orders/create', json={"items": items}, headers=headers)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 201:
+                raise SystemExit(f"checkout failed: {response.status_code} {response.get_data(as_text=True)}")
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{size:>5} {statistics.median(timings):>8.2f} {p95:>8.2f} {counter.count:>10}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 10, 30, 60])
+    parser.add_argument('--rounds', type=int, default=30)
+    arguments = parser.parse_args()
+    run(load_app(arguments.database_uri), arguments.sizes, arguments.rounds)
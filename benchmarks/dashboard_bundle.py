@@ -0,0 +1,87 @@
+"""
+dashboard load: three requests vs the bundle
+
+loads a farmer's dashboard the way the frontend used to (stats, recent
+orders and available products as three sequential requests) and through
+GET /api/dashboard/bundle, with the response caches cleared before every
+round (cold) and kept (warm), and reports latency and the per-section
+timings of the bundle. the recent orders feed stays warm throughout, as it
+does in production.
+
+usage:
+    DATABASE_URI=postgresql://.../scratch REDIS_URL=redis://... python -m benchmarks.dashboard_bundle
+"""
+import argparse
+import statistics
+import time
+from collections import defaultdict
+
+from benchmarks.fixtures import load_app, ensure_schema, seed_farmers, seed_buyers, seed_products, auth_header
+from benchmarks.order_history import seed_orders
+
+SEPARATE = ('/api/dashboard/stats', '/api/dashboard/recent-orders', '/api/dashboard/available-products')
+
+
+def run(app, orders: int, products: int, rounds: int):
+    from app.caching import tiered_cache
+    from app.extensions import cache
+    from app.farmer_stats import rebuild_farmer_stats
+
+    with app.app_context():
+        ensure_schema()
+        farmer_id = seed_farmers(1)[0]
+        product_ids = seed_products([farmer_id], per_farmer=products)
+        seed_orders(seed_buyers(1)[0], product_ids, orders, items_per_order=2)
+        rebuild_farmer_stats()
+        headers = auth_header(farmer_id, 'farmer')
+
+    client = app.test_client()
+
+    def clear():
+        with app.app_context():
+            cache.clear()
+            tiered_cache.clear_local()
+
+    def separate():
+        for path in SEPARATE:
+            if client.get(path, headers=headers).status_code != 200:
+                raise SystemExit(f"{path} failed")
+
+    def bundle():
+        response = client.get('/api/dashboard/bundle', headers=headers)
+        if response.status_code != 200 or 'errors' in response.get_json():
+            raise SystemExit(f"bundle failed: {response.get_data(as_text=True)}")
+        return response.get_json()['timings']
+
+    print(f"{'mode':<18} {'p50 ms':>8} {'p95 ms':>8}")
+    sections = defaultdict(list)
+    for label, function, cold in (('separate cold', separate, True), ('bundle cold', bundle, True),
+                                  ('separate warm', separate, False), ('bundle warm', bundle, False)):
+        function()
+        timings = []
+        for _ in range(rounds):
+            if cold:
+                clear()
+            started = time.perf_counter()
+            result = function()
+            timings.append((time.perf_counter() - started) * 1000)
+            if label == 'bundle cold':
+                for name, timing in result.items():
+                    if name != 'total_ms':
+                        sections[name].append(timing['ms'])
+        timings.sort()
+        print(f"{label:<18} {statistics.median(timings):>8.1f} {timings[int(len(timings) * 0.95) - 1]:>8.1f}")
+
+    print("cold bundle sections (median ms, loaded side by side):")
+    for name, values in sections.items():
+        print(f"  {name:<20} {statistics.median(values):>6.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=50)
+    arguments = parser.parse_args()
+    run(load_app(arguments.database_uri), arguments.orders, arguments.products, arguments.rounds)
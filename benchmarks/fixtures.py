@@ -0,0 +1,94 @@
+"""
+shared setup for the benchmark scripts
+
+the scripts run against the database in DATABASE_URI (point it at a scratch
+postgres database, never production) and the redis in REDIS_URL. tables are
+created if missing and every run seeds its own uniquely named users, so runs
+don't collide with each other.
+"""
+import os
+import uuid
+from decimal import Decimal
+from typing import List, Optional
+
+
+def load_app(database_uri: Optional[str] = None):
+    """
+    import the flask app, optionally pointing it at another database first
+    """
+    if database_uri:
+        os.environ['DATABASE_URI'] = database_uri
+    os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+
+    from app.app import app
+    app.config['TESTING'] = True
+    return app
+
+
+def ensure_schema():
+    from app.models import db, order_status_enum
+
+    order_status_enum.create(db.engine, checkfirst=True)
+    db.create_all()
+
+
+def _suffix() -> str:
+    return uuid.uuid4().hex[:10]
+
+
+def _phone() -> str:
+    return f"07{uuid.uuid4().int % 10 ** 10:010d}"
+
+
+def seed_farmers(count: int) -> List[int]:
+    from app.models import db, Farmer
+
+    farmers = [Farmer(
+        first_name='Bench',
+        last_name=f"Farmer{index}",
+        phone_number=_phone(),
+        email=f"farmer-{_suffix()}@bench.local",
+        password_hash='!'
+    ) for index in range(count)]
+    db.session.add_all(farmers)
+    db.session.commit()
+    return [farmer.id for farmer in farmers]
+
+
+def seed_buyers(count: int) -> List[int]:
+    from app.models import db, Buyer
+
+    buyers = [Buyer(
+        first_name='Bench',
+        last_name=f"Buyer{index}",
+        phone_number=_phone(),
+        email=f"buyer-{_suffix()}@bench.local",
+        password_hash='!'
+    ) for index in range(count)]
+    db.session.add_all(buyers)
+    db.session.commit()
+    return [buyer.id for buyer in buyers]
+
+
+def seed_products(farmer_ids: List[int], per_farmer: int, amount_available: int = 10_000) -> List[int]:
+    from app.models import db, Product
+
+    categories = ['vegetables', 'fruits', 'grains', 'dairy', 'poultry']
+    products = [Product(
+        name=f"Bench produce {farmer_id}-{index}",
+        description='benchmark listing',
+        price_per_unit=Decimal('12.50'),
+        amount_available=amount_available,
+        category=categories[index % len(categories)],
+        farmer_id=farmer_id
+    ) for farmer_id in farmer_ids for index in range(per_farmer)]
+    db.session.add_all(products)
+    db.session.commit()
+    return [product.id for product in products]
+
+
+def auth_header(user_id: int, role: str) -> dict:
+    from flask_jwt_extended import create_access_token
+
+    token = create_access_token(identity={'id': user_id, 'role': role})
+    return {'Authorization': f"Bearer {token}"}
@@ -0,0 +1,132 @@
+"""
+login throughput per core
+
+many threads log buyers in through POST /api/v1/login/buyer for a fixed
+time while one more thread keeps reading the catalog. this runs once with
+passwords checked on the request threads (0 workers) and once for each
+process pool size. it reports logins per second overall and per core,
+how many logins were turned away with 503 by the queue limit, and the
+catalog read latency during the burst, which shows whether logins starve
+other requests. it also checks that a login with an outdated hash
+upgrades the stored hash to the configured work factor.
+
+usage:
+    DATABASE_URI=postgresql://.../scratch REDIS_URL=redis://... python -m benchmarks.login
+"""
+import argparse
+import os
+import threading
+import time
+from collections import Counter
+
+from benchmarks.fixtures import load_app, ensure_schema, seed_buyers, seed_farmers, seed_products
+
+PASSWORD = 'Bench-password-1!'
+
+
+def seed_credentials(buyer_ids, password_hash: str):
+    from app.models import db, Buyer
+
+    Buyer.query.filter(Buyer.id.in_(buyer_ids)).update({Buyer.password_hash: password_hash}, synchronize_session=False)
+    db.session.commit()
+    return [email for email, in db.session.query(Buyer.email).filter(Buyer.id.in_(buyer_ids))]
+
+
+def check_rehash(app, client, email: str):
+    from werkzeug.security import generate_password_hash
+    from app.models import db, Buyer
+    from app.passwords import password_hasher
+
+    with app.app_context():
+        Buyer.query.filter_by(email=email).update({Buyer.password_hash: generate_password_hash(PASSWORD, 'pbkdf2:sha256:1000')})
+        db.session.commit()
+    response = client.post('/api/v1/login/buyer', json={"identifier": email, "password": PASSWORD})
+    with app.app_context():
+        stored = Buyer.query.filter_by(email=email).first().password_hash
+    upgraded = response.status_code == 200 and not password_hasher.needs_rehash(stored)
+    print(f"outdated hash upgraded on login: {'yes' if upgraded else 'NO'} ({stored.split('$')[0]})")
+    return upgraded
+
+
+def burst(app, emails, threads: int, seconds: float):
+    statuses = Counter()
+    reads = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def login(index: int):
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            response = client.post('/api/v1/login/buyer', json={"identifier": emails[index % len(emails)], "password": PASSWORD})
+            with lock:
+                statuses[response.status_code] += 1
+            if response.status_code == 503:
+                # back off as a well behaved client would
+                time.sleep(float(response.headers.get('Retry-After', 1)))
+
+    def read_catalog():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            client.get('/api/v1/products/category/grains')
+            reads.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.01)
+
+    workers = [threading.Thread(target=login, args=(index,)) for index in range(threads)]
+    workers.append(threading.Thread(target=read_catalog))
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    reads.sort()
+    return statuses, elapsed, reads[len(reads) // 2], reads[int(len(reads) * 0.95) - 1]
+
+
+def run(app, pools, threads: int, seconds: float, method: str):
+    from app.passwords import password_hasher
+
+    cores = os.cpu_count() or 1
+    with app.app_context():
+        ensure_schema()
+        seed_products(seed_farmers(1), per_farmer=10)
+        buyer_ids = seed_buyers(threads)
+        password_hasher.configure(method=method, workers=0, max_pending=threads, timeout=10.0)
+        emails = seed_credentials(buyer_ids, password_hasher.hash(PASSWORD))
+
+    client = app.test_client()
+    upgraded = check_rehash(app, client, emails[0])
+
+    print(f"{cores} cores, {method}, {threads} login threads for {seconds:g}s each")
+    print(f"{'workers':>7} {'logins/s':>9} {'per core':>9} {'503s':>6} {'catalog p50 ms':>15} {'p95 ms':>8}")
+    for workers in pools:
+        password_hasher.shutdown()
+        password_hasher.configure(method=method, workers=workers, max_pending=max(workers, 1) * 4, timeout=10.0)
+        if workers:
+            # start the pool's processes before timing
+            for _ in range(workers):
+                password_hasher.executor().submit(int).result()
+
+        statuses, elapsed, read_p50, read_p95 = burst(app, emails, threads, seconds)
+        logins = statuses[200] / elapsed
+        unexpected = {status: count for status, count in statuses.items() if status not in (200, 503)}
+        if unexpected:
+            raise SystemExit(f"unexpected login responses: {unexpected}")
+        print(f"{workers:>7} {logins:>9.1f} {logins / cores:>9.1f} {statuses[503]:>6} {read_p50:>15.1f} {read_p95:>8.1f}")
+    password_hasher.shutdown()
+    return upgraded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--pools', default=None, help='comma separated pool sizes (default: 0,1,... up to the core count)')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--method', default='scrypt:32768:8:1', help='werkzeug hash method, i.e. the work factor')
+    arguments = parser.parse_args()
+    pools = [int(size) for size in arguments.pools.split(',')] if arguments.pools \
+        else sorted({0, 1, *range(2, (os.cpu_count() or 1) + 1, 2)})
+    if not run(load_app(arguments.database_uri), pools, arguments.threads, arguments.seconds, arguments.method):
+        raise SystemExit(1)
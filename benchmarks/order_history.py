@@ -0,0 +1,127 @@
+"""
+order history latency for a buyer with thousands of orders
+
+seeds one buyer with many multi-item orders and times a page of history
+assembled from the order tables (the previous implementation) against the
+same page served from the order_summaries read model, at the first, middle
+and last page, plus a full walk of the history with cursors.
+
+usage:
+    DATABASE_URI=postgresql://.../scratch REDIS_URL=redis://... python -m benchmarks.order_history
+"""
+import argparse
+import statistics
+import time
+from decimal import Decimal
+
+from benchmarks.fixtures import load_app, ensure_schema, seed_farmers, seed_buyers, seed_products
+
+
+def seed_orders(buyer_id: int, product_ids, orders: int, items_per_order: int, batch: int = 500):
+    from app.models import db, Order, FarmerOrder, OrderItem, Product
+
+    products = {product.id: product for product in Product.query.filter(Product.id.in_(product_ids))}
+    for start in range(0, orders, batch):
+        for index in range(start, min(start + batch, orders)):
+            order = Order(buyer_id=buyer_id, total_amount=Decimal('0'), status='pending')
+            farmer_orders = {}
+            for offset in range(items_per_order):
+                product = products[product_ids[(index + offset * 7) % len(product_ids)]]
+                farmer_order = farmer_orders.get(product.farmer_id)
+                if farmer_order is None:
+                    farmer_order = FarmerOrder(order=order, farmer_id=product.farmer_id, subtotal_amount=Decimal('0'))
+                    farmer_orders[product.farmer_id] = farmer_order
+                OrderItem(order=order, farmer_order=farmer_order, product_id=product.id,
+                          quantity=1, price_per_unit=product.price_per_unit)
+                farmer_order.subtotal_amount += product.price_per_unit
+                order.total_amount += product.price_per_unit
+            db.session.add(order)
+        db.session.commit()
+
+
+def legacy_page(buyer_id: int, page: int, per_page: int) -> dict:
+    from app.models import Order
+    from app.loading import ORDER_DETAIL
+
+    pagination = Order.query.options(*ORDER_DETAIL)\
+        .filter_by(buyer_id=buyer_id)\
+        .order_by(Order.created_at.desc(), Order.id.desc())\
+        .paginate(page=page, per_page=per_page)
+    return {
+        "orders": [{
+            "id": order.id,
+            "total_amount": float(order.total_amount),
+            "order_date": order.created_at.isoformat(),
+            "delivery_date": order.delivery_date.isoformat() if order.delivery_date else None,
+            "status": order.status,
+            "items": [{
+                "product_id": item.product.id,
+                "product_name": item.product.name,
+                "quantity": item.quantity,
+                "price_per_unit": float(item.price_per_unit),
+                "subtotal": float(item.quantity * item.price_per_unit),
+                "farmer_name": item.product.farmer.full_name if item.product.farmer else None
+            } for item in order.order_items]
+        } for order in pagination.items],
+        "total_pages": pagination.pages
+    }
+
+
+def normalized(orders):
+    # order_items has no defined order on the relationship, so compare item sets
+    return [dict(order, items=sorted(order['items'], key=lambda item: item['product_id'])) for order in orders]
+
+
+def measure(function, repeat: int):
+    from app.models import db
+    from app.loading import count_statements
+
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        with count_statements() as counter:
+            started = time.perf_counter()
+            result = function()
+            timings.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(timings), counter.count
+
+
+def run(app, orders: int, items_per_order: int, per_page: int, repeat: int):
+    from app.order_summaries import load_order_history
+
+    with app.app_context():
+        ensure_schema()
+        product_ids = seed_products(seed_farmers(10), per_farmer=10)
+        buyer_id = seed_buyers(1)[0]
+
+        started = time.perf_counter()
+        seed_orders(buyer_id, product_ids, orders, items_per_order)
+        print(f"seeded {orders} orders with {items_per_order} items each in {time.perf_counter() - started:.1f}s")
+
+        last_page = -(-orders // per_page)
+        print(f"{'page':>6} {'legacy ms':>10} {'stmts':>6} {'summary ms':>11} {'stmts':>6}")
+        for page in sorted({1, (last_page + 1) // 2, last_page}):
+            legacy, legacy_ms, legacy_statements = measure(lambda: legacy_page(buyer_id, page, per_page), repeat)
+            summary, summary_ms, summary_statements = measure(lambda: load_order_history(buyer_id, page, per_page), repeat)
+            if normalized(legacy['orders']) != normalized(summary['orders']):
+                raise SystemExit(f"page {page}: summaries differ from the order tables")
+            print(f"{page:>6} {legacy_ms:>10.2f} {legacy_statements:>6} {summary_ms:>11.2f} {summary_statements:>6}")
+
+        started = time.perf_counter()
+        cursor, pages = '', 0
+        while cursor is not None:
+            cursor = load_order_history(buyer_id, 1, per_page, cursor=cursor)['next_cursor']
+            pages += 1
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"cursor walk: {pages} pages in {elapsed:.0f} ms ({elapsed / pages:.2f} ms/page)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--items-per-order', type=int, default=4)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args()
+    run(load_app(arguments.database_uri), arguments.orders, arguments.items_per_order, arguments.per_page, arguments.repeat)
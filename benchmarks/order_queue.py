@@ -0,0 +1,63 @@
+"""
+throughput of asynchronous order placement
+
+queues orders through POST /api/v1/orders/async using the in-process queue
+and measures how fast the worker pool places them for several batch sizes,
+next to the synchronous POST /api/v1/orders/create path as a baseline.
+
+usage:
+    DATABASE_URI=postgresql://.../scratch REDIS_URL=redis://... python -m benchmarks.order_queue
+"""
+import argparse
+import time
+
+from benchmarks.fixtures import load_app, ensure_schema, seed_farmers, seed_buyers, seed_products, auth_header
+
+
+def run(app, orders: int, batch_sizes, workers: int):
+    from app.order_queue import InProcessOrderQueue, OrderWorkerPool, get_job, PENDING
+
+    with app.app_context():
+        ensure_schema()
+        product_ids = seed_products(seed_farmers(20), per_farmer=5, amount_available=10 ** 7)
+        headers = auth_header(seed_buyers(1)[0], 'buyer')
+
+    def cart(index):
+        return {"items": [{"product_id": product_ids[(index * 7 + offset) % len(product_ids)], "quantity": 1} for offset in range(3)]}
+
+    client = app.test_client()
+    print(f"{'mode':>12} {'orders':>7} {'seconds':>8} {'orders/s':>9}")
+
+    started = time.perf_counter()
+    for index in range(orders):
+        client.post('/api/v1/orders/create', json=cart(index), headers=headers)
+    elapsed = time.perf_counter() - started
+    print(f"{'sync':>12} {orders:>7} {elapsed:>8.2f} {orders / elapsed:>9.1f}")
+
+    previous = app.extensions['order_queue']
+    try:
+        for batch_size in batch_sizes:
+            pool = OrderWorkerPool(app, InProcessOrderQueue(), workers=workers, batch_size=batch_size, poll_timeout=0.1)
+            app.extensions['order_queue'] = pool
+
+            started = time.perf_counter()
+            handles = [client.post('/api/v1/orders/async', json=cart(index), headers=headers).get_json()['handle']
+                       for index in range(orders)]
+            with app.app_context():
+                while any((get_job(handle) or {}).get('status') == PENDING for handle in handles):
+                    time.sleep(0.05)
+            elapsed = time.perf_counter() - started
+            pool.stop()
+            print(f"{f'batch={batch_size}':>12} {orders:>7} {elapsed:>8.2f} {orders / elapsed:>9.1f}")
+    finally:
+        app.extensions['order_queue'] = previous
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--orders', type=int, default=300)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--workers', type=int, default=2)
+    arguments = parser.parse_args()
+    run(load_app(arguments.database_uri), arguments.orders, arguments.batch_sizes, arguments.workers)
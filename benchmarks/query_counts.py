@@ -0,0 +1,79 @@
+"""
+check the number of sql statements each read endpoint issues
+
+every endpoint declares a loading profile (see app/loading.py), so its
+statement count must not grow with the number of rows it returns. this seeds
+a catalog and some orders, calls each endpoint on a cold cache and fails if
+any endpoint exceeds its budget.
+
+usage:
+    DATABASE_URI=postgresql://.../scratch REDIS_URL=redis://... python -m benchmarks.query_counts
+"""
+import argparse
+import sys
+
+from benchmarks.fixtures import load_app, ensure_schema, seed_farmers, seed_buyers, seed_products, auth_header
+
+# (path, role, statement budget)
+BUDGETS = [
+    ('/api/v1/products?per_page=24', None, 2),
+    ('/api/v1/products?cursor=&per_page=24', None, 1),
+    ('/api/v1/products?search=produce', None, 2),
+    ('/api/v1/products/category/grains', None, 1),
+    ('/api/v1/products/{product_id}', None, 1),
+    ('/api/v1/orders?per_page=20', 'buyer', 2),
+    ('/api/v1/orders?cursor=&per_page=20', 'buyer', 1),
+    ('/api/v1/orders/{order_id}', 'buyer', 3),
+    ('/api/v1/farmer/orders', 'farmer', 1),
+    ('/api/v1/farmer/orders?status=pending&start_date=2020-01-01', 'farmer', 1),
+    ('/api/dashboard/stats', 'farmer', 1),
+    ('/api/dashboard/sales?interval=week&group=category', 'farmer', 1),
+    ('/api/dashboard/available-products', 'farmer', 1),
+    ('/api/dashboard/bundle', 'farmer', 3),
+]
+
+
+def run(app, orders: int = 20) -> bool:
+    from app.caching import invalidate_product_listings
+    from app.loading import count_statements
+    from app.models import Order
+
+    with app.app_context():
+        ensure_schema()
+        farmer_ids = seed_farmers(3)
+        product_ids = seed_products(farmer_ids, per_farmer=20)
+        buyer_id = seed_buyers(1)[0]
+        headers = {
+            'buyer': auth_header(buyer_id, 'buyer'),
+            'farmer': auth_header(farmer_ids[0], 'farmer')
+        }
+
+    client = app.test_client()
+    for index in range(orders):
+        items = [{"product_id": product_ids[(index + offset * 20) % len(product_ids)], "quantity": 1} for offset in range(3)]
+        client.post('/api/v1/orders/create', json={"items": items}, headers=headers['buyer'])
+
+    with app.app_context():
+        order_id = Order.query.filter_by(buyer_id=buyer_id).order_by(Order.id).first().id
+
+    passed = True
+    print(f"{'statements':>10} {'budget':>6}  endpoint")
+    for path, role, budget in BUDGETS:
+        url = path.format(product_id=product_ids[0], order_id=order_id)
+        with app.app_context():
+            invalidate_product_listings()
+            with count_statements() as counter:
+                response = client.get(url, headers=headers.get(role, {}))
+
+        ok = response.status_code == 200 and counter.count <= budget
+        passed = passed and ok
+        print(f"{counter.count:>10} {budget:>6}  {url} [{response.status_code}]{'' if ok else '  <-- FAIL'}")
+    return passed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--orders', type=int, default=20)
+    arguments = parser.parse_args()
+    sys.exit(0 if run(load_app(arguments.database_uri), arguments.orders) else 1)
@@ -0,0 +1,97 @@
+"""
+farmer sales chart latency
+
+seeds a farmer with delivered orders spread over the past year, fills the
+daily sales rollup with the same backfill as ``flask orders rebuild-stats``
+and times one-year charts for every interval and grouping: computed from the
+rollup (sql + numpy, bypassing the cache) and then served through
+GET /api/dashboard/sales with a warm cache.
+
+usage:
+    DATABASE_URI=postgresql://.../scratch REDIS_URL=redis://... python -m benchmarks.sales_series
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fixtures import load_app, ensure_schema, seed_farmers, seed_buyers, seed_products, auth_header
+from benchmarks.order_history import seed_orders
+
+
+def spread_over_year(buyer_id: int):
+    """
+    move the buyer's orders (and their farmer orders and items) to one of the
+    past 365 days and mark them delivered
+    """
+    from sqlalchemy import text
+    from app.models import db
+
+    age = "make_interval(days => (orders.id % 365))"
+    db.session.execute(text(f"UPDATE orders SET created_at = now() - {age} WHERE buyer_id = :buyer"), {"buyer": buyer_id})
+    db.session.execute(text(
+        "UPDATE farmer_orders SET created_at = orders.created_at, status = 'delivered' "
+        "FROM orders WHERE orders.id = farmer_orders.order_id AND orders.buyer_id = :buyer"), {"buyer": buyer_id})
+    db.session.execute(text(
+        "UPDATE order_items SET created_at = orders.created_at "
+        "FROM orders WHERE orders.id = order_items.order_id AND orders.buyer_id = :buyer"), {"buyer": buyer_id})
+    db.session.commit()
+
+
+def timed(function, rounds: int):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def run(app, orders: int, products: int, rounds: int):
+    from app.farmer_stats import rebuild_farmer_stats
+    from app.sales_series import sales_series
+
+    with app.app_context():
+        ensure_schema()
+        farmer_id = seed_farmers(1)[0]
+        product_ids = seed_products([farmer_id], per_farmer=products)
+        buyer_id = seed_buyers(1)[0]
+        started = time.perf_counter()
+        seed_orders(buyer_id, product_ids, orders, items_per_order=3)
+        spread_over_year(buyer_id)
+        print(f"seeded {orders} orders over a year in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        rebuild_farmer_stats()
+        print(f"rebuilt the rollup in {(time.perf_counter() - started) * 1000:.0f} ms")
+        headers = auth_header(farmer_id, 'farmer')
+
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=364)
+    client = app.test_client()
+
+    print(f"{'interval':>8} {'group':>8} {'buckets':>7} {'series':>6} {'compute ms':>10} {'cached ms':>9}")
+    for interval in ('day', 'week', 'month'):
+        for group in ('product', 'category'):
+            with app.app_context():
+                result = sales_series(farmer_id, interval, group, start, end, 7, cached=False)
+                compute_ms, _ = timed(lambda: sales_series(farmer_id, interval, group, start, end, 7, cached=False), rounds)
+
+            url = f"/api/dashboard/sales?interval={interval}&group={group}&start_date={start}&end_date={end}&window=7"
+            response = client.get(url, headers=headers)
+            if response.status_code != 200 or response.get_json() != result:
+                raise SystemExit(f"unexpected response for {url}: {response.status_code}")
+            cached_ms, _ = timed(lambda: client.get(url, headers=headers), rounds)
+
+            print(f"{interval:>8} {group:>8} {len(result['buckets']):>7} {len(result['series']):>6} "
+                  f"{compute_ms:>10.1f} {cached_ms:>9.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--products', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=20)
+    arguments = parser.parse_args()
+    run(load_app(arguments.database_uri), arguments.orders, arguments.products, arguments.rounds)
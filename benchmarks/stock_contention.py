@@ -0,0 +1,83 @@
+"""
+concurrent checkouts against a single produce lot
+
+many threads place orders for the same product at once until its stock runs
+out, then the script reports checkout throughput and verifies nothing was
+oversold: the units sold must equal the starting stock, the remaining stock
+must be zero and the product must be marked out_of_stock.
+
+usage:
+    DATABASE_URI=postgresql://.../scratch REDIS_URL=redis://... python -m benchmarks.stock_contention
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+
+from benchmarks.fixtures import load_app, ensure_schema, seed_farmers, seed_buyers, seed_products, auth_header
+
+
+def run(app, threads: int, stock: int, quantity: int) -> bool:
+    from app.models import db, Product, OrderItem
+
+    with app.app_context():
+        ensure_schema()
+        product_id = seed_products(seed_farmers(1), per_farmer=1, amount_available=stock)[0]
+        buyer_ids = seed_buyers(threads)
+        headers = [auth_header(buyer_id, 'buyer') for buyer_id in buyer_ids]
+
+    statuses = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def buyer(index: int):
+        client = app.test_client()
+        start.wait()
+        while True:
+            response = client.post(
+                '/api/v1/orders/create',
+                json={"items": [{"product_id": product_id, "quantity": quantity}]},
+                headers=headers[index]
+            )
+            with lock:
+                statuses[response.status_code] += 1
+            if response.status_code != 201:
+                return
+
+    workers = [threading.Thread(target=buyer, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        product = db.session.get(Product, product_id)
+        sold = db.session.query(db.func.coalesce(db.func.sum(OrderItem.quantity), 0))\
+            .filter(OrderItem.product_id == product_id).scalar()
+        remaining, status = product.amount_available, product.status
+
+    placed = statuses[201]
+    expected_orders = stock // quantity
+    print(f"threads={threads} stock={stock} quantity={quantity}")
+    print(f"responses: {dict(statuses)}")
+    print(f"placed {placed} orders in {elapsed:.2f}s ({placed / elapsed:.1f} orders/s)")
+    print(f"sold={sold} remaining={remaining} status={status}")
+
+    ok = placed == expected_orders and sold + remaining == stock and remaining == stock % quantity and remaining >= 0
+    if remaining == 0:
+        ok = ok and status == 'out_of_stock'
+    print('OK, no oversell' if ok else 'FAIL: stock accounting does not add up')
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--quantity', type=int, default=1)
+    arguments = parser.parse_args()
+    sys.exit(0 if run(load_app(arguments.database_uri), arguments.threads, arguments.stock, arguments.quantity) else 1)
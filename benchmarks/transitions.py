@@ -0,0 +1,68 @@
+"""
+bulk farmer order transitions
+
+seeds orders split between two farmers, then moves batches of one farmer's
+orders to delivered through POST /api/v1/farmer/orders/status and reports
+latency and sql statements per batch. parent orders only become delivered
+once the other farmer's share is delivered too, which the script checks.
+
+usage:
+    DATABASE_URI=postgresql://.../scratch REDIS_URL=redis://... python -m benchmarks.transitions
+"""
+import argparse
+import time
+
+from benchmarks.fixtures import load_app, ensure_schema, seed_farmers, seed_buyers, seed_products, auth_header
+from benchmarks.order_history import seed_orders
+
+
+def run(app, orders: int, batch_sizes):
+    from app.models import db, FarmerOrder, Order
+    from app.loading import count_statements
+
+    with app.app_context():
+        ensure_schema()
+        farmer_ids = seed_farmers(2)
+        product_ids = seed_products(farmer_ids, per_farmer=1)
+        buyer_id = seed_buyers(1)[0]
+        # two items per order, one from each farmer
+        seed_orders(buyer_id, product_ids, orders, items_per_order=2)
+        order_ids = [order_id for order_id, in db.session.query(Order.id).filter(Order.buyer_id == buyer_id)]
+        shares = {
+            farmer_id: [farmer_order_id for farmer_order_id, in db.session.query(FarmerOrder.id)
+                        .filter(FarmerOrder.farmer_id == farmer_id, FarmerOrder.order_id.in_(order_ids))
+                        .order_by(FarmerOrder.id)]
+            for farmer_id in farmer_ids
+        }
+        headers = {farmer_id: auth_header(farmer_id, 'farmer') for farmer_id in farmer_ids}
+
+    client = app.test_client()
+    print(f"{'farmer':>6} {'batch':>6} {'ms':>8} {'statements':>10}")
+    for farmer_id in farmer_ids:
+        remaining = list(shares[farmer_id])
+        for batch_size in batch_sizes:
+            batch, remaining = remaining[:batch_size], remaining[batch_size:]
+            if not batch:
+                break
+            with app.app_context(), count_statements() as counter:
+                started = time.perf_counter()
+                response = client.post('/api/v1/farmer/orders/status', json={"farmer_order_ids": batch, "status": "delivered"}, headers=headers[farmer_id])
+                elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code != 200 or len(response.get_json()['updated']) != len(batch):
+                raise SystemExit(f"transition failed: {response.status_code} {response.get_data(as_text=True)[:200]}")
+            print(f"{farmer_id:>6} {len(batch):>6} {elapsed:>8.1f} {counter.count:>10}")
+        if remaining:
+            client.post('/api/v1/farmer/orders/status', json={"farmer_order_ids": remaining, "status": "delivered"}, headers=headers[farmer_id])
+
+        with app.app_context():
+            delivered = Order.query.filter(Order.id.in_(order_ids), Order.status == 'delivered').count()
+        print(f"orders delivered after farmer {farmer_id}: {delivered}/{len(order_ids)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 500])
+    arguments = parser.parse_args()
+    run(load_app(arguments.database_uri), arguments.orders, arguments.batch_sizes)
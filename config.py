@@ -24,4 +24,25 @@ class Config:
     JWT_COOKIE_CSRF_PROTECT = True
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=30)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=7)
-    
\ No newline at end of file
+    SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'postgres')
+    CACHE_L1_MAXSIZE = int(os.getenv('CACHE_L1_MAXSIZE', 1024))
+    CACHE_L1_TTL = float(os.getenv('CACHE_L1_TTL', 5))
+    ORDER_QUEUE_BACKEND = os.getenv('ORDER_QUEUE_BACKEND', 'inprocess')
+    ORDER_QUEUE_WORKERS = int(os.getenv('ORDER_QUEUE_WORKERS', 2))
+    ORDER_QUEUE_BATCH_SIZE = int(os.getenv('ORDER_QUEUE_BATCH_SIZE', 20))
+    COURIER_API_KEYS = [key.strip() for key in os.getenv('COURIER_API_KEYS', '').split(',') if key.strip()]
+    ADMIN_API_KEYS = [key.strip() for key in os.getenv('ADMIN_API_KEYS', '').split(',') if key.strip()]
+    TRACKING_MAX_BATCH = int(os.getenv('TRACKING_MAX_BATCH', 1000))
+    REDIS_URL = os.getenv('REDIS_URL')
+    SSE_KEEPALIVE = float(os.getenv('SSE_KEEPALIVE', 15))
+    SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 100))
+    DASHBOARD_WORKERS = int(os.getenv('DASHBOARD_WORKERS', 4))
+    DASHBOARD_SECTION_TIMEOUT = float(os.getenv('DASHBOARD_SECTION_TIMEOUT', 5))
+    DASHBOARD_STATS_TTL = int(os.getenv('DASHBOARD_STATS_TTL', 15))
+    DASHBOARD_RECENT_ORDERS_TTL = int(os.getenv('DASHBOARD_RECENT_ORDERS_TTL', 0))
+    DASHBOARD_PRODUCTS_TTL = int(os.getenv('DASHBOARD_PRODUCTS_TTL', 60))
+    ANALYTICS_QUERY_TIMEOUT_MS = int(os.getenv('ANALYTICS_QUERY_TIMEOUT_MS', 5000))
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 8))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))